@@ -1,26 +1,54 @@
 # app_state.py
 # se usa threading para el bloquear la escritura del panel donde se muestran los datos seriales
+import os
 import threading
 from collections import deque
 
+from shared.telemetry import TelemetryRing, SampleClock
+from shared.log_store import LogStore
+from shared.playlist import Playlist
+from shared.trajectory_cache import TrajectoryCache
+from shared.calibration import load_profile
+
 #ser es el objeto serial que dejamos aqui para llamarlo en varias partes del codigo 
 ser = None
+link = None  # AsyncSerialLink cuando se conecta con backend asyncio
+writer = None  # CommandWriter, cola de escritura con coalescing de setpoints
+recorder = None  # SessionRecorder mientras se graba la sesion
+replay = None  # SessionReplay en curso
+replay_thread = None  # hilo que la reproduce
+reader_thread = None  # hilo de read_serial_thread, arrancado en main()
 app_running = True
 data_lock = threading.Lock()
 
 wave_running = False
 sismo_running = False
+plan_encoding = "absolute"  # absolute, delta o varint, ver shared/playback_plan.py
+commanded_position = 0  # pasos que el firmware tiene como objetivo segun lo enviado
+realtime_mode = False  # cores dedicados, prioridad y GC congelado durante la reproduccion
+playback_controller = None  # PlaybackController de la reproducción en curso (pausa/seek)
+tracking = None  # TrackingAnalyzer de la reproducción en curso o la última
+tracking_trace_id = None  # traza que reprodujo esa reproducción
+response_spectra = {}  # etiqueta -> ResponseSpectrum de la última comparación
+# trayectorias ya preparadas, en memoria y en disco (carpeta comun a app y app2)
+TRAJECTORY_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trajectory_cache")
+trajectory_cache = TrajectoryCache(TRAJECTORY_CACHE_FOLDER)
+playlist = Playlist(TRAJECTORY_CACHE_FOLDER)  # registros en cola, se preparan en un proceso aparte
+calibration = load_profile()  # envolvente velocidad/aceleración medida por calibrador_pasivo.py, None si no hay
+playlist_index = None  # elemento de la playlist que suena ahora
+playback_jitter = {}  # ultimo resumen de latencia por modo (normal/realtime)
 
-x_data = deque(maxlen=500)
-y_data = deque(maxlen=500)
+# historial del encoder (tiempo, grados absolutos); lo escribe solo read_serial_thread, se lee sin lock
+telemetry = TelemetryRing()
+sample_clock = SampleClock()  # tiempos reconstruidos a 1 ms, huecos y jitter del encoder
 expected_wave_data = deque(maxlen=500)
 expected_wave_time = deque(maxlen=500)
-plot_start_time = 0
+plot_start_time = 0  # time.perf_counter()
 max_points = 500
 
-log_recv = deque(maxlen=100)
-log_sent = deque(maxlen=100)
-log_dirty = False
+# registros crudos (tiempo, direccion, datos); el texto se arma solo al dibujar la consola
+log_recv = LogStore(maxlen=100)
+log_sent = LogStore(maxlen=100)
 
 viewer_seismic_files = {}
 viewer_all_traces = []              
@@ -1,14 +1,28 @@
 import dearpygui.dearpygui as dpg
 import threading
 import time
+import os
+import sys
+
+# la raiz del repo tiene el paquete shared/ con el codigo comun a app y app2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import the shared state
 import app_state
 from serial_handler import (find_serial_ports, connect_serial, disconnect_serial, 
-                            send_command, wave_generator_thread, read_serial_thread)
+                            send_command, wave_generator_thread, read_serial_thread, start_replay)
 import seismic_handler as sh
+from shared.session_recorder import session_file_name, FILE_EXTENSION
+from shared.playback_plan import ENCODINGS
+from shared.upsampler import COMMAND_RATES, METHODS, BANDLIMITED
+from shared.trace_pipeline import INTEGRATORS, TIME_DOMAIN
+from shared.response_spectrum import DAMPINGS, QUANTITIES
+
+SESSIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+REPLAY_SPEEDS = {"1x": 1.0, "4x": 4.0, "max": 0.0}
 
 prefab = True
+rendered_log_versions = {}
 
 def update_ui_for_connection_state(connected: bool):
     """Enables or disables UI elements based on the connection state."""
@@ -38,13 +52,16 @@ def checkbox_callback(sender, app_data, user_data):
 def connect_callback():
     port = dpg.get_value("ports_combo")
     baud = dpg.get_value("baud_rate_combo")
+    backend = dpg.get_value("backend_combo")
+    record_path = session_file_name(SESSIONS_FOLDER) if dpg.get_value("record_checkbox") else None
     if port and baud:
-        success, message = connect_serial(port, baud)
+        success, message = connect_serial(port, baud, backend, record_path)
         if success:
             update_ui_for_connection_state(True)
             with app_state.data_lock:
-                app_state.x_data.clear(); app_state.y_data.clear(); app_state.expected_wave_data.clear()
-            app_state.plot_start_time = time.time()
+                app_state.expected_wave_data.clear()
+            app_state.telemetry.clear()
+            app_state.plot_start_time = time.perf_counter()
         else:
             dpg.set_value("connection_status", f"Error: {message}")
 
@@ -63,12 +80,80 @@ def send_manual_command_callback():
         if dpg.does_item_exist("command_input"):
             dpg.set_value("command_input", "")
 
+def replay_callback(sender, app_data, user_data):
+    if 'file_path_name' in app_data:
+        start_replay(app_data['file_path_name'], REPLAY_SPEEDS[dpg.get_value("replay_speed_combo")])
+        update_ui_for_connection_state(False)  # start_replay() disconnects a live port
+
+def log_rx_callback(sender, app_data, user_data):
+    app_state.log_recv.enabled = bool(app_data)
+
+def encoding_callback(sender, app_data, user_data):
+    app_state.plan_encoding = app_data
+
+def integrator_callback(sender, app_data, user_data):
+    # se guarda en la traza: cada registro puede integrarse distinto
+    user_data['integrator'] = app_data
+
+def realtime_callback(sender, app_data, user_data):
+    app_state.realtime_mode = bool(app_data)
+
+def _refresh_playlist():
+    if dpg.does_item_exist("playlist_listbox"):
+        dpg.configure_item("playlist_listbox", items=app_state.playlist.labels())
+
+def playlist_add_callback():
+    sh.add_selected_to_playlist(amplitude=dpg.get_value("playlist_amplitude_input"),
+                                rest=dpg.get_value("playlist_rest_input"))
+    _refresh_playlist()
+
+def playlist_remove_callback():
+    labels = app_state.playlist.labels()
+    selected = dpg.get_value("playlist_listbox")
+    if selected in labels:
+        app_state.playlist.remove(labels.index(selected))
+    _refresh_playlist()
+
+def playlist_clear_callback():
+    app_state.playlist.clear()
+    _refresh_playlist()
+
+def response_spectrum_callback(sender, app_data, user_data):
+    app_state.response_spectra = sh.response_spectra(user_data)
+    if not dpg.does_item_exist("spectrum_window"):
+        with dpg.window(label="Response Spectrum", tag="spectrum_window", width=700, height=450):
+            with dpg.group(horizontal=True):
+                dpg.add_combo(list(QUANTITIES), tag="spectrum_quantity_combo", default_value="PSA", width=80,
+                              callback=_draw_response_spectra)
+                dpg.add_combo([f"{damping:.0%}" for damping in DAMPINGS], tag="spectrum_damping_combo",
+                              default_value="5%", width=80, callback=_draw_response_spectra)
+            dpg.add_child_window(tag="spectrum_plot_container", border=False)
+    dpg.configure_item("spectrum_window", label=f"Response Spectrum - {user_data['id']}", show=True)
+    _draw_response_spectra()
+
+def _draw_response_spectra():
+    container = "spectrum_plot_container"
+    if not dpg.does_item_exist(container): return
+    dpg.delete_item(container, children_only=True)
+    quantity = dpg.get_value("spectrum_quantity_combo")
+    damping = float(dpg.get_value("spectrum_damping_combo").rstrip("%")) / 100
+    with dpg.plot(height=-1, width=-1, parent=container):
+        dpg.add_plot_legend()
+        x_axis = dpg.add_plot_axis(dpg.mvXAxis, label="Period (s)", scale=dpg.mvPlotScale_Log10)
+        with dpg.plot_axis(dpg.mvYAxis, label=f"{quantity} ({QUANTITIES[quantity]})") as y_axis:
+            for label, spectrum in app_state.response_spectra.items():
+                row = min(range(len(spectrum.dampings)), key=lambda i: abs(spectrum.dampings[i] - damping))
+                dpg.add_line_series(spectrum.periods.tolist(), spectrum.quantity(quantity)[row].tolist(), label=label)
+        dpg.fit_axis_data(x_axis)
+        dpg.fit_axis_data(y_axis)
+
 def start_wave_callback():
     if not app_state.wave_running:
         app_state.wave_running = True
         with app_state.data_lock:
-            app_state.x_data.clear(); app_state.y_data.clear(); app_state.expected_wave_data.clear()
-        app_state.plot_start_time = time.time()
+            app_state.expected_wave_data.clear()
+        app_state.telemetry.clear()
+        app_state.plot_start_time = time.perf_counter()
         if dpg.does_item_exist("speed_input"): send_command(f"s{dpg.get_value('speed_input')}")
         if dpg.does_item_exist("accel_input"): send_command(f"a{dpg.get_value('accel_input')}")
         threading.Thread(target=wave_generator_thread, daemon=True).start()
@@ -117,7 +202,7 @@ def _update_viewer_detailed_plot():
             f"Max Amplitude: {trace_data['max_amp']:.3e}")
     dpg.add_text(info, parent=parent_container)
     dpg.add_separator(parent=parent_container)
-    with dpg.plot(label="Detailed View", height=-50, width=-1, parent=parent_container):
+    with dpg.plot(label="Detailed View", height=-170, width=-1, parent=parent_container):
         x_axis = dpg.add_plot_axis(dpg.mvXAxis, label="Time (s)")
         with dpg.plot_axis(dpg.mvYAxis, label="Amplitude") as y_axis:
             dpg.add_line_series(trace_data['times'].tolist(), trace_data['data'].tolist(), label=trace_data['id'])
@@ -125,8 +210,25 @@ def _update_viewer_detailed_plot():
         dpg.fit_axis_data(y_axis)
     with dpg.group(horizontal=True, parent=parent_container):
         dpg.add_button(label="Process for Shaking Table", callback=sh.process_selected_trace, width=-1, height=30)
+        dpg.add_combo(list(ENCODINGS), default_value=app_state.plan_encoding, width=90, callback=encoding_callback)
+        dpg.add_combo(list(INTEGRATORS), default_value=trace_data.get('integrator', TIME_DOMAIN), width=90,
+                      callback=integrator_callback, user_data=trace_data)
+        dpg.add_checkbox(label="Real-time", default_value=app_state.realtime_mode, callback=realtime_callback)
         dpg.add_button(label="▶ Play on Table", callback=lambda: sh.start_seismic_playback(amplitude=1600), width=-1, height=30)
         dpg.add_button(label="⏹ Stop Playback", callback=sh.stop_seismic_playback, width=-1, height=30)
+    with dpg.group(horizontal=True, parent=parent_container):
+        dpg.add_button(label="⏯ Pause / Resume", callback=sh.pause_seismic_playback, width=150)
+        dpg.add_input_float(label="s", tag="seek_input", default_value=0.0, step=1.0, width=120)
+        dpg.add_button(label="Seek", callback=lambda: sh.seek_seismic_playback(dpg.get_value("seek_input")), width=80)
+        dpg.add_button(label="Response Spectrum", callback=response_spectrum_callback, user_data=trace_data, width=-1)
+    with dpg.group(horizontal=True, parent=parent_container):
+        dpg.add_input_int(label="Amplitude", tag="playlist_amplitude_input", default_value=1600, step=100, width=120)
+        dpg.add_input_float(label="Rest (s)", tag="playlist_rest_input", default_value=0.0, step=1.0, width=120)
+        dpg.add_button(label="+ Playlist", callback=playlist_add_callback, width=100)
+        dpg.add_button(label="Remove", callback=playlist_remove_callback, width=80)
+        dpg.add_button(label="Clear", callback=playlist_clear_callback, width=80)
+        dpg.add_button(label="▶ Play Playlist", callback=sh.start_playlist, width=-1)
+    dpg.add_listbox(app_state.playlist.labels(), tag="playlist_listbox", num_items=4, width=-1, parent=parent_container)
 
 def update_gui_callbacks():
     if app_state.viewer_data_dirty.is_set():
@@ -134,23 +236,45 @@ def update_gui_callbacks():
         _update_viewer_detailed_plot()
         app_state.viewer_data_dirty.clear()
     
+    if app_state.ser and dpg.does_item_exist("rx_stats_text"):
+        stats = app_state.sample_clock.summary()
+        if app_state.writer:
+            stats += f" | {app_state.writer.summary()}"
+        dpg.set_value("rx_stats_text", stats)
+
+    if app_state.tracking and dpg.does_item_exist("tracking_text"):
+        app_state.tracking.poll(app_state.telemetry)
+        dpg.set_value("tracking_text", app_state.tracking.summary())
+
+    playing = app_state.playlist_index
+    if playing is not None and dpg.does_item_exist("playlist_listbox"):
+        labels = app_state.playlist.labels()
+        if playing < len(labels) and dpg.get_value("playlist_listbox") != labels[playing]:
+            dpg.set_value("playlist_listbox", labels[playing])
+
+    real_x, real_y, _ = app_state.telemetry.latest(app_state.max_points)
+    if len(real_x) and dpg.does_item_exist("series_real_comp"):
+        dpg.set_value("series_real_comp", [real_x.tolist(), real_y.tolist()])
+
     with app_state.data_lock:
-        if app_state.x_data and app_state.y_data and dpg.does_item_exist("series_real_comp"):
-            dpg.set_value("series_real_comp", [list(app_state.x_data), list(app_state.y_data)])
         if app_state.expected_wave_data and dpg.does_item_exist("series_expected_comp"):
             expected_x, expected_y = zip(*app_state.expected_wave_data)
             dpg.set_value("series_expected_comp", [list(expected_x), list(expected_y)])
         
-        if (app_state.y_data or app_state.expected_wave_data) and dpg.does_item_exist("x_axis_comp"):
+        if (len(real_y) or app_state.expected_wave_data) and dpg.does_item_exist("x_axis_comp"):
             dpg.fit_axis_data("x_axis_comp")
             dpg.fit_axis_data("y_axis_comp")
-        
-        if app_state.log_dirty:
-            if dpg.does_item_exist("console_recv_output"): dpg.set_value("console_recv_output", "\n".join(app_state.log_recv))
-            if dpg.does_item_exist("console_send_output"): dpg.set_value("console_send_output", "\n".join(app_state.log_sent))
-            if dpg.does_item_exist("console_recv_container"): dpg.set_y_scroll("console_recv_container", -1.0)
-            if dpg.does_item_exist("console_send_container"): dpg.set_y_scroll("console_send_container", -1.0)
-            app_state.log_dirty = False
+
+    # Consoles are only formatted when their log changed and the "manual" tab is visible
+    for output, container, log in (("console_recv_output", "console_recv_container", app_state.log_recv),
+                                   ("console_send_output", "console_send_container", app_state.log_sent)):
+        if rendered_log_versions.get(output) == log.version or not dpg.does_item_exist(output):
+            continue
+        if not dpg.is_item_visible(container):
+            continue
+        dpg.set_value(output, log.render())
+        dpg.set_y_scroll(container, -1.0)
+        rendered_log_versions[output] = log.version
 
 def update_plot_sizes():##the function that updates the plot sizes when the window is resized
     if dpg.does_item_exist("main_window"):
@@ -185,9 +309,12 @@ def create_gui():
             dpg.add_button(label="Refresh", callback=refresh_ports_callback)
             dpg.add_text("Baud Rate")
             dpg.add_combo(["9600", "57600", "115200","230400","250000","921600"], tag="baud_rate_combo", default_value="115200", width=100)
+            dpg.add_combo(["thread", "asyncio"], tag="backend_combo", default_value="thread", width=80)
             dpg.add_button(label="Connect", tag="connect_button", callback=connect_callback, width=100)
             dpg.add_button(label="Disconnect", tag="disconnect_button", callback=disconnect_callback, width=100, show=False)
             dpg.add_checkbox(label="ondas basicas", tag="checkbox_onda", callback=checkbox_callback)
+            dpg.add_text("", tag="rx_stats_text")
+            dpg.add_text("", tag="tracking_text")
         with dpg.tab_bar():
             with dpg.tab(label="Seismic Trace Viewer"):
                 with dpg.group(tag="t1", show=True):
@@ -222,6 +349,13 @@ def create_gui():
                     with dpg.group(width=400):
                         dpg.add_input_text(tag="command_input", hint="Command (e.g., m0)", on_enter=True, callback=send_manual_command_callback)
                         dpg.add_button(label="Send Command", tag="send_command_button", callback=send_manual_command_callback)
+                        dpg.add_checkbox(label="Log RX stream", tag="log_rx_checkbox", default_value=True, callback=log_rx_callback)
+                        with dpg.group(horizontal=True):
+                            dpg.add_checkbox(label="Record session", tag="record_checkbox")
+                            dpg.add_button(label="Replay", callback=lambda: dpg.configure_item("replay_dialog_id", show=True))
+                            dpg.add_combo(list(REPLAY_SPEEDS), tag="replay_speed_combo", default_value="1x", width=60)
+                        with dpg.file_dialog(directory_selector=False, show=False, callback=replay_callback, tag="replay_dialog_id", width=700, height=400):
+                            dpg.add_file_extension(FILE_EXTENSION)
                         with dpg.child_window(tag="console_send_container", height=-1, border=True):
                             dpg.add_input_text(tag="console_send_output", multiline=True, readonly=True, width=-1, height=-1)
                     with dpg.child_window(tag="console_recv_container", height=-1,width=-1, border=True):
@@ -229,7 +363,14 @@ def create_gui():
             with dpg.tab(label="opciones"):
                 dpg.add_input_int(label="Speed (s)", tag="speed_input", default_value=50000)
                 dpg.add_input_int(label="Acceleration (a)", tag="accel_input", default_value=20000)
-                dpg.add_input_int(label="Commads per second", tag="commandsPerSecond_input", default_value=20000)
+                dpg.add_combo(["native"] + [str(rate) for rate in COMMAND_RATES], label="Command rate (Hz)", tag="command_rate_combo", default_value="native", width=100)
+                dpg.add_combo(list(METHODS), label="Interpolation", tag="interpolation_combo", default_value=BANDLIMITED, width=100)
+                dpg.add_checkbox(label="Feed-forward s/a (Speed/Acceleration as upper limits)", tag="feedforward_checkbox")
+                dpg.add_checkbox(label="Streaming (prepare long records in blocks while playing, no pause/seek)", tag="streaming_checkbox")
+                dpg.add_checkbox(label="Fit amplitude to the calibrated speed/acceleration envelope" if app_state.calibration
+                                 else "Fit amplitude to calibration (run calibrador_pasivo.py first)",
+                                 tag="shaping_checkbox", default_value=app_state.calibration is not None,
+                                 enabled=app_state.calibration is not None)
 
     with dpg.item_handler_registry(tag="window_resize_handler"):
         dpg.add_item_resize_handler(callback=update_plot_sizes)
@@ -241,11 +382,13 @@ def create_gui():
 
 def cleanup():
     disconnect_serial()
+    app_state.playlist.shutdown()
     app_state.app_running = False
 
 def main():
     create_gui()
-    threading.Thread(target=read_serial_thread, daemon=True).start()
+    app_state.reader_thread = threading.Thread(target=read_serial_thread, daemon=True)
+    app_state.reader_thread.start()
     dpg.show_viewport()
 
     while dpg.is_dearpygui_running():
@@ -11,7 +11,20 @@ import time
 import dearpygui.dearpygui as dpg
 
 import app_state
-from serial_handler import send_command
+from serial_handler import send_command, write_raw, io_threads
+from shared.playback_plan import CompiledPlan, home_command
+from shared.link_budget import check_plan, LinkBudgetError
+from shared.playback_controller import PlaybackController
+from shared.playback_scheduler import PlaybackScheduler, PlaybackStats
+from shared.realtime import RealtimeMode
+from shared.upsampler import BANDLIMITED
+from shared.trace_pipeline import prepare, TIME_DOMAIN
+from shared.playlist import NATIVE, PlaylistItem
+from shared.motion_limits import plan_limits
+from shared.calibration import shape
+from shared.tracking import TrackingAnalyzer
+from shared.response_spectrum import position_spectrum, resample_motion
+from shared.streaming import StreamingPreparer, bounded, iter_mseed_chunks, stream_steps
 
 def get_records_folder_path():
     """Gets the absolute path to the sismic_records folder."""
@@ -48,7 +61,7 @@ def load_traces_from_folder_thread():
                         'starttime': str(trace.stats.starttime), 'endtime': str(trace.stats.endtime),
                         'max_amp': np.max(np.abs(trace.data)) if trace.data.size > 0 else 0,
                         'min_amp': np.min(trace.data) if trace.data.size > 0 else 0,
-                        'file_name': file_name, 'file_path': file_path,
+                        'file_name': file_name, 'file_path': file_path, 'file_position': len(file_traces),
                         'global_index': len(app_state.viewer_all_traces),
                         'obspy_trace': trace
                     }
@@ -97,56 +110,6 @@ def process_selected_trace():
     
     print("Viewer: Acceleration data ready.")
 
-def _prepare_trace_for_playback(trace, amplitude=1600):
-    """
-    Prepara la traza sísmica para reproducción en la mesa.
-    Convierte aceleración/velocidad a desplazamiento mediante integración doble.
-    
-    Args:
-        trace: Traza de ObsPy (puede ser aceleración, velocidad o desplazamiento)
-        amplitude: Amplitud máxima en pasos del motor (default: 1600)
-    
-    Returns:
-        tuple: (datos_escalados, intervalo_muestreo)
-    """
-    working_trace = trace.copy()
-    
-    # Paso 1: Detrend y taper para reducir artefactos
-    working_trace.detrend('linear')
-    working_trace.taper(max_percentage=0.05, type='hann')
-    
-    # Paso 2: Filtrado bandpass para eliminar ruido
-    fmin, fmax = 0.1, 20
-    working_trace.filter('bandpass', freqmin=fmin, freqmax=fmax, corners=4, zerophase=True)
-    
-    # Paso 3: Integración doble (aceleración → velocidad → desplazamiento)
-    # Si la traza ya es desplazamiento, esto no causará problemas
-    working_trace.integrate(method='cumtrapz')
-    working_trace.integrate(method='cumtrapz')
-    
-    # Convertir a array numpy
-    data = working_trace.data.astype(np.float64)
-    
-    if data.size == 0:
-        raise ValueError("La traza no contiene muestras.")
-    
-    # Normalizar y escalar
-    max_abs = np.max(np.abs(data))
-    if not np.isfinite(max_abs) or max_abs == 0:
-        raise ValueError("La amplitud de la traza es cero o inválida.")
-    
-    # Escalar a la amplitud deseada (en pasos del motor)
-    amplitude = max(int(abs(amplitude)), 1)
-    scaled = np.clip((data / max_abs) * amplitude, -amplitude, amplitude).astype(int)
-    
-    # Obtener intervalo de muestreo
-    sample_interval = getattr(working_trace.stats, 'delta', None)
-    if sample_interval is None or not np.isfinite(sample_interval) or sample_interval <= 0:
-        sample_interval = 0.01  # Default: 100 Hz
-    
-    print(f"Viewer: Traza preparada - {len(scaled)} muestras, intervalo: {sample_interval:.4f}s, amplitud: ±{amplitude} pasos")
-    return scaled, float(sample_interval)
-
 def start_seismic_playback(amplitude=1600):
     """
     Inicia la reproducción de la traza sísmica seleccionada en el controlador.
@@ -203,33 +166,202 @@ def _playback_worker_thread(trace, trace_info, amplitude):
         trace_info: Información de la traza (metadata)
         amplitude: Amplitud máxima en pasos
     """
+    # Frecuencia de comandos e interpolación elegidas en "opciones"
+    command_rate = dpg.get_value("command_rate_combo") if dpg.does_item_exist("command_rate_combo") else NATIVE
+    method = dpg.get_value("interpolation_combo") if dpg.does_item_exist("interpolation_combo") else BANDLIMITED
+    if dpg.does_item_exist("streaming_checkbox") and dpg.get_value("streaming_checkbox"):
+        _stream_playback(trace_info, amplitude, command_rate)
+        return
     try:
-        # Preparar la traza para reproducción
-        scaled_data, sample_interval = _prepare_trace_for_playback(trace, amplitude)
+        # Preparar la traza para reproducción; si ya se preparó antes (también en otra sesión) sale de la cache
+        start = time.perf_counter()
+        scaled_data, sample_interval = prepare(trace, amplitude, command_rate, method,
+                                               cache=app_state.trajectory_cache, file_path=trace_info['file_path'],
+                                               integrator=trace_info.get('integrator', TIME_DOMAIN))
     except Exception as exc:
         print(f"Error al preparar la traza: {exc}")
         with app_state.data_lock:
             app_state.sismo_running = False
         send_command("m0")
         return
+    print(f"Trayectoria lista en {(time.perf_counter() - start) * 1e3:.0f} ms "
+          f"({len(scaled_data)} muestras a {1.0 / sample_interval:g} Hz) | {app_state.trajectory_cache.summary()}")
+    
+    _play_prepared(scaled_data, sample_interval, trace_id=trace_info['id'])
+
+def _stream_playback(trace_info, amplitude, command_rate):
+    """
+    Reproducción en streaming para registros largos: el archivo se lee y se
+    prepara por bloques (shared/streaming.py) mientras suena, el primer comando
+    sale en cuanto está listo el primer bloque y la memoria no crece con la
+    duración. No hay plan completo, así que no hay pausa/seek ni s/a por ventana.
+    """
+    rate = None if command_rate == NATIVE else float(command_rate)
+    preparer = StreamingPreparer(trace_info['sampling_rate'], amplitude, rate)
+    sample_interval = preparer.sample_interval
+    request_time = time.perf_counter()
+    blocks = bounded(stream_steps(iter_mseed_chunks(trace_info['file_path'], trace_info['id']), preparer))
+    
+    # Limpiar datos de visualización
+    app_state.telemetry.clear()
+    with app_state.data_lock:
+        app_state.expected_wave_data.clear()
+        app_state.plot_start_time = time.perf_counter()
+    
+    # Enviar configuración del motor
+    if dpg.does_item_exist("speed_input"):
+        send_command(f"s{dpg.get_value('speed_input')}")
+    if dpg.does_item_exist("accel_input"):
+        send_command(f"a{dpg.get_value('accel_input')}")
+    
+    app_state.commanded_position = 0
+    encoding = app_state.plan_encoding  # todos los bloques y el retorno con la misma codificación
+    port_lost = threading.Event()
+    scheduler = PlaybackScheduler(sample_interval)
+    parts = []
     
+    def should_stop():
+        return port_lost.is_set() or not app_state.sismo_running
+    
+    def play_blocks():
+        sent = 0
+        origin = None
+        for steps in blocks:
+            if should_stop():
+                break
+            plan = CompiledPlan(steps, sample_interval, encoding=encoding, origin=app_state.commanded_position)
+            if origin is None:
+                # el enlace se valida con el primer bloque, todos tienen la misma frecuencia
+                budget = check_plan(plan, getattr(app_state.ser, "baudrate", None))
+                if budget:
+                    print(budget.report())
+                origin = time.perf_counter()
+                print(f"Streaming: primer bloque listo en {(origin - request_time) * 1e3:.1f} ms "
+                      f"({len(steps)} muestras a {1.0 / sample_interval:g} Hz)")
+            
+            def send_sample(i, plan=plan, first=sent):
+                if not write_raw(plan.command(i), relative=plan.relative):
+                    port_lost.set()
+                    return
+                app_state.commanded_position = plan.commanded_position(i)
+                with app_state.data_lock:
+                    app_state.expected_wave_data.append(((first + i) * sample_interval, int(plan.positions[i])))
+            
+            def skip_samples(start, stop, plan=plan):
+                # muestras descartadas por llegar tarde: su delta acumulado se envía igual
+                data = plan.skip(start, stop)
+                if data and not write_raw(data, relative=plan.relative):
+                    port_lost.set()
+                    return
+                app_state.commanded_position = plan.commanded_position(stop - 1)
+            
+            # todos los bloques comparten el origen de tiempo, no se acumulan huecos entre ellos
+            parts.append(scheduler.run(len(steps), send_sample, should_stop, origin=origin + sent * sample_interval,
+                                       skipped=skip_samples))
+            sent += len(steps)
+    
+    mode = "realtime" if app_state.realtime_mode else "normal"
+    realtime = RealtimeMode(io_threads()) if app_state.realtime_mode else None
+    try:
+        if realtime:
+            with realtime:
+                play_blocks()
+            app_state.log_sent.note(realtime.summary())
+        else:
+            play_blocks()
+        
+        stats = PlaybackStats.combine(parts, sample_interval)
+        if port_lost.is_set():
+            print("Error: puerto serial cerrado durante la reproducción.")
+        elif not app_state.sismo_running:
+            print("Reproducción detenida por el usuario.")
+        else:
+            print(f"Reproducción completada. {stats.sent} muestras enviadas.")
+        print(f"Temporización: {stats.summary()}")
+        app_state.log_sent.note(f"Streaming playback: {stats.summary()} | commanded {app_state.commanded_position} steps")
+        app_state.playback_jitter[mode] = stats.summary()
+    except LinkBudgetError as exc:
+        print(f"Error: plan rechazado, {exc}")
+        app_state.log_sent.note(f"Plan rechazado: {exc}")
+    except Exception as exc:
+        print(f"Error durante la reproducción: {exc}")
+    finally:
+        blocks.close()
+        _return_home(encoding, app_state.commanded_position)
+        with app_state.data_lock:
+            app_state.sismo_running = False
+        print("Reproducción finalizada.")
+
+def _return_home(encoding, position):
+    """
+    Devuelve la mesa al origen de la reproducción. Con los planes delta el
+    firmware mueve relativo (m/d), un m0 no movería nada y el desvío se
+    acumularía en la siguiente, que vuelve a contar desde 0.
+    """
+    data = home_command(position, encoding)
+    if data and write_raw(data, coalesce=False):
+        app_state.log_sent.note(f"Retorno al origen desde {position} pasos ({encoding})")
+    app_state.commanded_position = 0
+
+def _play_prepared(scaled_data, sample_interval, release=True, trace_id=None):
+    """
+    Reproduce una trayectoria ya preparada (pasos cada sample_interval).
+    
+    Args:
+        scaled_data: Posiciones objetivo en pasos
+        sample_interval: Intervalo entre comandos en segundos
+        release: Poner sismo_running en False al terminar (la playlist lo mantiene entre elementos)
+        trace_id: Traza de origen, para comparar después su espectro con el del encoder
+    
+    Returns:
+        bool: True si la reproducción llegó al final
+    """
     total_samples = len(scaled_data)
     if total_samples == 0:
         print("Error: La traza no produjo muestras válidas.")
-        with app_state.data_lock:
-            app_state.sismo_running = False
+        if release:
+            with app_state.data_lock:
+                app_state.sismo_running = False
         send_command("m0")
-        return
+        return False
     
     # Asegurar intervalo mínimo
     sample_interval = max(sample_interval, 0.001)
     
+    # Reducir la amplitud hasta que velocidad y aceleración entren en la envolvente calibrada
+    if app_state.calibration is not None and dpg.does_item_exist("shaping_checkbox") and dpg.get_value("shaping_checkbox"):
+        scaled_data, report = shape(scaled_data, sample_interval, app_state.calibration)
+        print(report.summary())
+    
+    # s/a por ventana según lo que pide la trayectoria, con Speed/Acceleration como techo
+    inserts = None
+    if dpg.does_item_exist("feedforward_checkbox") and dpg.get_value("feedforward_checkbox"):
+        limits = plan_limits(scaled_data, sample_interval,
+                             max_speed=dpg.get_value("speed_input"), max_acceleration=dpg.get_value("accel_input"))
+        inserts = limits.commands()
+        print(limits.summary())
+    
+    # Codificar todos los comandos una sola vez, el bucle solo corta y escribe
+    plan = CompiledPlan(scaled_data, sample_interval, encoding=app_state.plan_encoding, inserts=inserts)
+    
+    # Rechazar planes que saturarían el enlace serial
+    try:
+        budget = check_plan(plan, getattr(app_state.ser, "baudrate", None))
+        if budget:
+            print(budget.report())
+    except LinkBudgetError as exc:
+        print(f"Error: plan rechazado, {exc}")
+        app_state.log_sent.note(f"Plan rechazado: {exc}")
+        if release:
+            with app_state.data_lock:
+                app_state.sismo_running = False
+        return False
+    
     # Limpiar datos de visualización
+    app_state.telemetry.clear()
     with app_state.data_lock:
         app_state.expected_wave_data.clear()
-        app_state.x_data.clear()
-        app_state.y_data.clear()
-        app_state.plot_start_time = time.time()
+        app_state.plot_start_time = time.perf_counter()
     
     # Enviar configuración del motor
     if dpg.does_item_exist("speed_input"):
@@ -242,44 +374,98 @@ def _playback_worker_thread(trace, trace_info, amplitude):
         send_command(f"a{accel}")
         print(f"Configuración: Aceleración = {accel}")
     
-    print(f"Reproduciendo {total_samples} muestras (duración aproximada: {total_samples * sample_interval:.2f}s)")
+    print(f"Reproduciendo {total_samples} muestras (duración aproximada: {total_samples * sample_interval:.2f}s, "
+          f"{plan.encoding} {plan.bytes_per_command:.1f} B/comando)")
+    
+    app_state.commanded_position = 0
+    
+    positions = plan.positions.tolist()
+    port_lost = threading.Event()
+    playback_start = time.perf_counter()
+    
+    def send_sample(i):
+        # Enviar comando de posición; en modo delta los setpoints atrasados se suman al coalescer
+        if not write_raw(plan.command(i), relative=plan.relative):
+            port_lost.set()
+            return
+        app_state.commanded_position = plan.commanded_position(i)
+        
+        # Almacenar posición esperada para visualización
+        current_time = time.perf_counter() - playback_start
+        with app_state.data_lock:
+            app_state.expected_wave_data.append((current_time, positions[i]))
+            if len(app_state.expected_wave_data) > app_state.max_points:
+                app_state.expected_wave_data.popleft()
+    
+    def should_stop():
+        return port_lost.is_set() or not app_state.sismo_running
+    
+    # Análisis en línea: error de seguimiento y retardo del encoder contra el plan.
+    # La telemetría se acaba de limpiar, el origen del encoder es la primera muestra que llegue
+    tracking = TrackingAnalyzer(plan.positions, sample_interval, playback_start - app_state.plot_start_time)
+    tracking.start_at(app_state.telemetry)
+    app_state.tracking = tracking
+    app_state.tracking_trace_id = trace_id
+    
+    # Modo tiempo real opcional: cores dedicados, prioridad y GC congelado
+    mode = "realtime" if app_state.realtime_mode else "normal"
+    realtime = RealtimeMode(io_threads()) if app_state.realtime_mode else None
     
-    playback_start = time.time()
-    samples_sent = 0
+    # Cada muestra tiene su instante absoluto, el tiempo de envío no se acumula.
+    # El controlador permite pausar, reanudar y saltar sin recompilar el plan
+    controller = PlaybackController(
+        plan, send_sample, lambda data: write_raw(data, relative=plan.relative), should_stop,
+        on_segment=lambda index, t0: tracking.rebase(index, t0 - app_state.plot_start_time),
+        on_hold=tracking.hold,
+    )
+    app_state.playback_controller = controller
     
+    completed = False
     try:
-        for raw_position in scaled_data:
-            # Verificar si se debe detener
-            if not app_state.sismo_running:
-                print("Reproducción detenida por el usuario.")
-                send_command("m0")
-                return
-            
-            # Enviar comando de posición
-            position = int(raw_position)
-            send_command(f"m{position}")
-            samples_sent += 1
-            
-            # Almacenar posición esperada para visualización
-            current_time = time.time() - playback_start
-            with app_state.data_lock:
-                app_state.expected_wave_data.append((current_time, position))
-                if len(app_state.expected_wave_data) > app_state.max_points:
-                    app_state.expected_wave_data.popleft()
-            
-            # Esperar el intervalo de muestreo
-            time.sleep(sample_interval)
+        if realtime:
+            with realtime:
+                stats = controller.run()
+        else:
+            stats = controller.run()
+        app_state.commanded_position = controller.commanded
+        
+        if port_lost.is_set():
+            print("Error: puerto serial cerrado durante la reproducción.")
+        elif not app_state.sismo_running:
+            print("Reproducción detenida por el usuario.")
+        else:
+            completed = True
+            print(f"Reproducción completada. {stats.sent} muestras enviadas.")
         
-        print(f"Reproducción completada. {samples_sent} muestras enviadas.")
+        print(f"Temporización: {stats.summary()}")
+        print("  " + ", ".join(f"{label}: {count}" for label, count in stats.histogram() if count))
+        app_state.log_sent.note(f"Playback: {stats.summary()} | commanded {app_state.commanded_position} steps")
+        tracking.poll(app_state.telemetry)
+        print(f"Seguimiento: {tracking.summary()}")
+        app_state.log_sent.note(tracking.summary())
+        if realtime:
+            app_state.log_sent.note(realtime.summary())
+        
+        # Último resultado de cada modo, para comparar con y sin tiempo real
+        app_state.playback_jitter[mode] = stats.summary()
+        for name, summary in app_state.playback_jitter.items():
+            print(f"  {name}: {summary}")
         
     except Exception as exc:
         print(f"Error durante la reproducción: {exc}")
     finally:
         # Detener el motor y limpiar estado
-        send_command("m0")
-        with app_state.data_lock:
-            app_state.sismo_running = False
+        app_state.playback_controller = None
+        _return_home(plan.encoding, controller.commanded)
+        if plan.inserts:
+            # Volver a los límites de "opciones", los del último tramo pueden ser muy bajos
+            send_command(f"s{dpg.get_value('speed_input')}")
+            send_command(f"a{dpg.get_value('accel_input')}")
+        if release:
+            with app_state.data_lock:
+                app_state.sismo_running = False
         print("Reproducción finalizada.")
+    return completed
 
 def stop_seismic_playback():
     """Detiene la reproducción sísmica en curso."""
@@ -288,8 +474,147 @@ def stop_seismic_playback():
         app_state.sismo_running = False
     
     if was_running:
+        # El hilo de reproducción sale en el siguiente período y en su finally
+        # manda el retorno al origen con la posición comandada final; enviarlo
+        # también aquí lo duplicaría o se cruzaría con la última muestra
         print("Deteniendo reproducción sísmica...")
-        send_command("m0")
+
+def pause_seismic_playback():
+    """Pausa o reanuda la reproducción en curso; la mesa se queda en la última posición."""
+    controller = app_state.playback_controller
+    if controller is None:
+        return
+    if controller.paused:
+        controller.resume()
+        print("Reproducción reanudada.")
+    else:
+        controller.pause()
+        print(f"Reproducción en pausa en {controller.position:.2f}s.")
+
+def seek_seismic_playback(seconds):
+    """Salta a `seconds` de la traza: la mesa va suavemente a esa posición y sigue."""
+    controller = app_state.playback_controller
+    if controller is not None:
+        controller.seek(float(seconds))
+        print(f"Saltando a {seconds:.2f}s.")
+
+def add_selected_to_playlist(amplitude=1600, rest=0.0):
+    """Añade la traza seleccionada a la playlist con la frecuencia e interpolación de "opciones"."""
+    if app_state.viewer_selected_trace_index is None:
+        print("Error: Debe seleccionar una traza antes de añadirla a la playlist.")
+        return False
+    trace_info = app_state.viewer_all_traces[app_state.viewer_selected_trace_index]
+    command_rate = dpg.get_value("command_rate_combo") if dpg.does_item_exist("command_rate_combo") else NATIVE
+    method = dpg.get_value("interpolation_combo") if dpg.does_item_exist("interpolation_combo") else BANDLIMITED
+    item = PlaylistItem(trace_info['file_path'], trace_info['file_position'], trace_info['id'],
+                        amplitude=amplitude, command_rate=command_rate, interpolation=method, rest=rest,
+                        integrator=trace_info.get('integrator', TIME_DOMAIN))
+    app_state.playlist.add(item)
+    print(f"Playlist: añadido {item.label}")
+    return True
+
+def start_playlist():
+    """Reproduce la playlist en orden; cada elemento se prepara en otro proceso mientras suena el anterior."""
+    if not (app_state.ser and app_state.ser.is_open):
+        print("Error: Debe estar conectado al ESP32 antes de reproducir.")
+        return False
+    if not len(app_state.playlist):
+        print("Error: La playlist está vacía.")
+        return False
+    with app_state.data_lock:
+        if app_state.sismo_running:
+            print("Error: Ya hay una reproducción sísmica en curso.")
+            return False
+        if app_state.wave_running:
+            print("Error: Detenga el generador de ondas antes de reproducir.")
+            return False
+        app_state.sismo_running = True
+    threading.Thread(target=_playlist_worker_thread, daemon=True).start()
+    return True
+
+def _playlist_worker_thread():
+    """Recorre la playlist: espera la preparación (normalmente ya lista), reproduce y descansa."""
+    total = len(app_state.playlist)
+    played = 0
+    prepared = app_state.playlist.prepared()
+    try:
+        for index, item, future in prepared:
+            if not app_state.sismo_running:
+                break
+            wait_start = time.perf_counter()
+            try:
+                scaled_data, sample_interval, took = future.result()
+            except Exception as exc:
+                print(f"Playlist: error al preparar {item.trace_id}: {exc}")
+                continue
+            waited = time.perf_counter() - wait_start
+            print(f"Playlist {index + 1}/{total}: {item.label} "
+                  f"(preparada en {took:.2f}s, espera al iniciar {waited * 1e3:.0f} ms)")
+            app_state.playlist_index = index
+            if _play_prepared(scaled_data, sample_interval, release=False, trace_id=item.trace_id):
+                played += 1
+            if not app_state.sismo_running or not (app_state.ser and app_state.ser.is_open):
+                break
+            if item.rest and index + 1 < total:
+                print(f"Playlist: descanso de {item.rest:g}s")
+                rest_end = time.perf_counter() + item.rest
+                while app_state.sismo_running and time.perf_counter() < rest_end:
+                    time.sleep(0.05)
+    finally:
+        prepared.close()
+        app_state.playlist_index = None
+        with app_state.data_lock:
+            app_state.sismo_running = False
+        print(f"Playlist finalizada: {played}/{total} registros reproducidos.")
+        app_state.log_sent.note(f"Playlist: {played}/{total} registros")
+
+def response_spectra(trace_info, amplitude=1600, damping=0.05):
+    """
+    Espectros de respuesta de la traza para comparar en el visor.
+    
+    Si la última reproducción fue esta traza se comparan la trayectoria
+    enviada y el movimiento medido por el encoder (llevado a la misma
+    rejilla de tiempo); si no, solo la traza procesada con la configuración
+    de "opciones". Con pausas o saltos la rejilla del encoder ya no coincide.
+    
+    Args:
+        trace_info: Información de la traza (metadata)
+        amplitude: Amplitud máxima en pasos
+        damping: Amortiguamiento del resumen impreso
+    
+    Returns:
+        dict: etiqueta -> ResponseSpectrum
+    """
+    spectra = {}
+    tracking = app_state.tracking
+    start = time.perf_counter()
+    if tracking is not None and app_state.tracking_trace_id == trace_info['id'] and tracking.encoder_origin is not None:
+        dt = tracking.sample_interval
+        spectra["commanded"] = position_spectrum(tracking.positions, dt)
+        times, degrees, _ = app_state.telemetry.latest()
+        measured = resample_motion(times, (degrees - tracking.encoder_origin) * tracking.steps_per_degree,
+                                   tracking.t0, dt, len(tracking.positions))
+        if len(measured) > 2:
+            spectra["table (encoder)"] = position_spectrum(measured, dt)
+        else:
+            print("Espectro: no hay telemetría del encoder para esta reproducción.")
+    else:
+        command_rate = dpg.get_value("command_rate_combo") if dpg.does_item_exist("command_rate_combo") else NATIVE
+        method = dpg.get_value("interpolation_combo") if dpg.does_item_exist("interpolation_combo") else BANDLIMITED
+        scaled_data, dt = prepare(trace_info['obspy_trace'], amplitude, command_rate, method,
+                                  cache=app_state.trajectory_cache, file_path=trace_info['file_path'],
+                                  integrator=trace_info.get('integrator', TIME_DOMAIN))
+        spectra["record (processed)"] = position_spectrum(scaled_data, dt)
+    print(f"Espectro de respuesta de {trace_info['id']} en {(time.perf_counter() - start) * 1e3:.0f} ms")
+    
+    if "table (encoder)" in spectra:
+        reference = spectra["commanded"]
+        row = int(np.argmin(np.abs(reference.dampings - damping)))
+        ratio = spectra["table (encoder)"].ratio(reference)[row]
+        worst = int(np.nanargmax(np.abs(np.log(ratio))))
+        print(f"  mesa/comando PSA {damping:.0%}: media {np.nanmean(ratio):.2f}, "
+              f"más lejos {ratio[worst]:.2f} en T={reference.periods[worst]:.2f}s")
+    return spectra
 
 def trace_filters(trace): ###### trace filte example function
     """Applies a series of filters to the trace and returns the processed trace."""
@@ -3,26 +3,52 @@
 
 import serial
 import serial.tools.list_ports
+import os
 import time
 import math
+import threading
 import dearpygui.dearpygui as dpg
 
 import app_state # Import shared state
+from shared.log_store import LOG_RX, LOG_TX
+from shared.async_serial import AsyncSerialLink, supports_async
+from shared.serial_writer import CommandWriter
+from shared.session_recorder import SessionRecorder, SessionReplay, RX, TX
+
+# encoder unwrap state shared by the reader thread and the asyncio callback
+_prev_angle = None
+_turns = 0
+_rx_pending = b""
 
 def find_serial_ports():
     """Returns a list of available COM ports."""
-    ports = serial.tools.list_ports.comports()
-    return [port.device for port in ports] if ports else ["No Ports Found"]
+    ports = [port.device for port in serial.tools.list_ports.comports()]
+    # Virtual table (python -m shared.virtual_table) is not listed by comports()
+    if os.environ.get("VIRTUAL_TABLE_PORT"):
+        ports.append(os.environ["VIRTUAL_TABLE_PORT"])
+    return ports if ports else ["No Ports Found"]
 
-def connect_serial(port, baud):
-    """Attempts to connect to the given serial port."""
+def connect_serial(port, baud, backend="thread", record_path=None):
+    """
+    Attempts to connect to the given serial port.
+    backend="asyncio" reads/writes through an AsyncSerialLink driven by fd
+    readiness events; read_serial_thread then stays idle. Ports without a
+    selectable fd (Windows COM) silently keep the thread backend.
+    record_path: raw RX/TX session file (.mesarec) to write while connected.
+    """
+    global _rx_pending
     if port == "No Ports Found":
         return False, "No serial ports available."
+    stop_replay()  # the live reader becomes the only writer of the telemetry ring
     try:
         app_state.ser = serial.Serial(port, int(baud), timeout=1)
-        with app_state.data_lock:
-            app_state.log_recv.append(f"Conectado a {port} a {baud} baud.")
-            app_state.log_dirty = True
+        app_state.recorder = SessionRecorder(record_path) if record_path else None
+        app_state.sample_clock.reset()
+        _rx_pending = b""
+        if backend == "asyncio" and supports_async(app_state.ser):
+            app_state.link = AsyncSerialLink(app_state.ser, _on_async_data, _on_link_error).start()
+        app_state.writer = CommandWriter(_write_port, on_error=_on_link_error)
+        app_state.log_recv.note(f"Conectado a {port} a {baud} baud ({'asyncio' if app_state.link else 'thread'}).")
         return True, f"Conectado a {port}"
     except serial.SerialException as e:
         app_state.ser = None
@@ -31,67 +57,153 @@ def connect_serial(port, baud):
 def disconnect_serial():
     """Closes the serial connection if it is open."""
     # <<< MODIFICADO: Agregado log al desconectar >>>
+    if app_state.writer:
+        app_state.writer.close()
+        app_state.writer = None
+    if app_state.link:
+        app_state.link.close()
+        app_state.link = None
     if app_state.ser and app_state.ser.is_open:
         app_state.ser.close()
         app_state.ser = None # Ensure the object is cleared
-        with app_state.data_lock:
-            app_state.log_recv.append("Desconectado.")
-            app_state.log_dirty = True
+        app_state.log_recv.note("Desconectado.")
+    if app_state.recorder:
+        app_state.recorder.close()
+        app_state.recorder = None
     print("Serial connection closed.")
 
+def io_threads():
+    """Reader, writer and asyncio loop threads, to pin them next to playback in real-time mode."""
+    threads = [app_state.reader_thread]
+    if app_state.writer:
+        threads.append(app_state.writer.thread)
+    if app_state.link:
+        threads.append(app_state.link.thread)
+    return [t for t in threads if t is not None]
 
-def send_command(command):
-    """Sends a command to the serial port if it is connected."""
-    if app_state.ser and app_state.ser.is_open:
-        try:
-            full_command = command + '\n'
-            app_state.ser.write(full_command.encode("utf-8"))
-            with app_state.data_lock:
-                app_state.log_sent.append(f"[{time.strftime('%H:%M:%S')}] >> {command}")
-                app_state.log_dirty = True
-        except serial.SerialException as e:
-            with app_state.data_lock:
-                app_state.log_sent.append(f"ERROR: {e}")
-                app_state.log_dirty = True
+
+def _write_port(data):
+    """Called only from the CommandWriter thread."""
+    if app_state.recorder:
+        app_state.recorder.record(TX, data)
+    if app_state.link:
+        app_state.link.write(data)
+    elif app_state.ser and app_state.ser.is_open:
+        app_state.ser.write(data)
+
+def send_command(command, coalesce=False):
+    """
+    Queues a command for the serial writer if it is connected.
+    coalesce=True marks streamed setpoints that may be dropped when a newer
+    one is already waiting; manual commands, s/a and stop m0 keep the default.
+    """
+    if app_state.ser and app_state.ser.is_open and app_state.writer:
+        full_command = command + '\n'
+        app_state.writer.submit(full_command.encode("utf-8"), coalesce)
+        app_state.log_sent.add(LOG_TX, command)
     else:
-        with app_state.data_lock:
-            app_state.log_sent.append(f"SKIPPED (not connected): {command}")
-            app_state.log_dirty = True
+        app_state.log_sent.note(f"SKIPPED (not connected): {command}")
+
+def write_raw(data, coalesce=True, relative=False):
+    """
+    Queues already encoded bytes (compiled plans) without formatting or logging.
+    relative=True for the moves of delta plans, which are summed when coalesced.
+    """
+    if app_state.ser and app_state.ser.is_open and app_state.writer:
+        app_state.writer.submit(data, coalesce, relative)
+        return True
+    return False
+
 
+def _publish_lines(lines, arrival_ns):
+    """Logs the received lines and adds the encoder samples among them to the telemetry."""
+    global _prev_angle, _turns
+    angles = []
+    for line in lines:
+        app_state.log_recv.stream(LOG_RX, line)
+        try:
+            angle = float(line)
+        except ValueError:
+            continue
+        if _prev_angle is not None:
+            if _prev_angle > 300 and angle < 60: _turns += 1
+            elif _prev_angle < 60 and angle > 300: _turns -= 1
+        _prev_angle = angle
+        angles.append((_turns * 360) + angle)
+    if angles:
+        times_ns, sequences = app_state.sample_clock.stamp(arrival_ns, len(angles))
+        app_state.telemetry.extend(times_ns / 1e9 - app_state.plot_start_time, angles, sequences)
+
+def _on_async_data(chunk, arrival_ns):
+    """AsyncSerialLink / replay callback: splits complete lines, keeps the partial tail."""
+    global _rx_pending
+    if app_state.recorder:
+        app_state.recorder.record(RX, chunk, arrival_ns)
+    data = _rx_pending + chunk
+    end = data.rfind(b"\n")
+    if end < 0:
+        _rx_pending = data
+        return
+    _rx_pending = data[end + 1:]
+    lines = [line.strip() for line in data[:end].decode("utf-8", errors="replace").split("\n")]
+    _publish_lines([line for line in lines if line], arrival_ns)
+
+def _on_link_error(exc):
+    app_state.log_sent.note(f"ERROR: {exc}")
 
 def read_serial_thread():
     """Background thread to continuously read data from the serial port."""
-    prev_angle = None
-    turns = 0
     while app_state.app_running:
-        if app_state.ser and app_state.ser.is_open:
+        if app_state.ser and app_state.ser.is_open and app_state.link is None:
             try:
-                line = app_state.ser.readline().decode("utf-8").strip()
+                raw = app_state.ser.readline()
+                arrival_ns = time.perf_counter_ns()
+                if app_state.recorder and raw:
+                    app_state.recorder.record(RX, raw, arrival_ns)
+                line = raw.decode("utf-8").strip()
                 if line:
-                    with app_state.data_lock:
-                        app_state.log_recv.append(f"[{time.strftime('%H:%M:%S')}] << {line}")
-                        app_state.log_dirty = True
-                    try:
-                        angle = float(line)
-                        with app_state.data_lock:
-                            if prev_angle is not None:
-                                if prev_angle > 300 and angle < 60: turns += 1
-                                elif prev_angle < 60 and angle > 300: turns -= 1
-                            prev_angle = angle
-                            absolute_angle = (turns * 360) + angle
-                            current_time = time.time() - app_state.plot_start_time
-                            app_state.x_data.append(current_time)
-                            app_state.y_data.append(absolute_angle)
-                            if len(app_state.x_data) > app_state.max_points:
-                                app_state.x_data.pop(0)
-                                app_state.y_data.pop(0)
-                    except ValueError:
-                        pass
-            except (serial.SerialException, UnicodeDecodeError):
+                    _publish_lines([line], arrival_ns)
+            # TypeError/OSError: the port was closed by disconnect_serial() mid-readline
+            except (serial.SerialException, UnicodeDecodeError, TypeError, OSError):
                 time.sleep(0.5)
         else:
             time.sleep(0.5)
 
+def start_replay(path, speed=1.0):
+    """
+    Replays a recorded session through the same line parsing, telemetry and
+    logs as live data (speed: 1 real time, N faster, 0 as fast as possible).
+    """
+    global _rx_pending
+    if app_state.ser:
+        # TelemetryRing has a single writer: the live reader stops before the replay starts
+        disconnect_serial()
+        app_state.log_recv.note("Replay: puerto desconectado.")
+    stop_replay()
+    _rx_pending = b""
+    app_state.sample_clock.reset()
+    app_state.telemetry.clear()
+    app_state.plot_start_time = time.perf_counter()
+    app_state.replay = SessionReplay(path, speed)
+
+    def worker(replay):
+        replay.play(_on_async_data, on_tx=lambda data, _: app_state.log_sent.add(LOG_TX, data),
+                    start_ns=int(app_state.plot_start_time * 1e9))
+        app_state.log_recv.note(f"Replay finished: {replay.records} records in {replay.elapsed:.2f}s")
+
+    app_state.replay_thread = threading.Thread(target=worker, args=(app_state.replay,), daemon=True)
+    app_state.replay_thread.start()
+    app_state.log_recv.note(f"Replaying {os.path.basename(path)} at {f'{speed:g}x' if speed else 'max speed'}")
+
+def stop_replay():
+    """Stops the running replay and waits for its thread, so it writes nothing afterwards."""
+    if app_state.replay:
+        app_state.replay.stop()
+    if app_state.replay_thread:
+        app_state.replay_thread.join(timeout=2.0)
+    app_state.replay = None
+    app_state.replay_thread = None
+
 def wave_generator_thread():
     """Background thread to generate a sine wave and send motor commands."""
     amplitude = dpg.get_value("amplitude_slider")
@@ -101,7 +213,7 @@ def wave_generator_thread():
     while app_state.wave_running:
         elapsed_time = time.time() - start_time
         target_pos = amplitude * math.sin(2 * math.pi * frequency * elapsed_time)
-        send_command(f"m{int(target_pos)}")
+        send_command(f"m{int(target_pos)}", coalesce=True)
         time.sleep(0.02)
     
     send_command("m0")
\ No newline at end of file
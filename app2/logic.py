@@ -6,35 +6,103 @@ import serial
 import serial.tools.list_ports
 from state import state
 import time
+import os
 #import math
 import queue
 import threading
+from contextlib import nullcontext
 
 ##for seismic procesor 
 from obspy import read, UTCDateTime # type: ignore
 from obspy.core import Trace  # type: ignore 
 import numpy as np
+from shared.playback_plan import CompiledPlan
+from shared.log_store import LOG_RX, LOG_TX
+from shared.telemetry import SampleClock
+from shared.async_serial import AsyncSerialLink, supports_async
+from shared.serial_writer import CommandWriter
+from shared.session_recorder import SessionRecorder, SessionReplay, RX, TX
+from shared.link_budget import check_plan, LinkBudgetError
+from shared.playback_controller import PlaybackController
+from shared.realtime import RealtimeMode
+from shared.upsampler import UpsampleCache
+from shared.trajectory_cache import TrajectoryCache
+from shared.tracking import TrackingAnalyzer
+from shared.motion_limits import plan_limits, MAX_SPEED_HZ, MAX_ACCELERATION
 
 def find_serial_ports():
-    ports = serial.tools.list_ports.comports()
-    return [port.device for port in ports] if ports else ["No Ports Found"]
+    ports = [port.device for port in serial.tools.list_ports.comports()]
+    # mesa virtual (python -m shared.virtual_table), no aparece en comports()
+    if os.environ.get("VIRTUAL_TABLE_PORT"):
+        ports.append(os.environ["VIRTUAL_TABLE_PORT"])
+    return ports if ports else ["No Ports Found"]
+
+RX_BUFFER_SIZE = 1 << 16 # bytes pulled per read() in bulk mode
+RX_RATE_WINDOW = 1.0 # seconds between lines/s updates
+
+def parse_telemetry_block(block: bytes) -> tuple[NDArray[np.float64], list[str]]:
+    """parsea un bloque de lineas completas del encoder de una sola vez.
+    devuelve los angulos como array y las lineas que no son numericas
+    (mensajes de arranque del firmware, errores, etc)"""
+    try:
+        return np.array(block.split(), dtype=np.bytes_).astype(np.float64), []
+    except ValueError:
+        pass
+    # fallback lento: hay texto mezclado con los numeros
+    values: list[float] = []
+    text: list[str] = []
+    for raw in block.split(b"\n"):
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            values.append(float(line))
+        except ValueError:
+            text.append(line.decode("utf-8", errors="replace"))
+    return np.array(values, dtype=np.float64), text
 
 class SerialManager: 
-    """read and send estan dobles """
-    def __init__(self, port:str, baudrate: int):
+    """read and send estan dobles 
+    backend "thread": hilo lector (bulk o linea por linea).
+    backend "asyncio": AsyncSerialLink, lectura y escritura por eventos del fd sin hilo que gire.
+    si el puerto no tiene fd (COM en windows) se usa el hilo"""
+    def __init__(self, port:str, baudrate: int, bulk_read: bool = True, backend: str = "thread",
+                 record_path: str | None = None):
+        self.bulk_read = bulk_read
+        self.baudrate = baudrate
+        # grabacion cruda de todo lo que entra y sale, para analizar o reproducir despues
+        self.recorder = SessionRecorder(record_path) if record_path else None
+        self.sample_clock = SampleClock() # tiempos, huecos y jitter de las muestras del encoder
+        self.link: AsyncSerialLink | None = None
+        self.reader_thread: threading.Thread | None = None
+        self._pending = b""
+        self._rate_lines = 0
+        self._rate_start = time.perf_counter()
+        self.serial_port = None
+        self.writer = None
         try:
             self.serial_port = serial.Serial(port, baudrate, timeout=1)
             self.read_queue: queue.Queue[str]  = queue.Queue()
             self.stop_event = threading.Event()
-            with state.data_lock:
-                state.log_send.append(f"Conectado a {port} a {baudrate} baud.")
-                state.log_dirty = True
+            # todas las escrituras pasan por la cola del writer, nadie bloquea en serial.write
+            self.writer = CommandWriter(self._write_port, on_error=self._link_error)
+            state.log_send.note(f"Conectado a {port} a {baudrate} baud.")
         except serial.SerialException as e:
             print(f"error: {e}")
+            state.log_send.note(f"No se pudo abrir {port}: {e}")
+            if self.recorder:
+                self.recorder.close()
             state.ser_manager = None
+            return
         
+        if backend == "asyncio" and supports_async(self.serial_port):
+            self.backend = "asyncio"
+            self.link = AsyncSerialLink(self.serial_port, self.handle_chunk, self._link_error).start()
+            return
         # Iniciar el hilo de lectura
-        self.reader_thread = threading.Thread(target=self.read_thread, daemon=True)
+        self.backend = "thread"
+        target = self.read_bulk_thread if bulk_read else self.read_thread
+        self.reader_thread = threading.Thread(target=target, daemon=True)
         self.reader_thread.start()
 
     def read_thread(self):
@@ -44,17 +112,17 @@ class SerialManager:
             if self.serial_port and self.serial_port.is_open:
                 if self.serial_port.in_waiting > 0:
                     try:
-                        line = self.serial_port.readline().decode("utf-8", errors='replace').strip()
+                        raw = self.serial_port.readline()
+                        if self.recorder:
+                            self.recorder.record(RX, raw)
+                        line = raw.decode("utf-8", errors='replace').strip()
                         if line:
-                            with state.data_lock: ##aqui va el formato de los logs 
-                                state.log_read.append(f"[{time.strftime('%H:%M:%S')}] << {line}")
-                                state.log_dirty = True
+                            state.log_read.stream(LOG_RX, line) ##el formato se hace al dibujar la consola
                             try:
                                 angle = float(line)
-                                with state.data_lock:
-                                    current_time = time.time() - state.start_time
-                                    state.monitor_x.append(current_time)
-                                    state.monitor_y.append(angle)
+                                arrival_ns = time.perf_counter_ns()
+                                times_ns, sequences = self.sample_clock.stamp(arrival_ns, 1)
+                                state.telemetry.append(times_ns[0] / 1e9 - state.start_time, angle, int(sequences[0]))
                             except ValueError:
                                 print(ValueError)
                     except (serial.SerialException, UnicodeDecodeError,):
@@ -62,32 +130,154 @@ class SerialManager:
             else:
                 time.sleep(0.5)
 
+    def read_bulk_thread(self):
+        """ igual que read_thread pero lee todo lo disponible con un solo readinto
+        y se lo pasa a handle_chunk"""
+        buffer = bytearray(RX_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while state.running and not self.stop_event.is_set():
+            if not (self.serial_port and self.serial_port.is_open):
+                time.sleep(0.5)
+                continue
+            try:
+                # pedir al menos 1 byte: bloquea hasta que llegue algo (o timeout) en vez de girar
+                wanted = min(max(self.serial_port.in_waiting, 1), RX_BUFFER_SIZE)
+                n = self.serial_port.readinto(view[:wanted])
+                arrival_ns = time.perf_counter_ns()
+            except serial.SerialException:
+                time.sleep(0.5)
+                continue
+            if n:
+                self.handle_chunk(view[:n], arrival_ns)
+
+    def handle_chunk(self, data: bytes | memoryview, arrival_ns: int):
+        """ parsea todas las lineas completas juntas y publica el lote de una vez.
+        la linea incompleta del final se guarda para la siguiente lectura.
+        arrival_ns es el perf_counter_ns de cuando llegaron los bytes, los tiempos
+        de cada muestra se reconstruyen con el periodo de 1 ms del firmware"""
+        if self.recorder:
+            self.recorder.record(RX, data, arrival_ns)
+        chunk = self._pending + bytes(data)
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            # sin linea completa; descartar si nunca llega un salto de linea
+            self._pending = chunk if len(chunk) < RX_BUFFER_SIZE else b""
+            return
+        self._pending = chunk[end + 1:]
+        block = chunk[:end]
+        angles, text = parse_telemetry_block(block)
+        count = len(angles)
+
+        times_ns, sequences = self.sample_clock.stamp(arrival_ns, count)
+        state.telemetry.extend(times_ns / 1e9 - state.start_time, angles, sequences)
+        # el lote entero es un solo registro, solo se formatea lo visible al dibujar
+        state.log_read.stream(LOG_RX, block)
+
+        self._rate_lines += count + len(text)
+        elapsed = time.perf_counter() - self._rate_start
+        if elapsed >= RX_RATE_WINDOW:
+            state.rx_lines_per_s = self._rate_lines / elapsed
+            self._rate_lines = 0
+            self._rate_start = time.perf_counter()
+
+    def _link_error(self, exc: Exception):
+        state.log_send.note(f"error: {exc}")
+
+    def _write_port(self, data: bytes):
+        """lo llama solo el hilo del CommandWriter"""
+        if self.recorder:
+            self.recorder.record(TX, data)
+        if self.link:
+            self.link.write(data)
+        else:
+            self.serial_port.write(data)
+
+    def write_raw(self, data: bytes | memoryview, coalesce: bool = True, relative: bool = False):
+        """encola bytes ya codificados (planes compilados) sin formatear ni loguear.
+        con coalesce los setpoints m viejos se pueden descartar si el puerto va atrasado;
+        con relative (planes delta) se suman en vez de descartarse"""
+        self.writer.submit(data, coalesce, relative)
+
     def send(self,command:str):
         if self.serial_port and self.serial_port.is_open:
-            try:
-                self.serial_port.write(command.encode("utf-8"))
-                #self.serial_port.flush()
-                with state.data_lock:
-                    state.log_send.append(f"[{time.strftime('%H:%M:%S')}] >> {command}")
-                    state.log_dirty = True
-            except serial.SerialException as e:
-                print(f"error:{e}")
+            # comandos manuales nunca se descartan
+            self.writer.submit(command.encode("utf-8"), coalesce=False)
+            state.log_send.add(LOG_TX, command)
         else:   
             print("error ser is close")
 
+    def io_threads(self) -> list[threading.Thread]:
+        """hilos de E/S del enlace, para fijarlos a un core en modo tiempo real"""
+        threads = [self.reader_thread]
+        if self.writer:
+            threads.append(self.writer.thread)
+        if self.link:
+            threads.append(self.link.thread)
+        return [t for t in threads if t is not None]
+
     def close(self):
         if self.serial_port and self.serial_port.is_open:
-            self.serial_port.close()
+            # parar el lector antes de cerrar, si no puede quedar dentro de read() con el fd cerrado
             self.stop_event.set()
-            self.reader_thread.join()
+            self.writer.close()
+            if self.link:
+                self.link.close()
+            if self.reader_thread:
+                self.reader_thread.join()
+            self.serial_port.close()
+            if self.recorder:
+                self.recorder.close()
             state.ser_manager = None
 
+class ReplayManager(SerialManager):
+    """ reproduce una sesion grabada (.mesarec) por el mismo camino que los datos del puerto:
+    handle_chunk, ring de telemetria y logs. no abre ningun puerto, los comandos se descartan.
+    speed: 1 tiempo real, N veces mas rapido, 0 lo mas rapido posible"""
+    def __init__(self, path: str, speed: float = 1.0):
+        self.bulk_read = True
+        self.baudrate = None
+        self.recorder = None
+        self.writer = None
+        self.sample_clock = SampleClock()
+        self.link = None
+        self.serial_port = None
+        self.backend = "replay"
+        self._pending = b""
+        self._rate_lines = 0
+        self._rate_start = time.perf_counter()
+        self.replay = SessionReplay(path, speed)
+        state.log_send.note(f"Replay {os.path.basename(path)} a {f'{speed:g}x' if speed else 'max'}")
+        self.reader_thread = threading.Thread(target=self.replay_thread, daemon=True)
+        self.reader_thread.start()
+
+    def replay_thread(self):
+        self.replay.play(self.handle_chunk, on_tx=lambda data, _: state.log_send.add(LOG_TX, data),
+                         start_ns=int(state.start_time * 1e9))
+        state.log_send.note(f"Replay terminado: {self.replay.records} registros en {self.replay.elapsed:.2f}s")
+
+    def write_raw(self, data: bytes | memoryview, coalesce: bool = True, relative: bool = False):
+        pass
+
+    def send(self, command: str):
+        state.log_send.note(f"(replay) ignorado: {command}")
+
+    def close(self):
+        self.replay.stop()
+        if self.reader_thread:
+            self.reader_thread.join()
+        state.ser_manager = None
+
 METER_X_REV = 0.008 #segun varilla roscada que usemos
 STEPS_X_REV = 3200 #segun el ajuste del controlador del motor 
 #import numpy as np  
 STEPS_PER_METER = STEPS_X_REV/METER_X_REV 
 
-sampling_rate = 20.0 
+sampling_rate = 20.0  # traza sintetica; la frecuencia de comandos es state.command_rate
+
+upsample_cache = UpsampleCache()
+# trayectorias ya remuestreadas, tambien en disco: la misma traza arranca al instante tras reiniciar
+TRAJECTORY_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trajectory_cache")
+trajectory_cache = TrajectoryCache(TRAJECTORY_CACHE_FOLDER)
 
 class StatsType(TypedDict):
     network: str
@@ -187,20 +377,74 @@ class SeismicProcessor:
             except Exception as e:
                 print(f"Error loading file: {e}")
                 return
-        tr.resample(sampling_rate)
-        steps_array = (tr.data * STEPS_PER_METER).astype(int)
-        #steps_array_relative = np.diff(steps_array, prepend=0)
+        # pasos a la frecuencia original de la traza, el remuestreo a la frecuencia
+        # de comandos se hace en build_plan y queda en cache por (traza, frecuencia)
+        with state.data_lock:
+            state.trace_steps = tr.data * STEPS_PER_METER
+            state.trace_rate = float(tr.stats.sampling_rate)
+            state.trace_key = state.file_path if state.is_file_selected_flag else "synthetic"
+            state.trace_id = f"{tr.id}@{tr.stats.starttime}"
+        self.build_plan()
+
+    def build_plan(self):
+        """
+        Resamples the loaded trace to state.command_rate with state.interpolation
+        and compiles it. Cached in memory and on disk (per file contents, trace
+        and parameters), so switching the rate back and forth, or loading the
+        same record after a restart, is instant.
+        """
+        if state.trace_steps is None:
+            return
+        key = None
+        cached = None
+        if state.is_file_selected_flag:
+            parameters = {"steps_per_meter": STEPS_PER_METER, "command_rate": float(state.command_rate),
+                          "interpolation": state.interpolation}
+            key = trajectory_cache.key(state.file_path, state.trace_id, parameters)
+            cached = trajectory_cache.get(key)
+        if cached is not None:
+            steps_array = cached[0]
+        else:
+            steps = upsample_cache.get(state.trace_key, state.trace_steps, state.trace_rate,
+                                       state.command_rate, state.interpolation)
+            steps_array = steps.astype(int)
+            if key is not None:
+                steps_array = trajectory_cache.put(key, steps_array, 1.0 / state.command_rate)[0]
+        inserts = None
+        if state.feedforward:
+            # s/a por ventana segun la velocidad y aceleracion que pide la trayectoria
+            limits = plan_limits(steps_array, 1.0 / state.command_rate)
+            inserts = limits.commands()
+            state.log_send.note(limits.summary())
+        # en los modos relativos el plan manda np.diff(steps_array), como espera stepper->move()
+        plan = CompiledPlan(steps_array, 1.0 / state.command_rate, encoding=state.plan_encoding, inserts=inserts)
         # 4. Save to State
         with state.data_lock:
             state.seismic_trace = tuple(steps_array.tolist())
+            state.playback_plan = plan
             state.validation_x.clear()
             state.validation_y.clear()
-            # Generate a simple time axis for the plot
-            t = np.linspace(0, float(tr.stats.npts / tr.stats.sampling_rate), tr.stats.npts)
-            for i, step in enumerate(steps_array):
-                if i < state.max_points:
-                    state.validation_x.append(t[i])
-                    state.validation_y.append(step)
+            # la traza completa en max_points puntos, a 500 Hz los primeros 500 serian 1 s
+            stride = max(1, -(-len(steps_array) // state.max_points))
+            state.validation_x.extend((np.arange(0, len(steps_array), stride) / state.command_rate).tolist())
+            state.validation_y.extend(steps_array[::stride].tolist())
+
+    def poll_tracking(self):
+        """
+        Feeds the new telemetry to the running tracking analysis (GUI loop).
+        Measured positions are kept with the same stride as validation_x/y.
+        """
+        tracking = state.tracking
+        if tracking is None:
+            return
+        periods, measured = tracking.poll(state.telemetry)
+        if len(periods) == 0:
+            return
+        stride = max(1, -(-len(tracking.positions) // state.max_points))
+        keep = periods % stride == 0
+        with state.data_lock:
+            state.tracking_x.extend((periods[keep] * tracking.sample_interval).tolist())
+            state.tracking_y.extend(measured[keep].tolist())
 
     def run_sismo_thread(self):
         """
@@ -210,36 +454,76 @@ class SeismicProcessor:
             print("Serial not connected")
             return
             
-        if not state.seismic_trace:
+        plan = state.playback_plan
+        if not plan:
             print("No trace loaded")
             return
 
+        # no arrancar un plan que satura el enlace serial
+        try:
+            check_plan(plan, state.ser_manager.baudrate)
+        except LinkBudgetError as e:
+            state.log_send.note(f"Plan rechazado: {e}")
+            return
+
         state.wave_running = True
-        period=1.0 / sampling_rate
-        start_time = time.time()
+        state.commanded_position = 0  # el plan se compilo desde el origen
+        ser_manager = state.ser_manager
+        state.log_send.note(f"Playback: {len(plan)} commands, {plan.duration:.1f}s, "
+                            f"{plan.encoding} {plan.bytes_per_command:.1f} B/cmd")
+
+        def send_sample(i: int):
+            # deltas atrasados se suman al coalescer, nunca se descartan
+            ser_manager.write_raw(plan.command(i), relative=plan.relative)
+            state.commanded_position = plan.commanded_position(i)
         
-        # Go through the tuple of steps
-        for i, target_step in enumerate(state.seismic_trace):
-            if not state.wave_running:
-                break
-            
-            # Send command (assuming 'm' is absolute move)
-            cmd = f"m{target_step}" 
-            state.ser_manager.send(cmd)
-            #state.playback_index = i
-            
-            # Precise timing
-            elapsed = time.time() - start_time
-            expected_next_time = (i + 1) * period
-            sleep_time = expected_next_time - elapsed
-            
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+        # analisis en linea: error de seguimiento y retardo del encoder contra el plan
+        _, last_degrees, _ = state.telemetry.latest(1)
+        tracking = TrackingAnalyzer(plan.positions, plan.sample_interval, time.perf_counter() - state.start_time,
+                                    float(last_degrees[-1]) if len(last_degrees) else 0.0)
+        tracking.start_at(state.telemetry)
+        with state.data_lock:
+            state.tracking = tracking
+            state.tracking_x.clear()
+            state.tracking_y.clear()
+        
+        # modo tiempo real: cores dedicados, prioridad y GC congelado solo durante la reproduccion
+        mode = "realtime" if state.realtime_mode else "normal"
+        realtime = RealtimeMode(ser_manager.io_threads()) if state.realtime_mode else nullcontext()
+        
+        # Go through the precompiled commands, only slicing and writing.
+        # Deadlines are absolute, so the write time never adds to the period.
+        # The controller adds pause/resume/seek on top, the GUI drives it
+        controller = PlaybackController(
+            plan, send_sample, lambda data: ser_manager.write_raw(data, relative=plan.relative),
+            should_stop=lambda: not state.wave_running or state.ser_manager is not ser_manager,
+            on_segment=lambda index, t0: tracking.rebase(index, t0 - state.start_time),
+            on_hold=tracking.hold,
+        )
+        state.playback_controller = controller
+        with realtime:
+            stats = controller.run()
         
         state.wave_running = False
+        state.playback_controller = None
+        state.commanded_position = controller.commanded
+        # volver al origen: con m/d relativos un m0 no mueve nada y el desvio
+        # se acumularia en la siguiente reproduccion, que cuenta desde 0
+        ser_manager.write_raw(plan.home(controller.commanded), coalesce=False)
+        if plan.inserts:
+            # devolver los limites de setup() del firmware, los del ultimo tramo pueden ser muy bajos
+            ser_manager.send(f"s{MAX_SPEED_HZ}\n")
+            ser_manager.send(f"a{MAX_ACCELERATION}\n")
+        state.playback_jitter[mode] = stats.summary()
         print("Seismic Playback Finished.")
-        with state.data_lock:
-            state.log_send.append("Playback Finished.")
-            state.log_dirty = True
+        state.log_send.note(f"Playback Finished. {stats.summary()} | commanded {state.commanded_position} steps")
+        state.commanded_position = 0
+        self.poll_tracking()  # los ultimos puntos tambien van al grafico de seguimiento
+        state.log_send.note(tracking.summary())
+        if isinstance(realtime, RealtimeMode):
+            state.log_send.note(realtime.summary())
+        # el ultimo resultado de cada modo, para comparar
+        for name, summary in state.playback_jitter.items():
+            state.log_send.note(f"  {name}: {summary}")
 
 processor = SeismicProcessor()
\ No newline at end of file
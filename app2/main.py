@@ -1,8 +1,15 @@
 from typing import Protocol, Any, cast
 import dearpygui.dearpygui as _dpg # type: ignore
 import time
+import os
+import sys
+# la raiz del repo tiene el paquete shared/ con el codigo comun a app y app2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from state import state
-from logic import (find_serial_ports, SerialManager,processor)
+from logic import (find_serial_ports, SerialManager, ReplayManager, processor)
+from shared.session_recorder import session_file_name, FILE_EXTENSION
+from shared.playback_plan import ENCODINGS
+from shared.upsampler import COMMAND_RATES, METHODS
 import threading
 
 """falta definir si el thread de lectura lo dejamos en la clase de la conexion serial, lo arrancamos directamente en el gui
@@ -28,7 +35,7 @@ class DPGProtocol(Protocol):
     # Widgets
     def add_button(self,tag:str=...,label: str = ..., width:int=...,show: bool= ..., callback: Any = ... ) -> None: ...
     def add_text(self, label: str = ...,tag:str=...) -> None: ...
-    def add_checkbox(self, label: str = ..., tag: str | int = ..., callback: Any = ...) -> None: ...
+    def add_checkbox(self, label: str = ..., tag: str | int = ..., default_value: bool = ..., callback: Any = ...) -> None: ...
     def add_separator(self, tag: str | int = ...) -> None: ...
     def add_combo(self, items: list[str] = ..., tag: str | int = ..., width: int = ..., default_value: str = ..., callback: Any = ...) -> None: ...
     def add_input_text(self, tag: str | int = ..., multiline: bool = ..., readonly: bool = ..., width: int = ..., height: int = ..., on_enter: bool = ..., callback: Any = ...) -> None: ...
@@ -36,7 +43,7 @@ class DPGProtocol(Protocol):
     def add_slider_float(self,default_value: float, min_value: float, max_value: float, label: str = ..., tag: str | int = ...,format: str = ... , width:int = ...) -> None: ...
 
     # Item Manipulation
-    def configure_item(self, item: str | int, show: bool = ..., items: list[str] = ..., enabled: bool = ... , width: int = ... ,height: int = ...,label:str=...)-> None: ...
+    def configure_item(self, item: str | int, show: bool = ..., items: list[str] = ..., enabled: bool = ... , width: int = ... ,height: int = ...,label:str=..., max_value: float = ...)-> None: ...
     def does_item_exist(self, item: str | int) -> bool: ...
     def enable_item(self, item: str | int) -> None: ...
     def disable_item(self, item: str | int) -> None: ...
@@ -48,6 +55,7 @@ class DPGProtocol(Protocol):
     def add_item_resize_handler(self,callback:Any)-> None:...
     def show_item(self,tag:str)->None:...
     def is_item_shown(self, item: int|str)-> bool:...
+    def is_item_visible(self, item: int|str)-> bool:...
     def get_item_label(self,tag:str)->str:...
 
     #plot
@@ -68,7 +76,12 @@ class DPGProtocol(Protocol):
 
 dpg: DPGProtocol = cast(DPGProtocol, _dpg)
 
+SESSIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+REPLAY_SPEEDS = {"1x": 1.0, "4x": 4.0, "max": 0.0}
+
 available_traces_list: list[str] = [] 
+rendered_log_versions: dict[str, int] = {}
+seek_range: dict[str, float] = {}  # duracion del plan ya aplicada al seek_slider
 
 def update_ui_for_connection_state():
     if state.ser_manager:
@@ -97,22 +110,37 @@ def update_ui_for_connection_state():
 def connect_callback():
     port: str = str(dpg.get_value("ports_combo"))
     baudrate: int = int(dpg.get_value("baud_rate_combo"))
+    backend: str = str(dpg.get_value("backend_combo"))
+    record_path = session_file_name(SESSIONS_FOLDER) if dpg.get_value("record_checkbox") else None
     if port and baudrate:
-        state.ser_manager = SerialManager(port, baudrate)
+        state.ser_manager = SerialManager(port, baudrate, backend=backend, record_path=record_path)
+        if state.ser_manager.serial_port is None:
+            state.ser_manager = None  # no se pudo abrir el puerto, ya quedo en el log
         update_ui_for_connection_state()
+        state.telemetry.clear()
         with state.data_lock:
-            state.monitor_x.clear() 
-            state.monitor_y.clear()
             state.validation_x.clear()
             state.validation_y.clear()
-        state.start_time = time.time()
+        state.start_time = time.perf_counter()
 
 def disconnect_callback():
-    if state.ser_manager and state.ser_manager.serial_port.is_open:
+    if state.ser_manager:
         state.ser_manager.close()
         state.ser_manager= None
     update_ui_for_connection_state()
 
+def replay_callback(sender:Any, app_data:Any):
+    """reproduce una sesion grabada como si fuera la mesa conectada"""
+    if 'file_path_name' not in app_data:
+        return
+    if state.ser_manager:
+        state.ser_manager.close()
+    state.telemetry.clear()
+    state.start_time = time.perf_counter()
+    speed = REPLAY_SPEEDS[str(dpg.get_value("replay_speed_combo"))]
+    state.ser_manager = ReplayManager(app_data['file_path_name'], speed)
+    update_ui_for_connection_state()
+
 def refresh_ports_callback():
     if dpg.does_item_exist("ports_combo"):
         dpg.configure_item("ports_combo", items=find_serial_ports())
@@ -124,6 +152,50 @@ def send_command_callback():
         if dpg.does_item_exist("command_input"):
             dpg.set_value("command_input", "")
 
+def log_rx_callback(sender:Any, app_data:bool):
+    # a 1 kHz el log de recepcion se puede apagar, el plot sigue igual
+    state.log_read.enabled = bool(app_data)
+
+def encoding_callback(sender:Any, app_data:str):
+    # recodifica el plan cargado, los pasos no cambian
+    state.plan_encoding = str(app_data)
+    if not state.wave_running:
+        processor.build_plan()
+
+def command_rate_callback(sender:Any, app_data:str):
+    state.command_rate = float(app_data)
+    if not state.wave_running:
+        processor.build_plan()
+
+def interpolation_callback(sender:Any, app_data:str):
+    state.interpolation = str(app_data)
+    if not state.wave_running:
+        processor.build_plan()
+
+def feedforward_callback(sender:Any, app_data:bool):
+    state.feedforward = bool(app_data)
+    if not state.wave_running:
+        processor.build_plan()
+
+def realtime_callback(sender:Any, app_data:bool):
+    state.realtime_mode = bool(app_data)
+
+def pause_callback():
+    controller = state.playback_controller
+    if controller is None:
+        return
+    if controller.paused:
+        controller.resume()
+    else:
+        controller.pause()
+    dpg.configure_item("pause_button", label="Resume" if controller.paused else "Pause")
+
+def seek_callback():
+    # la mesa va suave hasta la posicion del plan y sigue (o queda en pausa)
+    controller = state.playback_controller
+    if controller is not None:
+        controller.seek(float(dpg.get_value("seek_slider")))
+
 def start_wave_callback():
     print("arranco la wave, o se detuvo dependiendo del estado ")
     if state.ser_manager:
@@ -158,15 +230,35 @@ def file_callback(sender:Any, app_data:Any):
             dpg.fit_axis_data("y_axis_comp2")
 
 def update_gui_callbacks():
+    # Actualizar gráfica Monitor (Tiempo Real), el ring buffer no necesita el lock
+    monitor_t, monitor_y, _ = state.telemetry.latest(state.max_points)
+    processor.poll_tracking()
+    if len(monitor_t) > 0 and dpg.does_item_exist("series_real_comp"):
+        dpg.set_value("series_real_comp", [monitor_t.tolist(), monitor_y.tolist()])
+        dpg.fit_axis_data("x_axis_comp")
+        dpg.fit_axis_data("y_axis_comp")
     with state.data_lock:
         if not state.wave_running and dpg.does_item_exist("start_wave_button"):
             if dpg.get_item_label("start_wave_button") == "Stop":
                 dpg.configure_item("start_wave_button", label="Play")
-        # Actualizar gráfica Monitor (Tiempo Real)
-        if len(state.monitor_x) > 0 and dpg.does_item_exist("series_real_comp"):
-            dpg.set_value("series_real_comp", [list(state.monitor_x), list(state.monitor_y)])
-            dpg.fit_axis_data("x_axis_comp")
-            dpg.fit_axis_data("y_axis_comp")
+                dpg.configure_item("pause_button", label="Pause")
+        plan = state.playback_plan
+        if plan is not None and seek_range.get("duration") != plan.duration and dpg.does_item_exist("seek_slider"):
+            dpg.configure_item("seek_slider", max_value=plan.duration)
+            seek_range["duration"] = plan.duration
+        if state.playback_controller is not None and dpg.does_item_exist("playback_time_text"):
+            dpg.set_value("playback_time_text", f"{state.playback_controller.position:.1f} s")
+        if state.ser_manager and dpg.does_item_exist("rx_rate_text"):
+            status = f"{state.rx_lines_per_s:.0f} lines/s | {state.ser_manager.sample_clock.summary()}"
+            if state.ser_manager.writer:
+                status += f" | {state.ser_manager.writer.summary()}"
+            dpg.set_value("rx_rate_text", status)
+
+        # Validación: posición medida de la reproducción sobre la esperada
+        if len(state.tracking_x) > 0 and dpg.does_item_exist("series_real_comp2"):
+            dpg.set_value("series_real_comp2", [list(state.tracking_x), list(state.tracking_y)])
+        if state.tracking is not None and dpg.does_item_exist("tracking_text"):
+            dpg.set_value("tracking_text", state.tracking.summary())
 
         # Actualizar gráfica Validación (Esperada vs Real)
         # if len(state.validation_x) > 0 and dpg.does_item_exist("series_expected_comp2"):
@@ -178,17 +270,17 @@ def update_gui_callbacks():
         # if (state.y_data or state.expected_wave_data) and dpg.does_item_exist("x_axis_comp"):
         #     dpg.fit_axis_data("x_axis_comp")
         #     dpg.fit_axis_data("y_axis_comp")
-        
-        if state.log_dirty:
-            if dpg.does_item_exist("console_recv_output"):
-                dpg.set_value("console_recv_output", "\n".join(state.log_read))
-            if dpg.does_item_exist("console_send_output"): 
-                dpg.set_value("console_send_output", "\n".join(state.log_send))
-            if dpg.does_item_exist("console_recv_container"): 
-                dpg.set_y_scroll("console_recv_container", -1.0)
-            if dpg.does_item_exist("console_send_container"): 
-                dpg.set_y_scroll("console_send_container", -1.0)
-            state.log_dirty = False
+
+    # Consolas: los logs se guardan crudos, solo se formatean si cambiaron y se estan viendo
+    for output, container, log in (("console_recv_output", "console_recv_container", state.log_read),
+                                   ("console_send_output", "console_send_container", state.log_send)):
+        if rendered_log_versions.get(output) == log.version or not dpg.does_item_exist(output):
+            continue
+        if not dpg.is_item_visible(container):
+            continue
+        dpg.set_value(output, log.render())
+        dpg.set_y_scroll(container, -1.0)
+        rendered_log_versions[output] = log.version
  
 def update_plot_sizes():##the function that updates the plot sizes when the window is resized
     if dpg.does_item_exist("main_window"):
@@ -210,17 +302,35 @@ def create_gui():
             dpg.add_button(label="Refresh", callback=refresh_ports_callback)
             dpg.add_text("Baud Rate")
             dpg.add_combo(["9600", "57600", "115200","230400","250000","921600"], tag="baud_rate_combo", default_value="250000", width=100)
+            dpg.add_combo(["thread", "asyncio"], tag="backend_combo", default_value="thread", width=80)
             dpg.add_button(label="Connect", tag="connect_button", callback=connect_callback, width=100)
             dpg.add_button(label="Disconnect", tag="disconnect_button", callback=disconnect_callback, width=100, show=False)
             dpg.add_text("no file selected",tag="file_text")
+            dpg.add_text("0 lines/s",tag="rx_rate_text")
             dpg.add_button(label="Directory Selector", callback=lambda: dpg.configure_item("file_dialog_id",show=not dpg.is_item_shown("file_dialog_id")))
             with dpg.file_dialog(directory_selector=False, show=False, callback=file_callback, tag="file_dialog_id", width=700 ,height=400):
                 dpg.add_file_extension(".miniseed")
                 dpg.add_file_extension("", color=(150, 255, 150, 255))
         with dpg.group(horizontal=True):
             dpg.add_button(label="play", tag="start_wave_button", callback=start_wave_callback, width=100)
+            dpg.add_button(label="Pause", tag="pause_button", callback=pause_callback, width=70)
+            dpg.add_slider_float(label="", tag="seek_slider", default_value=0.0, min_value=0.0, max_value=1.0, format="%.1f s", width=150)
+            dpg.add_button(label="Seek", callback=seek_callback)
+            dpg.add_text("", tag="playback_time_text")
             dpg.add_slider_int(label="Amplitude", tag="amplitude_slider", default_value=1600, min_value=100, max_value=10000,width=200)
             dpg.add_slider_float(label="Frequency", tag="frequency_slider", default_value=0.5, min_value=0.1, max_value=5.0, format="%.2f Hz", width=200) 
+            dpg.add_combo([str(rate) for rate in COMMAND_RATES], tag="command_rate_combo", default_value=str(int(state.command_rate)), width=60, callback=command_rate_callback)
+            dpg.add_text("Hz")
+            dpg.add_combo(list(METHODS), tag="interpolation_combo", default_value=state.interpolation, width=100, callback=interpolation_callback)
+            dpg.add_combo(list(ENCODINGS), tag="encoding_combo", default_value=state.plan_encoding, width=90, callback=encoding_callback)
+            dpg.add_checkbox(label="Feed-forward s/a", tag="feedforward_checkbox", callback=feedforward_callback)
+            dpg.add_checkbox(label="Real-time", tag="realtime_checkbox", callback=realtime_callback)
+            dpg.add_text("", tag="tracking_text")
+            dpg.add_checkbox(label="Record session", tag="record_checkbox")
+            dpg.add_button(label="Replay", callback=lambda: dpg.configure_item("replay_dialog_id",show=not dpg.is_item_shown("replay_dialog_id")))
+            dpg.add_combo(list(REPLAY_SPEEDS), tag="replay_speed_combo", default_value="1x", width=60)
+            with dpg.file_dialog(directory_selector=False, show=False, callback=replay_callback, tag="replay_dialog_id", width=700 ,height=400):
+                dpg.add_file_extension(FILE_EXTENSION)
         # with dpg.group(horizontal=True):
         #     dpg.add_input_int(label="Speed (s)", tag="speed_input", default_value=50000)
         #     dpg.add_input_int(label="Acceleration (a)", tag="accel_input", default_value=20000)
@@ -243,6 +353,7 @@ def create_gui():
             with dpg.group(width=400):
                 dpg.add_input_text(tag="command_input", on_enter=True, callback=send_command_callback)
                 dpg.add_button(label="Send Command", tag="send_command_button", callback=send_command_callback)
+                dpg.add_checkbox(label="Log RX stream", tag="log_rx_checkbox", default_value=True, callback=log_rx_callback)
                 with dpg.child_window(tag="console_send_container", height=-1, border=True):
                     dpg.add_input_text(tag="console_send_output", multiline=True, readonly=True, width=-1, height=-1)
             with dpg.child_window(tag="console_recv_container", height=-1,width=-1, border=True):
@@ -268,7 +379,7 @@ def main():
     while dpg.is_dearpygui_running():
         update_gui_callbacks()
         dpg.render_dearpygui_frame()
-    if state.ser_manager and state.ser_manager.serial_port.is_open:
+    if state.ser_manager:
         state.ser_manager.close()
     state.running = False
     dpg.destroy_context()
@@ -1,9 +1,16 @@
 from collections import deque
 import threading
+from shared.telemetry import TelemetryRing
+from shared.log_store import LogStore
 from typing import TYPE_CHECKING
+import numpy as np
+from numpy.typing import NDArray
 
 if TYPE_CHECKING:
     from logic import SerialManager 
+    from shared.playback_plan import CompiledPlan
+    from shared.tracking import TrackingAnalyzer
+    from shared.playback_controller import PlaybackController
 
 
 
@@ -20,30 +27,44 @@ class StateClass:
         self.is_file_selected_flag: bool =False
         self.file_path:str= ""
         self.seismic_trace: tuple[int, ...] = 0,  # The processed steps
+        self.playback_plan: CompiledPlan | None = None  # seismic_trace encoded as serial commands
+        self.trace_steps: NDArray[np.float64] | None = None  # traza en pasos a su frecuencia original
+        self.trace_rate: float = 0
+        self.trace_key: str = ""  # clave de la cache de remuestreo
+        self.trace_id: str = ""  # id@starttime de la traza del archivo, para la cache de trayectorias
+        self.command_rate: float = 20.0  # comandos por segundo del plan, ver shared/upsampler.py
+        self.interpolation: str = "bandlimited"  # linear, cubic o bandlimited
+        self.feedforward: bool = False  # s/a por ventana intercalados en el plan, ver shared/motion_limits.py
+        self.plan_encoding: str = "absolute"  # absolute, delta o varint, ver shared/playback_plan.py
+        self.playback_controller: PlaybackController | None = None  # pausa/reanudar/seek del play en curso
+        self.commanded_position: int = 0  # pasos que el firmware tiene como objetivo segun lo enviado
+        self.realtime_mode: bool = False  # cores dedicados, prioridad y GC congelado durante el play
+        self.playback_jitter: dict[str, str] = {}  # ultimo resumen de latencia por modo (normal/realtime)
         #  self.playback_index: int = 0        # Where we are (0 to len-1)
         
         # Plots (Stateful data)
         self.data_lock = threading.Lock()
         self.max_points = 500
-        self.monitor_x: deque[float] = deque(maxlen=self.max_points)
-        self.monitor_y: deque[float] = deque(maxlen=self.max_points)
+        self.telemetry = TelemetryRing()  # encoder history, sin lock (un solo escritor: el lector serial)
         self.validation_x: deque[float] = deque(maxlen=self.max_points)
         self.validation_y: deque[float] = deque(maxlen=self.max_points)
-        self.start_time: float = 0
+        self.tracking: TrackingAnalyzer | None = None  # error y retardo de la ultima reproduccion
+        self.tracking_x: deque[float] = deque(maxlen=self.max_points)
+        self.tracking_y: deque[float] = deque(maxlen=self.max_points)
+        self.start_time: float = 0  # time.perf_counter() al conectar, origen del eje de tiempo
+        self.rx_lines_per_s: float = 0
 
         # Logs
-        self.log_dirty:bool = False
-        self.log_read: deque[str]  = deque(maxlen=100)
-        self.log_send: deque[str]  = deque(maxlen=100)
+        self.log_read = LogStore(maxlen=100)
+        self.log_send = LogStore(maxlen=100)
 
         # Custom Wave
         self.amplitude = 0
         self.frequency = 0
 
     def reset_plots(self):
+        self.telemetry.clear()
         with self.data_lock:
-            self.monitor_x.clear()
-            self.monitor_y.clear()
             self.start_time: float = 0
 
 state = StateClass()
\ No newline at end of file
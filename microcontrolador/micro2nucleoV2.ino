@@ -18,6 +18,9 @@ volatile int16_t last_raw = -1;
 const byte MAX_CHARS_COMMAND = 32;
 char receivedChars[MAX_CHARS_COMMAND];
 boolean newCommandReceived = false;
+// trama binaria 'd' + delta en varint zigzag (LEB128), sin '\n' al final
+const char DELTA_FRAME = 'd';
+int32_t binaryDelta = 0;
 
 void readEncoderTask(void *param) {
   TickType_t lastWake = xTaskGetTickCount();
@@ -66,7 +69,7 @@ void setup() {
     while (1) delay(1000);
   }
   Serial.println("Sistema inicializado. Listo para recibir comandos.");
-  Serial.println("Comandos: m<pos>, s<vel>, a<acel>, e<0/1>");
+  Serial.println("Comandos: m<pos>, s<vel>, a<acel>, e<0/1>, d<varint>");
   
   if (!encoder.detectMagnet()) {
     Serial.println("ADVERTENCIA: No se detecta iman");
@@ -93,6 +96,9 @@ void loop() {
       case 'm':
         stepper->move(data);
         break;
+      case DELTA_FRAME:
+        stepper->move(binaryDelta);
+        break;
       case 's':
         stepper->setSpeedInHz(data);
         break;
@@ -106,11 +112,31 @@ void loop() {
 
 void receiveSerialData() {
     static byte index = 0;
+    static bool inBinaryFrame = false;
+    static uint32_t varint = 0;
+    static byte shift = 0;
     char endMarker = '\n';
     char rc;
     while (Serial.available() > 0 && newCommandReceived == false) {
         rc = Serial.read();
-        if (rc != endMarker) {
+        if (inBinaryFrame) {
+            // 7 bits por byte, el bit alto indica que sigue otro byte
+            varint |= (uint32_t)(rc & 0x7F) << shift;
+            shift += 7;
+            if (!(rc & 0x80) || shift >= 35) {
+                binaryDelta = (int32_t)(varint >> 1) ^ -(int32_t)(varint & 1);
+                receivedChars[0] = DELTA_FRAME;
+                receivedChars[1] = '\0';
+                inBinaryFrame = false;
+                varint = 0;
+                shift = 0;
+                newCommandReceived = true;
+            }
+        }
+        else if (rc == DELTA_FRAME && index == 0) {
+            inBinaryFrame = true;
+        }
+        else if (rc != endMarker) {
             receivedChars[index] = rc;
             index++;
             if (index >= MAX_CHARS_COMMAND) {
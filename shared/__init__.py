@@ -0,0 +1,4 @@
+# shared/
+# Modules used by both GUIs (app/ and app2/). They only work on plain data
+# (numpy arrays, bytes, serial ports) and never touch app_state / state, so
+# each app keeps wiring the results into its own shared state.
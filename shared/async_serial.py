@@ -0,0 +1,132 @@
+# async_serial.py
+# Event-driven serial transport: an asyncio loop in its own thread watches
+# the port's file descriptor with add_reader/add_writer, so nothing polls
+# in_waiting or spins while the link is idle. Only available where the
+# port exposes a selectable fd (Linux/macOS, including the virtual table);
+# on Windows COM ports the apps keep using their reader threads.
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+READ_SIZE = 1 << 16
+
+
+def supports_async(serial_port) -> bool:
+    """True when the port has a real fd the event loop can watch."""
+    if os.name != "posix":
+        return False
+    try:
+        return serial_port.fileno() >= 0
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+class AsyncSerialLink:
+    """
+    Readiness-driven reader/writer over an open pyserial port.
+
+    on_data(chunk, arrival_ns) is called from the loop thread for every
+    read, with the perf_counter_ns() taken right after the bytes came in.
+    write() can be called from any thread: the bytes are queued and flushed
+    when the fd is writable, so callers never block on the USB write.
+    """
+
+    def __init__(self, serial_port, on_data: Callable[[bytes, int], None],
+                 on_error: Callable[[Exception], None] | None = None):
+        self.serial_port = serial_port
+        self.fd = serial_port.fileno()
+        self.on_data = on_data
+        self.on_error = on_error
+        self.loop = asyncio.new_event_loop()
+        self._pending: deque[memoryview] = deque()
+        self._writer_armed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.wakeups = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        if not self.loop.is_closed() and self._thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=1)
+
+    def write(self, data: bytes | memoryview):
+        # copy: the caller may reuse its buffer before the loop gets to it
+        chunk = memoryview(bytes(data))
+        self.loop.call_soon_threadsafe(self._queue_write, chunk)
+
+    @property
+    def thread(self) -> threading.Thread:
+        return self._thread
+
+    @property
+    def queued_bytes(self) -> int:
+        return sum(len(chunk) for chunk in self._pending)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.add_reader(self.fd, self._on_readable)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.remove_reader(self.fd)
+            if self._writer_armed:
+                self.loop.remove_writer(self.fd)
+            self.loop.close()
+
+    def _fail(self, exc: Exception):
+        self.loop.remove_reader(self.fd)
+        if self.on_error:
+            self.on_error(exc)
+        self.loop.stop()
+
+    def _on_readable(self):
+        self.wakeups += 1
+        try:
+            chunk = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as exc:
+            self._fail(exc)
+            return
+        arrival_ns = time.perf_counter_ns()
+        if not chunk:
+            # device went away (EOF on a pty / unplugged adapter)
+            self._fail(OSError("serial port closed"))
+            return
+        self.bytes_read += len(chunk)
+        self.on_data(chunk, arrival_ns)
+
+    def _queue_write(self, chunk: memoryview):
+        self._pending.append(chunk)
+        self._flush()
+
+    def _flush(self):
+        while self._pending:
+            chunk = self._pending[0]
+            try:
+                written = os.write(self.fd, chunk)
+            except BlockingIOError:
+                written = 0
+            except OSError as exc:
+                self._fail(exc)
+                return
+            self.bytes_written += written
+            if written < len(chunk):
+                self._pending[0] = chunk[written:]
+                if not self._writer_armed:
+                    self.loop.add_writer(self.fd, self._flush)
+                    self._writer_armed = True
+                return
+            self._pending.popleft()
+        if self._writer_armed:
+            self.loop.remove_writer(self.fd)
+            self._writer_armed = False
@@ -0,0 +1,182 @@
+# batch.py
+# Stages a whole catalogue for playback from the command line instead of
+# one trace at a time from the GUI. Every trace of every record found is a
+# task for a ProcessPoolExecutor with one worker per core; each worker
+# reads its file, runs the same preparation as playback
+# (shared/trace_pipeline.prepare) and stores the result in the trajectory
+# cache the app reads, so the staged records start without any preparation.
+# With --export each trajectory is also written as its own .npz (steps,
+# sample_interval), shaped to the calibration profile when there is one.
+# The summary table (duration, peak steps, speed and acceleration the motor
+# needs) is printed and written as CSV.
+#
+#   python -m shared.batch [folders or files...] [--amplitude 1600] [--rate native] [--workers N] [--export folder]
+
+import argparse
+import csv
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from io import StringIO
+
+import numpy as np
+
+from shared.calibration import PROFILE_PATH, CalibrationProfile, load_profile, shape
+from shared.motion_limits import kinematics
+from shared.playlist import PlaylistItem, read_item_trace
+from shared.trace_pipeline import INTEGRATORS, NATIVE, TIME_DOMAIN, prepare
+from shared.trajectory_cache import TrajectoryCache
+from shared.upsampler import BANDLIMITED, METHODS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDS_FOLDER = os.path.join(ROOT, "app", "sismic_records")
+CACHE_FOLDER = os.path.join(ROOT, "trajectory_cache")       # the one app/app_state.py uses
+RECORD_EXTENSIONS = (".mseed", ".msd", ".miniseed")         # as the viewer's loader
+SUMMARY_FILE = "summary.csv"
+COLUMNS = ("file", "trace", "samples", "rate_hz", "duration_s", "peak_steps", "speed_hz", "accel_steps_s2",
+           "scale", "infeasible", "seconds", "cached", "error")
+
+
+def find_records(paths: list[str]) -> list[str]:
+    """Record files in the given folders (and the files given directly), sorted."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(RECORD_EXTENSIONS)]
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def list_items(files: list[str], amplitude: int, command_rate=NATIVE, interpolation: str = BANDLIMITED,
+               integrator: str = TIME_DOMAIN) -> list[PlaylistItem]:
+    """One item per trace, from the headers only; the workers read the samples. Unreadable files are skipped."""
+    from obspy import read
+    items = []
+    for path in files:
+        try:
+            stream = read(path, headonly=True)
+        except Exception as exc:
+            print(f"{path}: no se pudo leer ({exc}), se omite")
+            continue
+        for position, trace in enumerate(stream):
+            items.append(PlaylistItem(path, position, trace.id, amplitude, command_rate, interpolation,
+                                      integrator=integrator))
+    return items
+
+
+def stage_item(item: PlaylistItem, cache_folder: str | None = None, export_folder: str | None = None,
+               profile: CalibrationProfile | None = None) -> dict:
+    """Runs in a worker: prepares item into the cache and returns its summary row."""
+    warnings.simplefilter("ignore")  # ObsPy avisa cada vez que el pasa-banda cae en pasa-altos
+    start = time.perf_counter()
+    trace = read_item_trace(item)
+    cache = TrajectoryCache(cache_folder) if cache_folder else None
+    with redirect_stdout(StringIO()):  # the per-trace messages of the pipeline, the table says it all
+        steps, sample_interval = prepare(trace, item.amplitude, item.command_rate, item.interpolation,
+                                         cache=cache, file_path=item.file_path, integrator=item.integrator)
+    velocity, acceleration = kinematics(steps, sample_interval)
+    row = {
+        "file": os.path.basename(item.file_path),
+        "trace": item.trace_id,
+        "samples": len(steps),
+        "rate_hz": round(1.0 / sample_interval, 3),
+        "duration_s": round(len(steps) * sample_interval, 2),
+        "peak_steps": int(np.abs(steps).max(initial=0)),
+        "speed_hz": int(np.abs(velocity).max(initial=0)),
+        "accel_steps_s2": int(np.abs(acceleration).max(initial=0)),
+        "cached": bool(cache and cache.disk_hits),
+    }
+    if profile is not None:
+        steps, report = shape(steps, sample_interval, profile)
+        row.update(scale=round(report.scale, 3), infeasible=len(report.infeasible))
+    if export_folder:
+        name = f"{trace.id}_{trace.stats.starttime.strftime('%Y%m%dT%H%M%S')}.npz"
+        np.savez(os.path.join(export_folder, name), steps=steps, sample_interval=sample_interval,
+                 trace_id=item.trace_id, source=os.path.basename(item.file_path))
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def stage(items: list[PlaylistItem], cache_folder: str | None = CACHE_FOLDER, export_folder: str | None = None,
+          profile: CalibrationProfile | None = None, workers: int | None = None) -> list[dict]:
+    """
+    All items across a pool of workers (default one per core). Rows come
+    back in the order of items; a trace that fails gets a row with only
+    its error instead of stopping the batch.
+    """
+    if export_folder:
+        os.makedirs(export_folder, exist_ok=True)
+    rows: list[dict | None] = [None] * len(items)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(stage_item, item, cache_folder, export_folder, profile): index
+                   for index, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            item = items[index]
+            try:
+                rows[index] = future.result()
+            except Exception as exc:
+                rows[index] = {"file": os.path.basename(item.file_path), "trace": item.trace_id, "error": str(exc)}
+            print(f"[{done}/{len(items)}] {item.trace_id}" + (f" ERROR: {rows[index]['error']}" if "error" in rows[index] else ""))
+    return rows
+
+
+def format_table(rows: list[dict]) -> str:
+    lines = [f"{'trace':22s} {'samples':>8s} {'Hz':>6s} {'dur s':>8s} {'peak':>6s} {'speed Hz':>9s} "
+             f"{'accel':>9s} {'scale':>6s} {'time':>7s}"]
+    for row in rows:
+        if "error" in row:
+            lines.append(f"{row['trace']:22s} error: {row['error']}")
+            continue
+        scale = f"{row['scale']:6.3f}" if "scale" in row else f"{'-':>6s}"
+        timing = "cached" if row["cached"] else f"{row['seconds']:6.2f}s"
+        lines.append(f"{row['trace']:22s} {row['samples']:8d} {row['rate_hz']:6g} {row['duration_s']:8.1f} "
+                     f"{row['peak_steps']:6d} {row['speed_hz']:9d} {row['accel_steps_s2']:9d} {scale} {timing:>7s}")
+    return "\n".join(lines)
+
+
+def write_summary(rows: list[dict], path: str):
+    with open(path, "w", newline="") as target:
+        writer = csv.DictWriter(target, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare every trace of a records folder for playback, in parallel.")
+    parser.add_argument("paths", nargs="*", help=f"record folders or files (default: {RECORDS_FOLDER})")
+    parser.add_argument("--amplitude", type=int, default=1600)
+    parser.add_argument("--rate", default=NATIVE, help="command rate in Hz, or native")
+    parser.add_argument("--interpolation", choices=METHODS, default=BANDLIMITED)
+    parser.add_argument("--integrator", choices=INTEGRATORS, default=TIME_DOMAIN)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--cache", default=CACHE_FOLDER, help="trajectory cache folder the apps read")
+    parser.add_argument("--export", help="also write one ready-to-play .npz per trace here")
+    parser.add_argument("--profile", default=PROFILE_PATH, help="calibration profile, shapes the exported steps")
+    parser.add_argument("--summary", help=f"CSV summary (default: {SUMMARY_FILE} in the export or cache folder)")
+    args = parser.parse_args()
+
+    files = find_records(args.paths or [RECORDS_FOLDER])
+    items = list_items(files, args.amplitude, args.rate, args.interpolation, args.integrator)
+    profile = load_profile(args.profile)
+    print(f"{len(items)} traces in {len(files)} files, {args.workers or os.cpu_count()} workers"
+          + (f" | {profile.summary()}" if profile else ""))
+    start = time.perf_counter()
+    rows = stage(items, args.cache, args.export, profile, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(format_table(rows))
+    work = sum(row.get("seconds", 0) for row in rows)
+    print(f"{len(rows)} traces in {elapsed:.2f} s ({work:.2f} s of work)")
+    summary = args.summary or os.path.join(args.export or args.cache, SUMMARY_FILE)
+    os.makedirs(os.path.dirname(os.path.abspath(summary)), exist_ok=True)
+    write_summary(rows, summary)
+    print(f"summary: {summary}")
+    raise SystemExit(1 if any("error" in row for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# calibration.py
+# Speed/acceleration envelope of the table as measured by
+# "utilities/python calibrador_pasivo.py", and the shaping stage that keeps
+# a trajectory inside it. The calibrator finds, for each acceleration it
+# tries, the highest speed at which a move still ends on target; the
+# profile stores those pairs as JSON next to the repo root. A trajectory
+# sample is feasible when its speed is below what some calibrated
+# acceleration at least as high as the sample's still sustains (a
+# staircase envelope, with a safety factor on both axes).
+#
+# Speed and acceleration scale with the amplitude, so the largest usable
+# scale is found by bisection over a vectorized check of the whole
+# trajectory; the report lists exactly which samples were infeasible at
+# full scale.
+#
+#   python -m shared.calibration [--profile calibration_profile.json] [files...]
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import warnings
+
+import numpy as np
+from numpy.typing import NDArray
+
+from shared.motion_limits import SMOOTHING, kinematics
+
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "calibration_profile.json")
+PROFILE_VERSION = 1
+SAFETY = 0.8                # fraction of the calibrated limits a trajectory may use
+MAX_RUNS = 5                # infeasible stretches listed by ShapingReport.summary()
+
+
+class CalibrationProfile:
+    """
+    Calibrated acceleration (steps/s^2) -> highest sustainable speed (Hz) pairs.
+
+    speed_limit() and infeasible() take whole arrays; the envelope is the
+    suffix maximum of the speeds over the sorted accelerations, so a
+    sample may use the speed of any calibrated acceleration above its own.
+    """
+
+    def __init__(self, points: dict, steps_per_revolution: int | None = None,
+                 created: str | None = None, source: str | None = None):
+        pairs = sorted((int(accel), int(speed)) for accel, speed in points.items())
+        if not pairs:
+            raise ValueError("el perfil de calibración no tiene puntos")
+        self.accelerations = np.array([accel for accel, _ in pairs], dtype=np.float64)
+        self.speeds = np.array([speed for _, speed in pairs], dtype=np.float64)
+        self.envelope = np.maximum.accumulate(self.speeds[::-1])[::-1]
+        self.steps_per_revolution = steps_per_revolution
+        self.created = created or datetime.datetime.now().isoformat(timespec="seconds")
+        self.source = source    # serial port the calibration ran on
+
+    @property
+    def max_acceleration(self) -> float:
+        return float(self.accelerations[-1])
+
+    @property
+    def max_speed(self) -> float:
+        return float(self.envelope[0])
+
+    def speed_limit(self, acceleration, safety: float = SAFETY) -> NDArray[np.float64]:
+        """Highest usable speed at each |acceleration|; -1 beyond the calibrated range."""
+        index = np.searchsorted(self.accelerations * safety, np.abs(acceleration), side="left")
+        limits = np.append(self.envelope * safety, -1.0)
+        return limits[index]
+
+    def infeasible(self, positions, sample_interval: float, safety: float = SAFETY,
+                   smoothing: float = SMOOTHING) -> tuple[NDArray[np.bool_], NDArray[np.bool_]]:
+        """(too fast, too sharp) masks over positions sent every sample_interval."""
+        velocity, acceleration = kinematics(positions, sample_interval, smoothing)
+        too_sharp = np.abs(acceleration) > self.max_acceleration * safety
+        too_fast = ~too_sharp & (np.abs(velocity) > self.speed_limit(acceleration, safety))
+        return too_fast, too_sharp
+
+    def to_dict(self) -> dict:
+        return {
+            "version": PROFILE_VERSION,
+            "created": self.created,
+            "source": self.source,
+            "steps_per_revolution": self.steps_per_revolution,
+            "points": [{"acceleration": int(accel), "max_speed": int(speed)}
+                       for accel, speed in zip(self.accelerations, self.speeds)],
+        }
+
+    def save(self, path: str = PROFILE_PATH):
+        temporary = path + ".tmp"
+        with open(temporary, "w") as target:
+            json.dump(self.to_dict(), target, indent=2)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str = PROFILE_PATH) -> "CalibrationProfile":
+        with open(path) as source:
+            data = json.load(source)
+        if data.get("version") != PROFILE_VERSION:
+            raise ValueError(f"{path}: versión de perfil {data.get('version')} no soportada")
+        points = {point["acceleration"]: point["max_speed"] for point in data["points"]}
+        return cls(points, data.get("steps_per_revolution"), data.get("created"), data.get("source"))
+
+    def summary(self) -> str:
+        return (f"calibration {self.created}: {len(self.accelerations)} points, "
+                f"accel up to {self.max_acceleration:.0f} steps/s^2, speed up to {self.max_speed:.0f} Hz")
+
+
+def load_profile(path: str = PROFILE_PATH) -> CalibrationProfile | None:
+    """The saved profile, or None when the table was never calibrated."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return CalibrationProfile.load(path)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"calibration: no se pudo leer {path} ({exc})")
+        return None
+
+
+def _runs(indices: NDArray[np.int64]) -> list[tuple[int, int]]:
+    """Consecutive indices as (first, last) pairs."""
+    if not len(indices):
+        return []
+    breaks = np.flatnonzero(np.diff(indices) > 1)
+    firsts = np.concatenate(([indices[0]], indices[breaks + 1]))
+    lasts = np.concatenate((indices[breaks], [indices[-1]]))
+    return list(zip(firsts.tolist(), lasts.tolist()))
+
+
+class ShapingReport:
+    """What shape() did: the scale it kept and the samples that were infeasible at full scale."""
+
+    def __init__(self, scale: float, peak: int, sample_interval: float,
+                 too_fast: NDArray[np.int64], too_sharp: NDArray[np.int64],
+                 peak_speed: float, peak_acceleration: float):
+        self.scale = scale
+        self.peak = peak                            # steps after shaping
+        self.sample_interval = sample_interval
+        self.too_fast = too_fast                    # sample indices over the speed envelope
+        self.too_sharp = too_sharp                  # sample indices over the calibrated acceleration
+        self.peak_speed = peak_speed                # needed at full scale
+        self.peak_acceleration = peak_acceleration
+
+    @property
+    def infeasible(self) -> NDArray[np.int64]:
+        return np.union1d(self.too_fast, self.too_sharp)
+
+    @property
+    def feasible(self) -> bool:
+        return not len(self.too_fast) and not len(self.too_sharp)
+
+    def _stretch(self, first: int, last: int) -> str:
+        if first == last:
+            return f"{first} ({first * self.sample_interval:.2f} s)"
+        return f"{first}-{last} ({first * self.sample_interval:.2f}-{last * self.sample_interval:.2f} s)"
+
+    def summary(self) -> str:
+        needed = f"needs {self.peak_speed:.0f} Hz / {self.peak_acceleration:.0f} steps/s^2"
+        if self.feasible:
+            return f"shaping: within the calibrated envelope at full scale ({needed})"
+        runs = _runs(self.infeasible)
+        listed = ", ".join(self._stretch(first, last) for first, last in runs[:MAX_RUNS])
+        if len(runs) > MAX_RUNS:
+            listed += f", ... {len(runs) - MAX_RUNS} more"
+        return (f"shaping: scale {self.scale:.3f} -> ±{self.peak} steps ({needed}); infeasible at full scale: "
+                f"{len(self.too_fast)} too fast, {len(self.too_sharp)} too sharp, samples {listed}")
+
+
+def shape(steps, sample_interval: float, profile: CalibrationProfile, safety: float = SAFETY,
+          smoothing: float = SMOOTHING) -> tuple[NDArray[np.int64], ShapingReport]:
+    """
+    Largest scale of steps (<= 1) that stays inside the profile's envelope.
+
+    Bisection between 0 (standing still is always feasible) and 1; every
+    probe rounds the scaled trajectory to whole steps and checks all of it
+    at once, and the bounds only move onto checked scales, so the scale
+    returned is one that passed. It stops when one more halving would
+    change the peak by less than a step.
+    """
+    steps = np.asarray(steps)
+    too_fast, too_sharp = profile.infeasible(steps, sample_interval, safety, smoothing)
+    velocity, acceleration = kinematics(steps, sample_interval, smoothing)
+    peak = int(np.abs(steps).max()) if len(steps) else 0
+    report = ShapingReport(1.0, peak, sample_interval, np.flatnonzero(too_fast), np.flatnonzero(too_sharp),
+                           float(np.abs(velocity).max(initial=0)), float(np.abs(acceleration).max(initial=0)))
+    if report.feasible:
+        return steps, report
+
+    low, high = 0.0, 1.0
+    best = np.zeros_like(steps)
+    while (high - low) * peak >= 1:
+        middle = 0.5 * (low + high)
+        candidate = np.rint(steps * middle).astype(steps.dtype)
+        fast, sharp = profile.infeasible(candidate, sample_interval, safety, smoothing)
+        if fast.any() or sharp.any():
+            high = middle
+        else:
+            low, best = middle, candidate
+    report.scale = low
+    report.peak = int(np.abs(best).max())
+    return best, report
+
+
+def main():
+    from contextlib import redirect_stdout
+    from io import StringIO
+    from obspy import read
+    from shared.trace_pipeline import prepare_for_playback
+
+    records = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "sismic_records")
+    parser = argparse.ArgumentParser(description="Check prepared records against the calibrated speed/acceleration envelope.")
+    parser.add_argument("files", nargs="*", help=f"miniSEED files (default: {records})")
+    parser.add_argument("--profile", default=PROFILE_PATH)
+    parser.add_argument("--amplitude", type=int, default=1600)
+    parser.add_argument("--safety", type=float, default=SAFETY)
+    args = parser.parse_args()
+
+    profile = CalibrationProfile.load(args.profile)
+    print(profile.summary())
+    warnings.simplefilter("ignore")
+    for path in args.files or sorted(glob.glob(os.path.join(records, "*.miniseed"))):
+        for trace in read(path):
+            with redirect_stdout(StringIO()):
+                steps, sample_interval = prepare_for_playback(trace, args.amplitude)
+            _, report = shape(steps, sample_interval, profile, args.safety)
+            print(f"{trace.id:22s} {report.summary()}")
+
+
+if __name__ == "__main__":
+    main()
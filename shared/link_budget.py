@@ -0,0 +1,161 @@
+# link_budget.py
+# Serial link budget: how many bytes per second the command stream of a
+# plan and the 1 kHz encoder text need, against what the UART can carry.
+# The UART is full duplex, so TX (commands) and RX (encoder) are budgeted
+# separately.
+#
+#   python -m shared.link_budget --baud 230400 --rate 500
+#   python -m shared.link_budget --port /dev/ttyUSB0 --baud 230400 --measure 3
+
+import argparse
+import time
+
+import numpy as np
+
+from shared.playback_plan import CompiledPlan
+
+BITS_PER_CHAR = 10              # 8N1: start + 8 data + stop
+ENCODER_RATE_HZ = 1000.0        # readEncoderTask, SAMPLE_MS = 1
+ENCODER_LINE_BYTES = 9          # println of e.g. "-123.45" + "\r\n"
+MAX_UTILIZATION = 0.8           # keep 20% headroom for jitter and manual commands
+
+
+class LinkBudgetError(ValueError):
+    """The plan would saturate the serial link."""
+
+
+def uart_bytes_per_s(baudrate: int) -> float:
+    return baudrate / BITS_PER_CHAR
+
+
+def plan_tx_rates(plan: CompiledPlan, window: float = 1.0) -> tuple[float, float]:
+    """Mean and worst 1 s window bytes/s of the plan's command stream."""
+    if len(plan) == 0:
+        return 0.0, 0.0
+    mean = len(plan.buffer) / plan.duration
+    per_window = max(int(round(window / plan.sample_interval)), 1)
+    if per_window >= len(plan):
+        return mean, mean
+    sizes = np.diff(plan.offsets)
+    moving = np.convolve(sizes, np.ones(per_window, dtype=np.int64), mode="valid")
+    return mean, float(moving.max()) / (per_window * plan.sample_interval)
+
+
+def max_command_rate(baudrate: int, bytes_per_command: float, utilization: float = MAX_UTILIZATION) -> float:
+    return uart_bytes_per_s(baudrate) * utilization / bytes_per_command
+
+
+class LinkBudget:
+    """Required vs available bytes/s for one plan on one baud rate."""
+
+    def __init__(self, baudrate: int, plan: CompiledPlan | None = None, command_rate_hz: float | None = None,
+                 bytes_per_command: float = 7.0, encoder_rate_hz: float = ENCODER_RATE_HZ,
+                 encoder_line_bytes: float = ENCODER_LINE_BYTES):
+        self.baudrate = baudrate
+        self.capacity = uart_bytes_per_s(baudrate)
+        if plan is not None and len(plan):
+            self.bytes_per_command = plan.bytes_per_command
+            self.command_rate_hz = 1.0 / plan.sample_interval
+            self.tx_mean, self.tx_peak = plan_tx_rates(plan)
+        else:
+            self.bytes_per_command = bytes_per_command
+            self.command_rate_hz = command_rate_hz or 0.0
+            self.tx_mean = self.tx_peak = self.command_rate_hz * bytes_per_command
+        self.rx_required = encoder_rate_hz * encoder_line_bytes
+        self.max_command_rate_hz = max_command_rate(baudrate, self.bytes_per_command)
+
+    @property
+    def tx_utilization(self) -> float:
+        return self.tx_peak / self.capacity
+
+    @property
+    def rx_utilization(self) -> float:
+        return self.rx_required / self.capacity
+
+    def check(self, limit: float = MAX_UTILIZATION):
+        if self.tx_utilization > limit:
+            raise LinkBudgetError(
+                f"{self.command_rate_hz:.0f} cmd/s needs {self.tx_peak:.0f} B/s, "
+                f"{self.tx_utilization:.0%} of {self.baudrate} baud (limit {limit:.0%}); "
+                f"max {self.max_command_rate_hz:.0f} cmd/s")
+        if self.rx_utilization > limit:
+            raise LinkBudgetError(
+                f"encoder stream needs {self.rx_required:.0f} B/s, "
+                f"{self.rx_utilization:.0%} of {self.baudrate} baud (limit {limit:.0%})")
+
+    def report(self) -> str:
+        return "\n".join([
+            f"link      {self.baudrate} baud = {self.capacity:.0f} B/s per direction",
+            f"tx        {self.command_rate_hz:.0f} cmd/s x {self.bytes_per_command:.1f} B = "
+            f"{self.tx_mean:.0f} B/s mean, {self.tx_peak:.0f} B/s peak ({self.tx_utilization:.0%})",
+            f"rx        encoder {self.rx_required:.0f} B/s ({self.rx_utilization:.0%})",
+            f"max rate  {self.max_command_rate_hz:.0f} cmd/s at {MAX_UTILIZATION:.0%} utilization",
+            f"headroom  tx {1 - self.tx_utilization:.0%}, rx {1 - self.rx_utilization:.0%}",
+        ])
+
+
+def check_plan(plan: CompiledPlan, baudrate: int | None, limit: float = MAX_UTILIZATION) -> LinkBudget | None:
+    """Raises LinkBudgetError if the plan would saturate the link; None when the baud is unknown."""
+    if not baudrate:
+        return None
+    budget = LinkBudget(baudrate, plan)
+    budget.check(limit)
+    return budget
+
+
+def measure_link(serial_port, seconds: float = 3.0) -> tuple[float, float]:
+    """
+    Achieved RX and TX bytes/s on an open port. RX is whatever the table
+    streams; TX floods "m0" (a zero relative move, the table stays still)
+    and counts what the port accepted.
+    """
+    serial_port.reset_input_buffer()
+    rx = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds / 2:
+        rx += len(serial_port.read(max(serial_port.in_waiting, 1)))
+    rx_rate = rx / (time.perf_counter() - start)
+
+    block = b"m0\n" * 64
+    tx = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds / 2:
+        tx += serial_port.write(block) or 0
+        serial_port.reset_input_buffer()
+    serial_port.flush()
+    tx_rate = tx / (time.perf_counter() - start)
+    return rx_rate, tx_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial link budget and command-rate advisor.")
+    parser.add_argument("--baud", type=int, default=230400)
+    parser.add_argument("--rate", type=float, default=500.0, help="planned command rate (cmd/s)")
+    parser.add_argument("--amplitude", type=int, default=1600, help="peak steps, sets the command size")
+    parser.add_argument("--port", help="measure the achieved throughput on this port")
+    parser.add_argument("--measure", type=float, default=3.0, help="measurement time (s)")
+    args = parser.parse_args()
+
+    # a sine at the planned rate gives a representative mix of command lengths
+    t = np.arange(0, 10, 1.0 / args.rate)
+    plan = CompiledPlan(np.round(args.amplitude * np.sin(2 * np.pi * 0.5 * t)), 1.0 / args.rate)
+    budget = LinkBudget(args.baud, plan)
+    print(budget.report())
+
+    if args.port:
+        import serial
+        with serial.Serial(args.port, args.baud, timeout=0.1) as port:
+            rx_rate, tx_rate = measure_link(port, args.measure)
+        print(f"measured  rx {rx_rate:.0f} B/s, tx {tx_rate:.0f} B/s")
+        print(f"          sustainable ~{tx_rate * MAX_UTILIZATION / budget.bytes_per_command:.0f} cmd/s")
+
+    try:
+        budget.check()
+        print("OK")
+    except LinkBudgetError as exc:
+        print(f"SATURATED: {exc}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
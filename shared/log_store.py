@@ -0,0 +1,68 @@
+# log_store.py
+# Console logs stored as compact records (monotonic time, direction, raw
+# data). Nothing is formatted when a command is sent or a line arrives;
+# the text is only built for the visible window when the GUI renders it.
+
+import time
+from collections import deque
+
+LOG_RX = "<<"
+LOG_TX = ">>"
+LOG_NOTE = ""   # status messages, shown without timestamp or arrow
+
+
+class LogStore:
+    """
+    Bounded log of (monotonic_ns, direction, data) records.
+
+    data is bytes or str and may hold several lines (a whole batch from the
+    bulk reader is one record). add() and stream() only append to a deque,
+    which is safe from any thread without a lock. stream() is for high-rate
+    traffic: it can be turned off with enabled or thinned with sample_every.
+    version changes on every new record so the GUI knows when to re-render.
+    """
+
+    def __init__(self, maxlen: int = 100, sample_every: int = 1):
+        self.maxlen = maxlen
+        self.sample_every = max(int(sample_every), 1)
+        self.enabled = True
+        self.version = 0
+        self._records: deque[tuple[int, str, bytes | str]] = deque(maxlen=maxlen)
+        self._stream_count = 0
+        self._wall_offset = time.time() - time.monotonic()
+
+    def add(self, direction: str, data: bytes | str):
+        self._records.append((time.monotonic_ns(), direction, data))
+        self.version += 1
+
+    def note(self, text: str):
+        self.add(LOG_NOTE, text)
+
+    def stream(self, direction: str, data: bytes | str):
+        """Like add() but honours enabled and sample_every."""
+        if not self.enabled:
+            return
+        self._stream_count += 1
+        if self._stream_count % self.sample_every == 0:
+            self.add(direction, data)
+
+    def clear(self):
+        self._records.clear()
+        self.version += 1
+
+    def render(self, lines: int | None = None) -> str:
+        """Formats the last lines lines (maxlen by default) as console text."""
+        lines = lines or self.maxlen
+        out: list[str] = []
+        for t_ns, direction, data in reversed(list(self._records)):
+            text = data.decode("utf-8", errors="replace") if isinstance(data, (bytes, bytearray, memoryview)) else data
+            parts = text.splitlines() or [""]
+            parts = parts[-(lines - len(out)):]
+            if direction == LOG_NOTE:
+                out.extend(reversed(parts))
+            else:
+                stamp = time.strftime("%H:%M:%S", time.localtime(self._wall_offset + t_ns / 1e9))
+                out.extend(f"[{stamp}] {direction} {part.strip()}" for part in reversed(parts))
+            if len(out) >= lines:
+                break
+        return "\n".join(reversed(out))
@@ -0,0 +1,118 @@
+# motion_limits.py
+# Feed-forward speed/acceleration scheduling. Instead of one s/a pair for
+# the whole record, the trajectory is cut in windows and each window gets
+# the peak speed and acceleration it (and the window after it) needs, with
+# some margin. New s/a commands are only emitted when the limits move by
+# more than a threshold, so the extra bytes on the link stay small; they
+# are interleaved in the compiled plan right before the first sample of
+# their window (see CompiledPlan(inserts=...)).
+
+import numpy as np
+from numpy.typing import NDArray
+
+WINDOW = 0.25               # s
+SMOOTHING = 0.02            # s, box filter on the velocity before differencing it
+MARGIN = 1.25               # headroom over the computed peak
+THRESHOLD = 0.2             # relative change that justifies a new s/a
+MIN_SPEED_HZ = 500          # never slower than this, the table still has to stop on target
+MIN_ACCELERATION = 5_000
+MAX_SPEED_HZ = 1_000_000    # setSpeedInHz() in micro2nucleoV2.ino setup()
+MAX_ACCELERATION = 10_000_000
+
+
+def _window_peaks(values: NDArray[np.float64], size: int) -> NDArray[np.float64]:
+    """Max of |values| in consecutive windows of size samples (last one padded)."""
+    count = -(-len(values) // size)
+    padded = np.zeros(count * size)
+    padded[:len(values)] = np.abs(values)
+    return padded.reshape(count, size).max(axis=1)
+
+
+class LimitSchedule:
+    """s/a updates for a trajectory: sample index where each applies and its values."""
+
+    def __init__(self, indices: NDArray[np.int64], speeds: NDArray[np.int64], accelerations: NDArray[np.int64]):
+        self.indices = indices
+        self.speeds = speeds
+        self.accelerations = accelerations
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def commands(self) -> dict[int, bytes]:
+        """Sample index -> b"s<speed>\\na<accel>\\n" to send right before that sample."""
+        return {i: b"s%d\na%d\n" % (s, a)
+                for i, s, a in zip(self.indices.tolist(), self.speeds.tolist(), self.accelerations.tolist())}
+
+    @property
+    def bytes(self) -> int:
+        return sum(map(len, self.commands().values()))
+
+    def summary(self) -> str:
+        if not len(self):
+            return "s/a: none"
+        return (f"s/a: {len(self)} updates, {self.bytes} B | speed {self.speeds.min()}-{self.speeds.max()} Hz, "
+                f"accel {self.accelerations.min()}-{self.accelerations.max()}")
+
+
+def kinematics(positions, sample_interval: float,
+               smoothing: float = SMOOTHING) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Per-sample speed (steps/s) and acceleration (steps/s^2) the motor needs
+    to follow positions sent every sample_interval.
+
+    Speed is what it takes to cover each per-sample step in one period,
+    acceleration the finite difference of that speed after a short box
+    filter, taken over the filter span, so the +-1 step rounding of the
+    targets does not show up as huge accelerations.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    if len(positions) == 0:
+        return np.zeros(0), np.zeros(0)
+    velocity = np.diff(positions, prepend=positions[0]) / sample_interval
+    box = max(int(round(smoothing / sample_interval)), 1)
+    smooth = np.convolve(velocity, np.ones(box) / box, mode="same")
+    # and differenced over the same span, a one-sample difference would amplify what is left
+    acceleration = np.zeros_like(smooth)
+    acceleration[box:] = (smooth[box:] - smooth[:-box]) / (box * sample_interval)
+    return velocity, acceleration
+
+
+def plan_limits(positions, sample_interval: float, window: float = WINDOW, margin: float = MARGIN,
+                threshold: float = THRESHOLD, min_speed: float = MIN_SPEED_HZ,
+                min_acceleration: float = MIN_ACCELERATION, max_speed: float = MAX_SPEED_HZ,
+                max_acceleration: float = MAX_ACCELERATION, smoothing: float = SMOOTHING) -> LimitSchedule:
+    """
+    Per-window speed/acceleration limits for positions (steps) sent every
+    sample_interval, from kinematics(). Each window takes the peak of
+    itself and the next window, so the limits are already raised when a
+    fast stretch starts.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    if len(positions) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return LimitSchedule(empty, empty, empty)
+    velocity, acceleration = kinematics(positions, sample_interval, smoothing)
+
+    size = max(int(round(window / sample_interval)), 1)
+    speed_peaks = _window_peaks(velocity, size)
+    accel_peaks = _window_peaks(acceleration, size)
+    # feed-forward: look one window ahead
+    speed_peaks[:-1] = np.maximum(speed_peaks[:-1], speed_peaks[1:])
+    accel_peaks[:-1] = np.maximum(accel_peaks[:-1], accel_peaks[1:])
+
+    speeds = np.clip(speed_peaks * margin, min_speed, max_speed).astype(np.int64)
+    accels = np.clip(accel_peaks * margin, min_acceleration, max_acceleration).astype(np.int64)
+
+    # hysteresis on the (few) windows: only resend when a limit moved enough.
+    # With margin > 1 + threshold a skipped update never leaves the raw peak above the limit sent
+    keep = np.zeros(len(speeds), dtype=bool)
+    keep[0] = True
+    last_speed, last_accel = speeds[0], accels[0]
+    for k in range(1, len(speeds)):
+        if (abs(speeds[k] - last_speed) > threshold * last_speed
+                or abs(accels[k] - last_accel) > threshold * last_accel):
+            keep[k] = True
+            last_speed, last_accel = speeds[k], accels[k]
+    indices = np.flatnonzero(keep) * size
+    return LimitSchedule(indices.astype(np.int64), speeds[keep], accels[keep])
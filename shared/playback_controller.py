@@ -0,0 +1,146 @@
+# playback_controller.py
+# Pause, resume and seek over a precompiled plan. The plan never changes:
+# pausing just stops the scheduler where it is (the table holds the last
+# target), resuming starts a new run of deadlines from the same index, and
+# seeking is an index lookup followed by a raised-cosine move from the
+# current commanded position to the one the plan expects there, so the
+# table never jumps.
+
+import math
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Callable
+
+import numpy as np
+
+from shared.playback_plan import CompiledPlan
+from shared.playback_scheduler import PlaybackScheduler, PlaybackStats
+
+TRANSITION_SPEED = 2000.0   # steps/s, peak speed of the seek move
+MIN_TRANSITION = 0.1        # s
+
+
+class PlaybackController:
+    """
+    Runs a plan from the calling thread with pause()/resume()/seek() from any other.
+
+    step(i) sends sample i (same contract as PlaybackScheduler.run), write()
+    sends extra bytes: the seek move and the s/a limits in effect at the
+    seek target. on_segment(index, t0) is called whenever timed playback
+    (re)starts at index, t0 being the perf_counter() at which sample 0
+    would have been sent; on_hold() whenever it stops.
+    """
+
+    def __init__(self, plan: CompiledPlan, step: Callable[[int], Any], write: Callable[[bytes], Any],
+                 should_stop: Callable[[], bool] = lambda: False, transition_speed: float = TRANSITION_SPEED,
+                 on_segment: Callable[[int, float], None] | None = None, on_hold: Callable[[], None] | None = None):
+        self.plan = plan
+        self._step = step
+        self._write = write
+        self._should_stop = should_stop
+        self.transition_speed = transition_speed
+        self.on_segment = on_segment
+        self.on_hold = on_hold
+        self.scheduler = PlaybackScheduler(plan.sample_interval)
+        self.index = 0                  # next sample to send
+        self.commanded = plan.origin    # position the table was last told to be at
+        self.paused = False
+        self._seek_to: int | None = None
+        self._stopped = False
+        self._wake = threading.Event()
+        self._insert_keys = sorted(plan.inserts)
+
+    # --- control, any thread ---------------------------------------------
+    @property
+    def position(self) -> float:
+        """Playback time (s) of the next sample."""
+        return self.index * self.plan.sample_interval
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self._wake.set()
+
+    def seek(self, seconds: float):
+        self._seek_to = min(max(int(round(seconds / self.plan.sample_interval)), 0), max(len(self.plan) - 1, 0))
+        self._wake.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    # --- playback thread -------------------------------------------------
+    def _interrupted(self) -> bool:
+        return self._stopped or self.paused or self._seek_to is not None or self._should_stop()
+
+    def _send(self, i: int):
+        self._step(i)
+        self.index = i + 1
+        self.commanded = self.plan.commanded_position(i)
+
+    def _skip(self, start: int, stop: int):
+        """Samples the scheduler dropped (SKIP policy): their summed delta still goes out."""
+        data = self.plan.skip(start, stop)
+        if data:
+            self._write(data)
+        self.commanded = self.plan.commanded_position(stop - 1)
+
+    def _target_before(self, index: int) -> int:
+        return self.plan.commanded_position(index - 1) if index > 0 else self.plan.origin
+
+    def _transition(self, target: int) -> bool:
+        """Raised-cosine move to target at the plan rate. False if stopped midway."""
+        distance = target - self.commanded
+        if distance == 0:
+            return True
+        duration = max(math.pi / 2 * abs(distance) / self.transition_speed, MIN_TRANSITION)
+        count = max(int(math.ceil(duration / self.plan.sample_interval)), 1)
+        u = np.arange(1, count + 1) / count
+        ramp = np.round(self.commanded + distance * (1 - np.cos(np.pi * u)) / 2).astype(np.int64)
+        move = CompiledPlan(ramp, self.plan.sample_interval, encoding=self.plan.encoding, origin=self.commanded)
+
+        def send(i: int):
+            self._write(move.command(i))
+            self.commanded = move.commanded_position(i)
+
+        def skip(start: int, stop: int):
+            self._write(move.skip(start, stop))
+            self.commanded = move.commanded_position(stop - 1)
+
+        self.scheduler.run(len(move), send, lambda: self._stopped or self._should_stop(), skipped=skip)
+        return self.commanded == target
+
+    def _limits_at(self, index: int) -> bytes | None:
+        """The s/a insert in effect at index, to resend after a seek."""
+        position = bisect_right(self._insert_keys, index) - 1
+        if position < 0 or self._insert_keys[position] == index:
+            return None  # none yet, or the sample itself carries it
+        return self.plan.inserts[self._insert_keys[position]]
+
+    def run(self) -> PlaybackStats:
+        segments: list[PlaybackStats] = []
+        while not (self._stopped or self._should_stop()) and self.index < len(self.plan):
+            if self._seek_to is not None:
+                target, self._seek_to = self._seek_to, None
+                limits = self._limits_at(target)
+                if limits:
+                    self._write(limits)
+                if not self._transition(self._target_before(target)):
+                    break
+                self.index = target
+                continue
+            if self.paused:
+                # timeout so an external stop (should_stop) is seen while paused
+                self._wake.wait(0.1)
+                self._wake.clear()
+                continue
+            if self.on_segment:
+                self.on_segment(self.index, time.perf_counter() - self.index * self.plan.sample_interval)
+            segments.append(self.scheduler.run(len(self.plan), self._send, self._interrupted, self.index,
+                                               skipped=self._skip))
+            if self.on_hold:
+                self.on_hold()
+        return PlaybackStats.combine(segments, self.plan.sample_interval)
@@ -0,0 +1,204 @@
+# playback_plan.py
+# Precompiled playback plans: every position command of a trace is encoded
+# once, when the trace is loaded, into a single contiguous bytes buffer.
+# The real-time loop only slices that buffer and writes it to the port.
+#
+# Encodings:
+#   absolute  b"m<target>\n"   target position of every sample (legacy)
+#   delta     b"m<delta>\n"    per-sample step delta, matches the firmware's
+#                              stepper->move(), which is relative
+#   varint    b"d" + varint    same delta as a zigzag LEB128 varint, 2-3
+#                              bytes instead of 4-7 (needs micro2nucleoV2.ino
+#                              with the 'd' frame)
+# In the relative encodings samples with a zero delta send nothing.
+# inserts adds extra commands (e.g. s/a limits) in front of given samples,
+# inside their slice, so they go out in the same write.
+
+import numpy as np
+from numpy.typing import NDArray
+
+ABSOLUTE = "absolute"
+DELTA = "delta"
+VARINT = "varint"
+ENCODINGS = (ABSOLUTE, DELTA, VARINT)
+DELTA_PREFIX = b"d"
+
+
+def zigzag(values: NDArray[np.int64]) -> NDArray[np.uint64]:
+    """Maps signed to unsigned so small magnitudes get short varints: 0, -1, 1, -2 -> 0, 1, 2, 3."""
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def encode_delta_frame(delta: int) -> bytes:
+    """One b"d" + zigzag varint frame, the scalar version of the plan encoder."""
+    value = (delta << 1) ^ (delta >> 63)
+    out = bytearray(DELTA_PREFIX)
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_delta_frame(frame: bytes) -> int:
+    value = 0
+    for shift, byte in enumerate(frame[1:]):
+        value |= (byte & 0x7F) << (7 * shift)
+        if not byte & 0x80:
+            break
+    return (value >> 1) ^ -(value & 1)
+
+
+def home_command(position: int, encoding: str, prefix: bytes = b"m", terminator: bytes = b"\n") -> bytes:
+    """
+    Command that takes the table from position back to where playback
+    started (0): that target for absolute plans, a move of -position in the
+    relative encodings, nothing when it is already there.
+    """
+    if encoding == ABSOLUTE:
+        return prefix + b"0" + terminator
+    return _move_command(-position, encoding, prefix, terminator)
+
+
+def _move_command(delta: int, encoding: str, prefix: bytes, terminator: bytes) -> bytes:
+    if delta == 0:
+        return b""
+    if encoding == VARINT:
+        return encode_delta_frame(delta)
+    return prefix + b"%d" % delta + terminator
+
+
+def _encode_varint_frames(deltas: NDArray[np.int64]) -> tuple[bytes, NDArray[np.int64]]:
+    """Vectorized encoder: all frames at once, empty for zero deltas."""
+    z = zigzag(deltas)
+    # varint length: one byte per started group of 7 bits, at least one
+    thresholds = np.uint64(1) << (7 * np.arange(1, 10, dtype=np.uint64))
+    nbytes = 1 + (z[:, None] >= thresholds[None, :]).sum(axis=1)
+    width = int(nbytes.max()) if len(nbytes) else 1
+
+    shifts = (7 * np.arange(width, dtype=np.uint64))[None, :]
+    groups = ((z[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    k = np.arange(width)[None, :]
+    groups[k < (nbytes[:, None] - 1)] |= 0x80
+
+    table = np.zeros((len(z), width + 1), dtype=np.uint8)
+    table[:, 0] = DELTA_PREFIX[0]
+    table[:, 1:] = groups
+    keep = np.zeros_like(table, dtype=bool)
+    keep[:, 0] = True
+    keep[:, 1:] = k < nbytes[:, None]
+    keep[deltas == 0] = False
+
+    sizes = keep.sum(axis=1)
+    return table[keep].tobytes(), sizes
+
+
+def _interleave(buffer: bytes, sizes: NDArray[np.int64], inserts: dict[int, bytes]) -> tuple[bytes, NDArray[np.int64]]:
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+    sizes = sizes.copy()
+    parts = []
+    previous = 0
+    for index in sorted(inserts):
+        start = int(starts[index])
+        parts.append(buffer[previous:start])
+        parts.append(inserts[index])
+        sizes[index] += len(inserts[index])
+        previous = start
+    parts.append(buffer[previous:])
+    return b"".join(parts), sizes
+
+
+class CompiledPlan:
+    """
+    Encoded motor commands for a whole trace.
+
+    buffer holds every command back to back (b"m120\\nm118\\n...") and
+    offsets[i]:offsets[i + 1] is the slice of sample i. positions are the
+    absolute targets whatever the encoding; in the relative encodings
+    values are the deltas actually sent, starting from origin. inserts
+    maps sample index -> bytes sent right before that sample's command.
+    """
+
+    def __init__(self, positions, sample_interval: float, prefix: bytes = b"m", terminator: bytes = b"\n",
+                 encoding: str = ABSOLUTE, origin: int = 0, inserts: dict[int, bytes] | None = None):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"unknown plan encoding {encoding!r}, expected one of {ENCODINGS}")
+        self.positions: NDArray[np.int64] = np.asarray(positions, dtype=np.int64)
+        self.sample_interval = float(sample_interval)
+        self.encoding = encoding
+        self.origin = int(origin)
+        self.prefix = prefix
+        self.terminator = terminator
+
+        if self.relative:
+            self.values = np.diff(self.positions, prepend=self.origin)
+        else:
+            self.values = self.positions
+
+        if encoding == VARINT:
+            self.buffer, sizes = _encode_varint_frames(self.values)
+        else:
+            template = prefix + b"%d" + terminator
+            pieces = [template % v if v or not self.relative else b"" for v in self.values.tolist()]
+            self.buffer = b"".join(pieces)
+            sizes = np.fromiter(map(len, pieces), dtype=np.int64, count=len(pieces))
+        self.inserts = {i: data for i, data in (inserts or {}).items() if 0 <= i < len(sizes)}
+        if self.inserts:
+            self.buffer, sizes = _interleave(self.buffer, sizes, self.inserts)
+        self.offsets: NDArray[np.int64] = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+
+        # python ints for the hot loop, indexing numpy scalars is much slower
+        self._bounds: list[int] = self.offsets.tolist()
+        self._targets: list[int] = self.positions.tolist()
+        self._view = memoryview(self.buffer)
+
+    def __len__(self) -> int:
+        return len(self._bounds) - 1
+
+    @property
+    def relative(self) -> bool:
+        return self.encoding != ABSOLUTE
+
+    @property
+    def duration(self) -> float:
+        return len(self) * self.sample_interval
+
+    @property
+    def bytes_per_command(self) -> float:
+        return len(self.buffer) / len(self) if len(self) else 0.0
+
+    def command(self, index: int) -> memoryview:
+        """Encoded command of sample index, without copying. Empty for a zero delta."""
+        return self._view[self._bounds[index]:self._bounds[index + 1]]
+
+    def commands(self, start: int, stop: int) -> memoryview:
+        """Encoded commands of samples start..stop-1 as one contiguous slice."""
+        return self._view[self._bounds[start]:self._bounds[stop]]
+
+    def skip(self, start: int, stop: int) -> bytes:
+        """
+        What has to be sent instead of samples start..stop-1 when they are
+        dropped: nothing for absolute plans (the next target says where to
+        be), one command with the sum of their deltas for relative plans,
+        so the table does not lose them. The last s/a insert among them goes
+        in front.
+        """
+        limits = [self.inserts[i] for i in range(start, stop) if i in self.inserts]
+        data = limits[-1] if limits else b""
+        if not self.relative or stop <= start:
+            return data
+        delta = self._targets[stop - 1] - self._target_before(start)
+        return data + _move_command(delta, self.encoding, self.prefix, self.terminator)
+
+    def home(self, position: int) -> bytes:
+        """home_command() in this plan's encoding, from position (commanded_position() or a controller's)."""
+        return home_command(position, self.encoding, self.prefix, self.terminator)
+
+    def _target_before(self, index: int) -> int:
+        return self._targets[index - 1] if index > 0 else self.origin
+
+    def commanded_position(self, index: int) -> int:
+        """Position the table was told to be at once sample index is sent."""
+        return self._targets[index]
@@ -0,0 +1,130 @@
+# playback_scheduler.py
+# Deadline-driven playback loop shared by both apps. Sample i is due at
+# start + i * period on the perf_counter clock, so the time spent sending
+# never accumulates as drift. Waiting is a coarse sleep followed by a short
+# spin, which lands within a few microseconds of the deadline without
+# burning a core for the whole period. While the GC is disabled (real-time
+# mode) the young generations are collected here, in the slack before a
+# deadline, so a playback of hours does not grow them without bound.
+
+import gc
+import time
+from typing import Callable
+
+import numpy as np
+from numpy.typing import NDArray
+
+CATCH_UP = "catch_up"   # late samples are sent back to back until on time again
+SKIP = "skip"           # late samples are dropped, playback jumps to the current slot
+GC_SLACK = 0.001        # s before a deadline worth spending on a young-generation collection
+HISTOGRAM_EDGES_US = np.array([0, 50, 100, 250, 500, 1000, 2000, 5000, 10000, 20000, np.inf])
+
+
+class PlaybackStats:
+    """Lateness of every sample actually sent (seconds after its deadline)."""
+
+    def __init__(self, lateness: NDArray[np.float64], skipped: int, period: float):
+        self.lateness = lateness
+        self.skipped = skipped
+        self.period = period
+        self.sent = len(lateness)
+
+    @classmethod
+    def combine(cls, parts: list["PlaybackStats"], period: float) -> "PlaybackStats":
+        """One report for a run played in several segments (pause/seek)."""
+        lateness = np.concatenate([p.lateness for p in parts]) if parts else np.zeros(0)
+        return cls(lateness, sum(p.skipped for p in parts), period)
+
+    def percentile_us(self, q: float) -> float:
+        return float(np.percentile(self.lateness, q) * 1e6) if self.sent else 0.0
+
+    @property
+    def max_us(self) -> float:
+        return float(self.lateness.max() * 1e6) if self.sent else 0.0
+
+    def histogram(self) -> list[tuple[str, int]]:
+        counts, _ = np.histogram(self.lateness * 1e6, bins=HISTOGRAM_EDGES_US)
+        labels = [f"<{int(hi)}us" if np.isfinite(hi) else f">={int(lo)}us"
+                  for lo, hi in zip(HISTOGRAM_EDGES_US[:-1], HISTOGRAM_EDGES_US[1:])]
+        return list(zip(labels, counts.tolist()))
+
+    def summary(self) -> str:
+        return (f"{self.sent} sent, {self.skipped} skipped | lateness p50 {self.percentile_us(50):.0f}us "
+                f"p99 {self.percentile_us(99):.0f}us max {self.max_us:.0f}us")
+
+
+def collect_young():
+    """
+    What the disabled GC would have done by now, limited to generations 0
+    and 1: nothing until generation 0 reaches its threshold. Tens of
+    microseconds; the oldest generation waits until the GC is enabled again.
+    """
+    counts, thresholds = gc.get_count(), gc.get_threshold()
+    if counts[0] < thresholds[0]:
+        return
+    gc.collect(1 if counts[1] >= thresholds[1] else 0)
+
+
+class PlaybackScheduler:
+    """
+    Calls step(i) for i in range(count), each at its absolute deadline.
+
+    spin is how long before the deadline the coarse sleep hands over to a
+    busy wait; a few hundred microseconds covers the usual sleep overshoot.
+    A sample counts as late once it misses its deadline by more than
+    late_after periods, then policy decides: CATCH_UP sends the backlog
+    without waiting, SKIP jumps straight to the sample due now. With
+    relative (delta) plans the dropped samples still have to move the
+    table: run() hands them to skipped(start, stop), which should send
+    CompiledPlan.skip(start, stop). Without skipped they are just dropped,
+    which is only right for absolute plans.
+    """
+
+    def __init__(self, period: float, spin: float = 0.0003, policy: str = CATCH_UP, late_after: float = 1.0):
+        self.period = float(period)
+        self.spin = spin
+        self.policy = policy
+        self.late_after = late_after
+
+    def wait_until(self, deadline: float):
+        remaining = deadline - time.perf_counter()
+        if remaining > GC_SLACK and not gc.isenabled():
+            collect_young()
+            remaining = deadline - time.perf_counter()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.perf_counter() < deadline:
+            pass
+
+    def run(self, count: int, step: Callable[[int], object],
+            should_stop: Callable[[], bool] = lambda: False, start_index: int = 0,
+            origin: float | None = None, skipped: Callable[[int, int], object] | None = None) -> PlaybackStats:
+        """
+        origin is the perf_counter() of index 0 (default: now), consecutive
+        runs over the pieces of a stream share it. skipped(start, stop) is
+        called before step() with the samples SKIP dropped.
+        """
+        lateness = np.empty(max(count - start_index, 0), dtype=np.float64)
+        sent = 0
+        dropped = 0
+        start = (time.perf_counter() if origin is None else origin) - start_index * self.period
+        i = start_index
+        while i < count:
+            if should_stop():
+                break
+            deadline = start + i * self.period
+            self.wait_until(deadline)
+            now = time.perf_counter()
+            late = now - deadline
+            if self.policy == SKIP and late > self.late_after * self.period:
+                current = min(int((now - start) / self.period), count - 1)
+                if current > i and skipped is not None:
+                    skipped(i, current)
+                dropped += current - i
+                i = current
+                late = now - (start + i * self.period)
+            step(i)
+            lateness[sent] = late
+            sent += 1
+            i += 1
+        return PlaybackStats(lateness[:sent], dropped, self.period)
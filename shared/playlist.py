@@ -0,0 +1,153 @@
+# playlist.py
+# Queue of records for a test campaign: each item is one trace with its own
+# amplitude, command rate, interpolation and a rest interval after it.
+# Preparing a record (shared/trace_pipeline.py) takes from a fraction of a
+# second to several seconds, so it runs in a worker process: while item n
+# plays, item n + 1 is already being prepared and its playback starts as
+# soon as the rest interval is over. The worker only gets the file path and
+# the trace position, reads the file itself and returns the step array;
+# with a cache folder, records prepared before are just loaded from it.
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator
+
+import numpy as np
+from numpy.typing import NDArray
+
+from shared.trace_pipeline import NATIVE, TIME_DOMAIN, prepare
+from shared.trajectory_cache import TrajectoryCache
+from shared.upsampler import BANDLIMITED
+
+
+class PlaylistItem:
+    """One record of the playlist, plain data so it can be sent to the worker process."""
+
+    def __init__(self, file_path: str, position: int, trace_id: str, amplitude: int = 1600,
+                 command_rate: str = NATIVE, interpolation: str = BANDLIMITED, rest: float = 0.0,
+                 integrator: str = TIME_DOMAIN):
+        self.file_path = file_path
+        self.position = position          # index of the trace in the file's stream
+        self.trace_id = trace_id
+        self.amplitude = int(amplitude)
+        self.command_rate = command_rate  # NATIVE or Hz as in the GUI combos
+        self.interpolation = interpolation
+        self.rest = max(float(rest), 0.0)  # s of rest after this item
+        self.integrator = integrator       # TIME_DOMAIN or FREQUENCY_DOMAIN double integration
+
+    @property
+    def label(self) -> str:
+        rate = "native" if self.command_rate == NATIVE else f"{self.command_rate} Hz"
+        text = f"{self.trace_id} | ±{self.amplitude} | {rate}"
+        if self.command_rate != NATIVE:
+            text += f" {self.interpolation}"
+        if self.integrator != TIME_DOMAIN:
+            text += f" | {self.integrator} integration"
+        if self.rest:
+            text += f" | rest {self.rest:g}s"
+        return text
+
+
+def read_item_trace(item: PlaylistItem):
+    """The ObsPy trace item refers to, read from its file."""
+    from obspy import read  # only the workers need it
+    stream = read(item.file_path)
+    trace = stream[item.position] if item.position < len(stream) else None
+    if trace is None or trace.id != item.trace_id:
+        # the file changed since it was added, fall back to the id
+        matches = [tr for tr in stream if tr.id == item.trace_id]
+        if not matches:
+            raise ValueError(f"{item.trace_id} no está en {item.file_path}")
+        trace = matches[0]
+    return trace
+
+
+def prepare_item(item: PlaylistItem, cache_folder: str | None = None) -> tuple[NDArray[np.int64], float, float]:
+    """Runs in the worker: (steps, sample_interval, seconds it took)."""
+    start = time.perf_counter()
+    trace = read_item_trace(item)
+    cache = TrajectoryCache(cache_folder) if cache_folder else None
+    scaled, sample_interval = prepare(trace, item.amplitude, item.command_rate, item.interpolation,
+                                      cache=cache, file_path=item.file_path, integrator=item.integrator)
+    return scaled, sample_interval, time.perf_counter() - start
+
+
+def _warm_up():
+    """Imports what prepare_item needs, so the first real preparation does not pay it."""
+    import obspy  # noqa: F401
+
+
+class Playlist:
+    """
+    Ordered items plus the worker process that prepares them.
+
+    The list can be edited from the GUI thread while a run iterates over a
+    snapshot of it. The pool uses "spawn" so the worker never inherits the
+    GUI and serial threads; it is started (and warmed up) when the first
+    item is added and kept until shutdown(), runs do not pay its start-up.
+    """
+
+    def __init__(self, cache_folder: str | None = None):
+        self.cache_folder = cache_folder  # TrajectoryCache folder the worker reads and fills
+        self.items: list[PlaylistItem] = []
+        self._lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, item: PlaylistItem):
+        with self._lock:
+            self.items.append(item)
+        if self._pool is None:
+            self._executor().submit(_warm_up)
+
+    def remove(self, index: int):
+        with self._lock:
+            if 0 <= index < len(self.items):
+                del self.items[index]
+
+    def clear(self):
+        with self._lock:
+            self.items.clear()
+
+    def labels(self) -> list[str]:
+        with self._lock:
+            return [f"{i + 1}. {item.label}" for i, item in enumerate(self.items)]
+
+    def prepared(self) -> Iterator[tuple[int, PlaylistItem, Future]]:
+        """
+        Yields (index, item, future) in order. When an item is yielded the
+        next one is already submitted, so it is prepared while the caller
+        plays this one; future.result() raises whatever the preparation raised.
+        Closing the generator early cancels what was not started.
+        """
+        with self._lock:
+            items = list(self.items)
+        if not items:
+            return
+        pool = self._executor()
+        pending = pool.submit(prepare_item, items[0], self.cache_folder)
+        submitted = [pending]
+        try:
+            for index, item in enumerate(items):
+                current = pending
+                if index + 1 < len(items):
+                    pending = pool.submit(prepare_item, items[index + 1], self.cache_folder)
+                    submitted.append(pending)
+                yield index, item, current
+        finally:
+            for future in submitted:
+                future.cancel()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,199 @@
+# realtime.py
+# Opt-in real-time mode for the duration of one playback (Linux). The
+# playback thread and the serial I/O threads get their own cores, the rest
+# of the process (DearPyGui render loop) is kept off them, the threads ask
+# for SCHED_FIFO or at least a lower nice value, and the garbage collector
+# is frozen and disabled so it cannot pause the loop mid-period; the
+# scheduler still collects the young generations in the slack before each
+# deadline (playback_scheduler.collect_young), so they stay bounded however
+# long the playback. Whatever the OS refuses is skipped and listed in
+# summary().
+#
+#   python -m shared.realtime --rate 500 --seconds 5
+#
+# runs the same playback loop with and without the mode under GUI-like
+# load and prints both jitter reports.
+
+import argparse
+import gc
+import os
+import sys
+import threading
+import time
+
+from shared.playback_scheduler import PlaybackScheduler
+
+FIFO_PRIORITY = 50
+NICE = -10
+SWITCH_INTERVAL = 0.0005    # s, GIL hand-over; the default 5 ms is a whole period at 200 Hz
+
+
+class RealtimeMode:
+    """
+    Context manager entered from the playback thread itself.
+
+    io_threads are the serial reader/writer threads to pin next to it.
+    Everything changed is restored on exit.
+    """
+
+    def __init__(self, io_threads=(), fifo_priority: int = FIFO_PRIORITY, nice: int = NICE,
+                 freeze_gc: bool = True, switch_interval: float = SWITCH_INTERVAL):
+        self.io_threads = [t for t in io_threads if t is not None and t.is_alive()]
+        self.fifo_priority = fifo_priority
+        self.nice = nice
+        self.freeze_gc = freeze_gc
+        self.switch_interval = switch_interval
+        self.granted: list[str] = []
+        self.refused: list[str] = []
+        self._affinity: dict[int, set[int]] = {}
+        self._policy: dict[int, tuple[int, int]] = {}
+        self._niceness: dict[int, int] = {}
+        self._switch_interval = None
+        self._gc_was_enabled = gc.isenabled()
+
+    def __enter__(self):
+        own = threading.get_native_id()
+        io = [t.native_id for t in self.io_threads]
+        self._pin(own, io)
+        for tid in [own] + io:
+            self._raise_priority(tid)
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(self.switch_interval)
+        if self.freeze_gc:
+            # collect once, then move every surviving object out of the GC's reach;
+            # from here on only PlaybackScheduler collects, between samples
+            gc.collect()
+            gc.freeze()
+            gc.disable()
+            self.granted.append("gc frozen")
+        return self
+
+    def __exit__(self, *exc):
+        if self.freeze_gc:
+            gc.unfreeze()
+            if self._gc_was_enabled:
+                gc.enable()
+        sys.setswitchinterval(self._switch_interval)
+        for tid, (policy, priority) in self._policy.items():
+            self._quietly(os.sched_setscheduler, tid, policy, os.sched_param(priority))
+        for tid, niceness in self._niceness.items():
+            self._quietly(os.setpriority, os.PRIO_PROCESS, tid, niceness)
+        for tid, cores in self._affinity.items():
+            self._quietly(os.sched_setaffinity, tid, cores)
+
+    def summary(self) -> str:
+        text = "rt: " + (", ".join(self.granted) or "nothing granted")
+        if self.refused:
+            text += " | refused: " + ", ".join(self.refused)
+        return text
+
+    @staticmethod
+    def _quietly(func, *args):
+        try:
+            func(*args)
+        except OSError:
+            pass  # thread already gone
+
+    def _set_affinity(self, tid: int, cores: set[int]) -> bool:
+        try:
+            self._affinity.setdefault(tid, os.sched_getaffinity(tid))
+            os.sched_setaffinity(tid, cores)
+            return True
+        except OSError:
+            return False
+
+    def _pin(self, own: int, io: list[int]):
+        if not hasattr(os, "sched_setaffinity"):
+            self.refused.append("affinity (not supported)")
+            return
+        cores = sorted(os.sched_getaffinity(0))
+        if len(cores) < 2:
+            self.refused.append("affinity (single core)")
+            return
+        playback_core = cores[-1]
+        io_core = cores[-2]
+        others = set(cores[:-2]) or {io_core}
+        if self._set_affinity(own, {playback_core}):
+            self.granted.append(f"playback cpu{playback_core}")
+        if io and all([self._set_affinity(tid, {io_core}) for tid in io]):
+            self.granted.append(f"io cpu{io_core}")
+        # the GUI thread and whatever else runs there stays off the dedicated cores
+        main = threading.main_thread().native_id
+        if main not in [own] + io:
+            self._set_affinity(main, others)
+
+    def _raise_priority(self, tid: int):
+        if hasattr(os, "sched_setscheduler"):
+            try:
+                previous = (os.sched_getscheduler(tid), os.sched_getparam(tid).sched_priority)
+                os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(self.fifo_priority))
+                self._policy[tid] = previous
+                if "SCHED_FIFO" not in self.granted:
+                    self.granted.append("SCHED_FIFO")
+                return
+            except OSError:
+                pass
+        if hasattr(os, "setpriority"):
+            try:
+                previous = os.getpriority(os.PRIO_PROCESS, tid)
+                os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                self._niceness[tid] = previous
+                if f"nice {self.nice}" not in self.granted:
+                    self.granted.append(f"nice {self.nice}")
+                return
+            except OSError:
+                pass
+        if "priority" not in self.refused:
+            self.refused.append("priority")
+
+
+def _gui_like_load(stop: threading.Event):
+    """Python work and garbage on another thread, roughly what the render loop does."""
+    while not stop.is_set():
+        frame = [{"x": i, "y": [i] * 8} for i in range(2000)]
+        sum(len(point["y"]) for point in frame)
+        time.sleep(0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Playback jitter with and without real-time mode.")
+    parser.add_argument("--rate", type=float, default=500.0, help="command rate (Hz)")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    period = 1.0 / args.rate
+    count = int(args.seconds * args.rate)
+    payload = []
+
+    def run(realtime: bool):
+        stop = threading.Event()
+        load = threading.Thread(target=_gui_like_load, args=(stop,), daemon=True)
+        load.start()
+        result = {}
+
+        def worker():
+            scheduler = PlaybackScheduler(period)
+            if realtime:
+                with RealtimeMode() as mode:
+                    result["stats"] = scheduler.run(count, payload.append)
+                result["mode"] = mode.summary()
+            else:
+                result["stats"] = scheduler.run(count, payload.append)
+                result["mode"] = "rt: off"
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        stop.set()
+        load.join()
+        payload.clear()
+        return result
+
+    for realtime in (False, True):
+        result = run(realtime)
+        print(f"{'realtime' if realtime else 'normal':9s} {result['stats'].summary()}")
+        print(f"          {result['mode']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# response_spectrum.py
+# Elastic response spectra (SD, PSV, PSA) of a motion: peak relative
+# displacement of damped single-degree-of-freedom oscillators over a set of
+# periods and damping ratios. Used to check that what the table reproduces
+# (encoder) has the spectral content of what it was asked to reproduce
+# (processed record), both in table units: steps, steps/s, steps/s^2.
+#
+# The oscillators are integrated with the exact recurrence for an input
+# that is linear between samples (Nigam & Jennings, 1969): with the state
+# [x, v], x[i+1] = A x[i] + B [a[i], a[i+1]], where A and B depend only on
+# period, damping and dt. All oscillators advance together, so the loop is
+# over samples with one vector operation per coefficient, never one loop
+# per oscillator.
+#
+#   python -m shared.response_spectrum [files...]
+
+import argparse
+import glob
+import os
+import time
+import warnings
+
+import numpy as np
+from numpy.typing import NDArray
+
+PERIODS = np.logspace(np.log10(0.05), np.log10(10.0), 60)     # s
+DAMPINGS = (0.02, 0.05, 0.10)
+QUANTITIES = {"PSA": "steps/s^2", "PSV": "steps/s", "SD": "steps"}   # name -> units
+
+
+class ResponseSpectrum:
+    """SD over (damping, period); PSV and PSA are SD times omega and omega^2."""
+
+    def __init__(self, periods: NDArray[np.float64], dampings: NDArray[np.float64], sd: NDArray[np.float64]):
+        self.periods = periods
+        self.dampings = dampings
+        self.sd = sd                                # (len(dampings), len(periods))
+
+    @property
+    def omega(self) -> NDArray[np.float64]:
+        return 2 * np.pi / self.periods
+
+    @property
+    def psv(self) -> NDArray[np.float64]:
+        return self.sd * self.omega
+
+    @property
+    def psa(self) -> NDArray[np.float64]:
+        return self.sd * self.omega ** 2
+
+    def quantity(self, name: str) -> NDArray[np.float64]:
+        """PSA, PSV or SD by name, as the GUI combos offer them."""
+        return {"PSA": self.psa, "PSV": self.psv, "SD": self.sd}[name]
+
+    def ratio(self, reference: "ResponseSpectrum") -> NDArray[np.float64]:
+        """This spectrum over reference, period by period (same periods and dampings)."""
+        return np.divide(self.sd, reference.sd, out=np.full_like(self.sd, np.nan), where=reference.sd > 0)
+
+
+def recurrence(periods, dampings, dt: float) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Nigam-Jennings A and B for x'' + 2 zeta w x' + w^2 x = -a(t), x the
+    displacement relative to a base accelerated by a. One row per (damping,
+    period) pair flattened damping-major: A is (n, 2, 2), B is (n, 2, 2)
+    and multiplies [a[i], a[i+1]]. Damping below 1.
+    """
+    zeta, period = np.meshgrid(np.asarray(dampings, dtype=np.float64), np.asarray(periods, dtype=np.float64),
+                               indexing="ij")
+    zeta, w = zeta.ravel(), 2 * np.pi / period.ravel()
+    root = np.sqrt(1 - zeta ** 2)
+    wd = w * root
+    e = np.exp(-zeta * w * dt)
+    s, c = np.sin(wd * dt), np.cos(wd * dt)
+
+    a = np.empty((len(w), 2, 2))
+    a[:, 0, 0] = e * (zeta / root * s + c)
+    a[:, 0, 1] = e * s / wd
+    a[:, 1, 0] = -w / root * e * s
+    a[:, 1, 1] = e * (c - zeta / root * s)
+
+    k1 = (2 * zeta ** 2 - 1) / (w ** 2 * dt)
+    k2 = 2 * zeta / (w ** 3 * dt)
+    damped = c - zeta / root * s
+    turning = wd * s + zeta * w * c
+    b = np.empty((len(w), 2, 2))
+    b[:, 0, 0] = e * ((k1 + zeta / w) * s / wd + (k2 + 1 / w ** 2) * c) - k2
+    b[:, 0, 1] = -e * (k1 * s / wd + k2 * c) - 1 / w ** 2 + k2
+    b[:, 1, 0] = e * ((k1 + zeta / w) * damped - (k2 + 1 / w ** 2) * turning) + 1 / (w ** 2 * dt)
+    b[:, 1, 1] = -e * (k1 * damped - k2 * turning) - 1 / (w ** 2 * dt)
+    return a, b
+
+
+def response_spectrum(acceleration, dt: float, periods=PERIODS, dampings=DAMPINGS) -> ResponseSpectrum:
+    """Spectrum of the base acceleration sampled every dt."""
+    periods = np.asarray(periods, dtype=np.float64)
+    dampings = np.asarray(dampings, dtype=np.float64)
+    a, b = recurrence(periods, dampings, dt)
+    a00, a01, a10, a11 = (np.ascontiguousarray(a[:, i, j]) for i in (0, 1) for j in (0, 1))
+    b00, b01, b10, b11 = (np.ascontiguousarray(b[:, i, j]) for i in (0, 1) for j in (0, 1))
+    forcing = np.asarray(acceleration, dtype=np.float64)
+
+    n = len(a00)
+    x, v = np.zeros(n), np.zeros(n)
+    new_x, new_v, term = np.empty(n), np.empty(n), np.empty(n)
+    peak = np.zeros(n)
+    for previous, current in zip(forcing[:-1].tolist(), forcing[1:].tolist()):
+        np.multiply(a00, x, out=new_x)
+        np.multiply(a01, v, out=term)
+        new_x += term
+        np.multiply(a10, x, out=new_v)
+        np.multiply(a11, v, out=term)
+        new_v += term
+        if previous or current:
+            new_x += b00 * previous + b01 * current
+            new_v += b10 * previous + b11 * current
+        x, new_x = new_x, x
+        v, new_v = new_v, v
+        np.abs(x, out=term)
+        np.maximum(peak, term, out=peak)
+    return ResponseSpectrum(periods, dampings, peak.reshape(len(dampings), len(periods)))
+
+
+def acceleration_from_positions(positions, dt: float) -> NDArray[np.float64]:
+    """Second central difference of positions (steps) -> steps/s^2, zero at both ends."""
+    positions = np.asarray(positions, dtype=np.float64)
+    out = np.zeros(len(positions))
+    if len(positions) > 2:
+        out[1:-1] = (positions[2:] - 2 * positions[1:-1] + positions[:-2]) / dt ** 2
+    return out
+
+
+def resample_motion(times, values, t0: float, dt: float, count: int) -> NDArray[np.float64]:
+    """
+    Irregular samples (encoder telemetry) on the grid t0 + k * dt, k < count,
+    linearly interpolated; the grid stops where the samples stop. A constant
+    lag against the commands does not matter, spectra ignore time shifts.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if len(times) < 2:
+        return np.zeros(0)
+    grid = t0 + dt * np.arange(count)
+    grid = grid[(grid >= times[0]) & (grid <= times[-1])]
+    return np.interp(grid, times, np.asarray(values, dtype=np.float64))
+
+
+def position_spectrum(positions, dt: float, periods=PERIODS, dampings=DAMPINGS) -> ResponseSpectrum:
+    """Spectrum of a table trajectory in steps: commanded plan or encoder motion."""
+    return response_spectrum(acceleration_from_positions(positions, dt), dt, periods, dampings)
+
+
+def _reference(acceleration, dt: float, period: float, damping: float) -> float:
+    """Peak |x| of one oscillator integrated by scipy (piecewise-linear input too)."""
+    from scipy.signal import lsim
+    w = 2 * np.pi / period
+    t = dt * np.arange(len(acceleration))
+    _, x, _ = lsim(([-1.0], [1.0, 2 * damping * w, w ** 2]), np.asarray(acceleration, dtype=np.float64), t,
+                   interp=True)
+    return float(np.abs(x).max())
+
+
+def main():
+    from contextlib import redirect_stdout
+    from io import StringIO
+    from obspy import read
+    from shared.trace_pipeline import prepare_for_playback
+
+    records = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "sismic_records")
+    parser = argparse.ArgumentParser(description="Response spectra of prepared records, checked against scipy.")
+    parser.add_argument("files", nargs="*", help=f"miniSEED files (default: {records})")
+    parser.add_argument("--amplitude", type=int, default=1600)
+    parser.add_argument("--check", type=int, default=3, help="oscillators per trace integrated again with scipy")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    print(f"{len(PERIODS)} periods x {len(DAMPINGS)} dampings")
+    print(f"{'trace':22s} {'samples':>8s} {'time':>8s} {'PSA 5% peak':>12s} {'at T s':>7s}  max rel. diff vs scipy")
+    rng = np.random.default_rng(0)
+    worst = 0.0
+    for path in args.files or sorted(glob.glob(os.path.join(records, "*.miniseed"))):
+        for trace in read(path):
+            with redirect_stdout(StringIO()):
+                steps, dt = prepare_for_playback(trace, args.amplitude)
+            acceleration = acceleration_from_positions(steps, dt)
+            start = time.perf_counter()
+            spectrum = response_spectrum(acceleration, dt)
+            elapsed = time.perf_counter() - start
+            row = list(DAMPINGS).index(0.05)
+            best = int(np.argmax(spectrum.psa[row]))
+            differences = []
+            for _ in range(args.check):
+                d, p = rng.integers(len(DAMPINGS)), rng.integers(len(PERIODS))
+                expected = _reference(acceleration, dt, PERIODS[p], DAMPINGS[d])
+                differences.append(abs(spectrum.sd[d, p] - expected) / expected)
+            worst = max(worst, *differences)
+            print(f"{trace.id:22s} {len(steps):8d} {elapsed * 1e3:6.0f}ms {spectrum.psa[row, best]:12.0f} "
+                  f"{PERIODS[best]:7.2f}  {max(differences):.1e}")
+    print(f"largest difference against scipy: {worst:.1e}")
+
+
+if __name__ == "__main__":
+    main()
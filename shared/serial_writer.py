@@ -0,0 +1,119 @@
+# serial_writer.py
+# Dedicated writer stage for the serial link. Playback and manual commands
+# are queued instead of blocking on serial.write(); if the port falls
+# behind, position setpoints that were superseded before reaching the wire
+# are coalesced so the table follows the newest target instead of drifting.
+
+import threading
+from collections import deque
+from typing import Any, Callable
+
+from shared.playback_plan import DELTA_PREFIX, decode_delta_frame, encode_delta_frame
+
+
+class CommandWriter:
+    """
+    Bounded command queue drained by one writer thread.
+
+    submit(data, coalesce=True) marks an "m" setpoint or a binary "d" delta
+    frame as coalescible. Within a run of consecutive coalescible setpoints
+    of the same kind only the newest survives, or, for the relative ones
+    (submit(..., relative=True) and always "d" frames), one move with the
+    summed steps, matching the firmware's stepper->move(). Relative is per
+    command, so a relative playback and the wave generator's setpoints can
+    share the writer. Anything else (s/a commands, manual input, the return
+    move sent on stop) is never dropped and also ends the run, so order
+    around it is kept. When the queue is full the producer first coalesces
+    and only blocks if the queue is still full.
+    """
+
+    def __init__(self, write: Callable[[bytes], Any], maxsize: int = 256,
+                 on_error: Callable[[Exception], None] | None = None):
+        self._write = write
+        self.maxsize = maxsize
+        self.on_error = on_error
+        # (data, kind): kind is None when the command is never coalesced,
+        # else (first byte, relative); only equal kinds are merged
+        self._queue: deque[tuple[bytes, tuple[bytes, bool] | None]] = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        # metrics
+        self.coalesced = 0
+        self.written = 0
+        self.max_depth = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def thread(self) -> threading.Thread:
+        return self._thread
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def submit(self, data: bytes | memoryview, coalesce: bool = True, relative: bool = False):
+        data = bytes(data)
+        if not data:
+            return  # zero delta of a relative plan, nothing to send
+        head = data[:1]
+        kind = (head, relative or head == DELTA_PREFIX) if coalesce and head in (b"m", DELTA_PREFIX) else None
+        item = (data, kind)
+        with self._cond:
+            if len(self._queue) >= self.maxsize:
+                self._coalesce()
+            while len(self._queue) >= self.maxsize and not self._closing:
+                self._cond.wait(0.1)
+            self._queue.append(item)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+
+    def close(self, timeout: float = 1.0):
+        """Flushes what is queued and stops the thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def summary(self) -> str:
+        return f"tx queue {self.depth} (max {self.max_depth}) | coalesced {self.coalesced}"
+
+    @staticmethod
+    def _merge(older: bytes, newer: bytes, relative: bool) -> bytes:
+        if newer[:1] == DELTA_PREFIX:
+            return encode_delta_frame(decode_delta_frame(older) + decode_delta_frame(newer))
+        if not relative:
+            return newer
+        body = newer.rstrip()
+        steps = int(older[1:]) + int(body[1:])
+        return b"m%d" % steps + newer[len(body):]
+
+    def _coalesce(self):
+        kept: deque[tuple[bytes, tuple[bytes, bool] | None]] = deque()
+        for data, kind in self._queue:
+            if kind is not None and kept and kept[-1][1] == kind:
+                kept[-1] = (self._merge(kept[-1][0], data, kind[1]), kind)
+                self.coalesced += 1
+            else:
+                kept.append((data, kind))
+        self._queue = kept
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # more than one pending means we are behind the producer
+                if len(self._queue) > 1:
+                    self._coalesce()
+                batch = [data for data, _ in self._queue]
+                self._queue.clear()
+                self._cond.notify_all()
+            try:
+                self._write(b"".join(batch))
+                self.written += len(batch)
+            except Exception as exc:
+                if self.on_error:
+                    self.on_error(exc)
@@ -0,0 +1,166 @@
+# session_recorder.py
+# Raw serial session recording and replay.
+#
+# A recording is every RX/TX chunk exactly as it crossed the port, with the
+# perf_counter_ns() it was seen at. File layout (little endian):
+#
+#   header  b"MESAREC1" + int64 wall clock ns at start
+#   record  int64 t_ns (since start) | uint8 direction | uint32 length | bytes
+#
+# Recording never touches the disk from the I/O threads: record() only
+# appends to a deque, a background thread writes it out in big blocks.
+#
+#   python -m shared.session_recorder info sessions/2026-01-01_120000.mesarec
+
+import argparse
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator
+
+MAGIC = b"MESAREC1"
+HEADER = struct.Struct("<8sq")
+RECORD = struct.Struct("<qBI")
+RX = 0
+TX = 1
+FILE_EXTENSION = ".mesarec"
+
+
+def session_file_name(folder: str) -> str:
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, time.strftime("%Y-%m-%d_%H%M%S") + FILE_EXTENSION)
+
+
+class SessionRecorder:
+    """Appends raw RX/TX chunks to a .mesarec file without blocking the caller."""
+
+    def __init__(self, path: str, flush_interval: float = 0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.start_ns = time.perf_counter_ns()
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._file.write(HEADER.pack(MAGIC, time.time_ns()))
+        self._pending: deque[tuple[int, int, bytes]] = deque()
+        self._stop = threading.Event()
+        self.records = 0
+        self.bytes = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, direction: int, data: bytes | memoryview, t_ns: int | None = None):
+        if t_ns is None:
+            t_ns = time.perf_counter_ns()
+        self._pending.append((t_ns - self.start_ns, direction, bytes(data)))
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._file.close()
+
+    def _drain(self):
+        parts = []
+        while self._pending:
+            t_ns, direction, data = self._pending.popleft()
+            parts.append(RECORD.pack(t_ns, direction, len(data)))
+            parts.append(data)
+            self.records += 1
+            self.bytes += len(data)
+        if parts:
+            self._file.write(b"".join(parts))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+        self._file.flush()
+
+
+def read_session(path: str) -> tuple[int, Iterator[tuple[int, int, bytes]]]:
+    """Wall clock start (ns) and an iterator of (t_ns, direction, data) records."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    magic, wall_ns = HEADER.unpack_from(raw, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a session recording")
+
+    def records():
+        offset = HEADER.size
+        view = memoryview(raw)
+        while offset + RECORD.size <= len(raw):
+            t_ns, direction, length = RECORD.unpack_from(raw, offset)
+            offset += RECORD.size
+            if offset + length > len(raw):
+                break  # truncated tail (app closed mid-write)
+            yield t_ns, direction, bytes(view[offset:offset + length])
+            offset += length
+
+    return wall_ns, records()
+
+
+class SessionReplay:
+    """
+    Feeds a recording back as if it came from the port.
+
+    speed=1 replays in real time, N replays N times faster and 0 as fast as
+    possible. on_rx(data, arrival_ns) gets the recorded arrival times shifted
+    to start at start_ns, so timestamps come out as in the original run
+    whatever the speed. TX chunks go to on_tx if given.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self._stop = threading.Event()
+        self.rx_bytes = 0
+        self.records = 0
+        self.elapsed = 0.0
+
+    def stop(self):
+        self._stop.set()
+
+    def play(self, on_rx: Callable[[bytes, int], None], on_tx: Callable[[bytes, int], None] | None = None,
+             start_ns: int | None = None):
+        _, records = read_session(self.path)
+        if start_ns is None:
+            start_ns = time.perf_counter_ns()
+        wall_start = time.perf_counter()
+        for t_ns, direction, data in records:
+            if self._stop.is_set():
+                break
+            if self.speed > 0:
+                delay = t_ns / 1e9 / self.speed - (time.perf_counter() - wall_start)
+                if delay > 0 and self._stop.wait(delay):
+                    break
+            if direction == RX:
+                on_rx(data, start_ns + t_ns)
+                self.rx_bytes += len(data)
+            elif on_tx:
+                on_tx(data, start_ns + t_ns)
+            self.records += 1
+        self.elapsed = time.perf_counter() - wall_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a .mesarec serial session.")
+    parser.add_argument("command", choices=["info"])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    wall_ns, records = read_session(args.path)
+    counts = {RX: [0, 0], TX: [0, 0]}
+    last_ns = 0
+    for t_ns, direction, data in records:
+        counts[direction][0] += 1
+        counts[direction][1] += len(data)
+        last_ns = t_ns
+    print(f"{args.path}")
+    print(f"  started   {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(wall_ns / 1e9))}")
+    print(f"  duration  {last_ns / 1e9:.2f} s")
+    print(f"  rx        {counts[RX][0]} chunks, {counts[RX][1]} bytes")
+    print(f"  tx        {counts[TX][0]} chunks, {counts[TX][1]} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# streaming.py
+# Causal, chunked version of shared/trace_pipeline.py for records too long
+# to prepare in one piece. The record is read a block at a time and every
+# stage keeps its state between blocks: the bandpass (sosfilt with zi),
+# the two integrations (last sample and running sum, each followed by a
+# state-carrying high-pass so the integrals do not wander off), the
+# polyphase resampler (input history) and the amplitude limiter. Memory
+# stays proportional to the block size and the limiter look-ahead, never to
+# the record length, and the first steps are ready after one block.
+#
+# What cannot be done causally is done differently than in the full
+# pipeline: instead of linear detrend + taper the first sample is
+# subtracted and the start fades in, the filtering is one-pass (not zero
+# phase), and without a fixed gain the ±amplitude scaling is a look-ahead
+# limiter instead of a normalisation to the record's peak (see _Limiter).
+
+import queue
+import threading
+from fractions import Fraction
+from io import BytesIO
+from typing import Iterable, Iterator
+
+import numpy as np
+from numpy.typing import NDArray
+from scipy.signal import firwin, iirfilter, sosfilt, upfirdn
+
+from shared.trace_pipeline import PROCESSING, _filter_sos
+
+CHUNK = 4096                # samples per block from memory
+RECORDS_PER_CHUNK = 64      # miniSEED records per block from disk
+FADE_IN = 2.0               # s, start ramp instead of the taper
+DRIFT_CUTOFF = 0.05         # Hz, high-pass after each integration
+LOOKAHEAD = 30.0            # s, limiter look-ahead when no gain is given
+QUEUE_CHUNKS = 8            # blocks prepared ahead of the playback loop
+
+
+def iter_array_chunks(data, size: int = CHUNK) -> Iterator[NDArray]:
+    """Views of size samples over data already in memory."""
+    for begin in range(0, len(data), size):
+        yield data[begin:begin + size]
+
+
+def iter_mseed_chunks(path: str, trace_id: str, records_per_chunk: int = RECORDS_PER_CHUNK) -> Iterator[NDArray]:
+    """
+    Samples of trace_id read from a miniSEED file RECORDS_PER_CHUNK records
+    at a time. Records are independent, so each block of whole records is
+    decoded on its own; segments of other channels are skipped and gaps
+    are simply joined.
+    """
+    from obspy import read
+    from obspy.io.mseed.util import get_record_information
+    record_length = get_record_information(path)["record_length"]
+    with open(path, "rb") as source:
+        while True:
+            block = source.read(record_length * records_per_chunk)
+            if not block:
+                return
+            stream = read(BytesIO(block), format="MSEED").select(id=trace_id)
+            for trace in sorted(stream, key=lambda tr: tr.stats.starttime):
+                yield trace.data
+
+
+class _Integrator:
+    """Cumulative trapezoid carried across blocks, then a causal high-pass against drift."""
+
+    def __init__(self, sample_interval: float, sos: NDArray):
+        self.dx = sample_interval
+        self.sos = sos
+        self.zi = np.zeros((len(sos), 2))
+        self.last = 0.0     # previous input sample
+        self.total = 0.0    # integral up to it
+
+    def process(self, x: NDArray) -> NDArray:
+        if not len(x):
+            return x
+        out = np.empty(len(x))
+        out[0] = self.last + x[0]
+        out[1:] = x[:-1] + x[1:]
+        np.cumsum(out, out=out)
+        out *= 0.5 * self.dx
+        out += self.total
+        self.last = float(x[-1])
+        self.total = float(out[-1])
+        out, self.zi = sosfilt(self.sos, out, zi=self.zi)
+        return out
+
+
+class _PolyphaseResampler:
+    """
+    resample_poly in blocks: same Kaiser FIR, the last input samples it
+    still needs are kept between blocks and its group delay is skipped at
+    the start and fed with zeros by flush(), so the output has the length
+    and time base of shared.upsampler.resample_trajectory.
+    """
+
+    def __init__(self, source_rate: float, target_rate: float):
+        ratio = Fraction(target_rate / source_rate).limit_denominator(1000)
+        self.up, self.down = ratio.numerator, ratio.denominator
+        max_rate = max(self.up, self.down)
+        half = 10 * max_rate
+        self.h = firwin(2 * half + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * self.up
+        self.delay = half                   # upsampled samples
+        self._keep = -(-(len(self.h) - 1) // self.up) + 1
+        self._history = np.zeros(0)
+        self._base = 0                      # input index of _history[0]
+        self._next = self.delay             # next upsampled index to output
+        self._received = 0
+
+    def process(self, x: NDArray, limit: int | None = None) -> NDArray:
+        buffer = np.concatenate((self._history, x))
+        self._received += len(x)
+        end = (self._base + len(buffer)) * self.up
+        if limit is not None:
+            end = min(end, limit + 1)
+        out = np.zeros(0)
+        if self._next < end:
+            filtered = upfirdn(self.h, buffer, self.up)
+            wanted = np.arange(self._next, end, self.down)
+            out = filtered[wanted - self._base * self.up]
+            self._next = int(wanted[-1]) + self.down
+        drop = max(len(buffer) - self._keep, 0)
+        self._history = buffer[drop:]
+        self._base += drop
+        return out
+
+    def flush(self) -> NDArray:
+        """Outputs up to the time of the last input sample."""
+        if not self._received:
+            return np.zeros(0)
+        limit = self.delay + (self._received - 1) * self.up
+        received = self._received
+        out = self.process(np.zeros(-(-self.delay // self.up) + 1), limit)
+        self._received = received
+        return out
+
+
+class _Limiter:
+    """
+    ±amplitude without knowing the record's peak: output is delayed by
+    lookahead samples and scaled by amplitude / (mean over the look-ahead
+    window of the peak seen so far). The running peak at or after a sample
+    is never below that sample, so neither is the mean; and the mean moves
+    by a fraction per sample, so the table never jumps when a larger
+    arrival lowers the gain. Quiet stretches longer than the look-ahead
+    before the strongest arrival come out louder than with the full-record
+    normalisation.
+    """
+
+    def __init__(self, amplitude: int, lookahead: int):
+        self.amplitude = amplitude
+        self.lookahead = max(int(lookahead), 1)
+        self.peak = 0.0
+        self._x = np.zeros(0)
+        self._peaks = np.zeros(0)
+
+    def process(self, x: NDArray, final: bool = False) -> NDArray:
+        if len(x):
+            peaks = np.maximum.accumulate(np.maximum(np.abs(x), self.peak))
+            self.peak = float(peaks[-1])
+            self._x = np.concatenate((self._x, x))
+            self._peaks = np.concatenate((self._peaks, peaks))
+        window = self.lookahead + 1
+        peaks = self._peaks
+        if final and len(peaks):
+            peaks = np.concatenate((peaks, np.full(self.lookahead, self.peak)))  # the peak is final
+        ready = len(peaks) - self.lookahead
+        if ready <= 0:
+            return np.zeros(0)
+        sums = np.concatenate(([0.0], np.cumsum(peaks)))
+        level = (sums[window:window + ready] - sums[:ready]) / window
+        out = np.divide(self._x[:ready] * self.amplitude, level, out=np.zeros(ready), where=level > 0)
+        self._x = self._x[ready:]
+        self._peaks = self._peaks[ready:]
+        return out
+
+
+class StreamingPreparer:
+    """
+    Block-by-block preparation of one record sampled at sampling_rate.
+
+    process(block) returns the steps that are final so far (possibly none),
+    flush() the rest once the record is over. With a gain (steps per unit
+    of displacement) the output is just scaled and clipped; without one
+    it goes through the look-ahead limiter.
+    """
+
+    def __init__(self, sampling_rate: float, amplitude=1600, command_rate: float | None = None,
+                 gain: float | None = None, lookahead: float = LOOKAHEAD, fade_in: float = FADE_IN):
+        self.sampling_rate = float(sampling_rate)
+        self.amplitude = max(int(abs(amplitude)), 1)
+        self.gain = gain
+        dx = 1.0 / self.sampling_rate
+        self.sos = _filter_sos(self.sampling_rate, PROCESSING["freqmin"], PROCESSING["freqmax"], PROCESSING["corners"])
+        self.zi = np.zeros((len(self.sos), 2))
+        drift = iirfilter(2, DRIFT_CUTOFF / (0.5 * self.sampling_rate), btype="highpass", ftype="butter", output="sos")
+        self.integrators = (_Integrator(dx, drift), _Integrator(dx, drift))
+        self.resampler = None
+        output_rate = self.sampling_rate
+        if command_rate and float(command_rate) != self.sampling_rate:
+            self.resampler = _PolyphaseResampler(self.sampling_rate, float(command_rate))
+            output_rate = float(command_rate)
+        self.sample_interval = 1.0 / output_rate
+        self.limiter = None if gain else _Limiter(self.amplitude, lookahead * output_rate)
+        self._fade = 0.5 * (1 - np.cos(np.linspace(0, np.pi, max(int(fade_in * self.sampling_rate), 1))))
+        self._offset: float | None = None
+        self._position = 0      # input samples seen
+
+    def _filter(self, block) -> NDArray:
+        x = np.array(block, dtype=np.float64)
+        if self._offset is None:
+            self._offset = float(x[0]) if len(x) else None
+        if self._offset is not None:
+            x -= self._offset
+        fade = self._fade[self._position:self._position + len(x)]
+        x[:len(fade)] *= fade
+        self._position += len(x)
+        x, self.zi = sosfilt(self.sos, x, zi=self.zi)
+        for integrator in self.integrators:
+            x = integrator.process(x)
+        return x
+
+    def _scale(self, x: NDArray, final: bool = False) -> NDArray[np.int64]:
+        if self.limiter is not None:
+            x = self.limiter.process(x, final)
+        else:
+            x = x * self.gain
+        return np.clip(x, -self.amplitude, self.amplitude).astype(int)
+
+    def process(self, block) -> NDArray[np.int64]:
+        x = self._filter(block)
+        if self.resampler is not None:
+            x = self.resampler.process(x)
+        return self._scale(x)
+
+    def flush(self) -> NDArray[np.int64]:
+        x = self.resampler.flush() if self.resampler is not None else np.zeros(0)
+        return self._scale(x, final=True)
+
+
+def stream_steps(blocks: Iterable, preparer: StreamingPreparer) -> Iterator[NDArray[np.int64]]:
+    """Steps as they become final, one array per input block (empty ones skipped)."""
+    for block in blocks:
+        steps = preparer.process(block)
+        if len(steps):
+            yield steps
+    steps = preparer.flush()
+    if len(steps):
+        yield steps
+
+
+def bounded(source: Iterator, maxsize: int = QUEUE_CHUNKS) -> Iterator:
+    """
+    Runs source in a producer thread at most maxsize items ahead of the
+    consumer. Errors in the producer are raised in the consumer; closing
+    the returned generator stops the producer at its next item.
+    """
+    items: queue.Queue = queue.Queue(maxsize)
+    done = object()
+    cancelled = threading.Event()
+
+    def put(item) -> bool:
+        """False once the consumer is gone, instead of blocking on a full queue forever."""
+        while not cancelled.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in source:
+                if not put(item):
+                    return
+            put(done)
+        except Exception as exc:
+            put(exc)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
@@ -0,0 +1,197 @@
+# telemetry.py
+# Preallocated ring buffer for encoder telemetry (time, position, sequence).
+# One thread writes (the serial reader) and one reads (the GUI); neither
+# takes a lock. The writer fills the slots first and only then advances the
+# monotonic write_index, so anything below write_index is published.
+
+import numpy as np
+from numpy.typing import NDArray
+
+TELEMETRY_CAPACITY = 262_144  # ~4.4 min of history at 1 kHz, ~6 MB
+
+
+class TelemetryRing:
+    """
+    Single-writer / single-reader ring of telemetry samples.
+
+    write_index counts every sample ever written and never wraps, sample k
+    lives in slot k % capacity. A reader takes the window it wants (slices
+    of the arrays, copied only when the window wraps) and then re-reads
+    write_index: slots the writer may have overwritten meanwhile are
+    dropped, so what it gets was published by the writer.
+    """
+
+    def __init__(self, capacity: int = TELEMETRY_CAPACITY):
+        self.capacity = int(capacity)
+        self.time: NDArray[np.float64] = np.zeros(self.capacity, dtype=np.float64)
+        self.position: NDArray[np.float64] = np.zeros(self.capacity, dtype=np.float64)
+        self.sequence: NDArray[np.int64] = np.zeros(self.capacity, dtype=np.int64)
+        self.write_index = 0
+        self.start_index = 0  # first sample visible to readers, moved by clear()
+
+    def __len__(self) -> int:
+        return min(self.write_index - self.start_index, self.capacity)
+
+    # --- writer side ---------------------------------------------------
+    def append(self, t: float, position: float, sequence: int | None = None):
+        index = self.write_index
+        slot = index % self.capacity
+        self.time[slot] = t
+        self.position[slot] = position
+        self.sequence[slot] = index if sequence is None else sequence
+        self.write_index = index + 1
+
+    def extend(self, times, positions, sequences=None):
+        """Writes a whole batch with at most two slice copies."""
+        times = np.asarray(times, dtype=np.float64)
+        positions = np.asarray(positions, dtype=np.float64)
+        count = len(times)
+        if count == 0:
+            return
+        index = self.write_index
+        if sequences is None:
+            sequences = np.arange(index, index + count, dtype=np.int64)
+        else:
+            sequences = np.asarray(sequences, dtype=np.int64)
+        if count > self.capacity:
+            times, positions, sequences = times[-self.capacity:], positions[-self.capacity:], sequences[-self.capacity:]
+            index += count - self.capacity
+            count = self.capacity
+        slot = index % self.capacity
+        first = min(count, self.capacity - slot)
+        for dest, src in ((self.time, times), (self.position, positions), (self.sequence, sequences)):
+            dest[slot:slot + first] = src[:first]
+            dest[:count - first] = src[first:]
+        self.write_index = index + count
+
+    # --- reader side ---------------------------------------------------
+    def clear(self):
+        """Hides everything written so far (the writer keeps going untouched)."""
+        self.start_index = self.write_index
+
+    def _read(self, begin: int, end: int, arrays: tuple) -> tuple:
+        """
+        Samples begin..end of each array: views when the range does not wrap
+        around the end of the ring, a concatenated copy when it does.
+        """
+        start = begin % self.capacity
+        stop = start + (end - begin)
+        if stop <= self.capacity:
+            return tuple(array[start:stop] for array in arrays)
+        return tuple(np.concatenate((array[start:], array[:stop - self.capacity])) for array in arrays)
+
+    def _published(self, begin: int, end: int, arrays: tuple) -> tuple:
+        """_read() without the slots the writer overwrote meanwhile."""
+        window = self._read(begin, end, arrays)
+        overwritten = self.write_index - self.capacity - begin
+        if overwritten > 0:
+            return tuple(values[overwritten:] for values in window)
+        return window
+
+    def latest(self, count: int | None = None) -> tuple[NDArray[np.float64], NDArray[np.float64], NDArray[np.int64]]:
+        """
+        The last count samples (all retained samples by default). Views into
+        the ring unless the window wraps: use them right away (plots, math)
+        or copy them, the writer reuses the slots once it laps around.
+        """
+        end = self.write_index
+        begin = max(self.start_index, end - self.capacity)
+        if count is not None:
+            begin = max(begin, end - count)
+        return self._published(begin, end, (self.time, self.position, self.sequence))
+
+    def since(self, index: int) -> tuple[NDArray[np.float64], NDArray[np.float64], int]:
+        """
+        The samples written from index on (views as in latest()), and the
+        index to pass next time. Streaming consumers use it to read only what is new.
+        """
+        end = self.write_index
+        begin = max(index, self.start_index, end - self.capacity)
+        times, positions = self._published(begin, end, (self.time, self.position))
+        return times, positions, end
+
+ENCODER_PERIOD_NS = 1_000_000  # readEncoderTask runs every SAMPLE_MS = 1 ms
+
+
+class SampleClock:
+    """
+    Rebuilds per-sample times and sequence numbers for the encoder stream.
+
+    The firmware prints one line every period_ns but sends no counter, so
+    each batch is stamped with perf_counter_ns() when its bytes arrive and
+    the samples inside it are placed on a period_ns grid. The grid origin
+    follows the lower envelope of (arrival - sequence * period), i.e. the
+    least delayed batch seen, and creeps forward slowly so a firmware clock
+    a bit slower than nominal is not mistaken for drops.
+
+    A late batch alone is just USB/OS latency. Samples are only counted as
+    dropped when every batch of a whole window_ns arrives more than
+    gap_threshold periods late: then the sequence skips the missing ones.
+    """
+
+    def __init__(self, period_ns: int = ENCODER_PERIOD_NS, gap_threshold: int = 3,
+                 window_ns: int = 100_000_000, creep_ppm: float = 200.0):
+        self.period_ns = int(period_ns)
+        self.gap_threshold = gap_threshold
+        self.window_ns = window_ns
+        self.creep = creep_ppm * 1e-6
+        self.reset()
+
+    def reset(self):
+        self.origin_ns: int | None = None
+        self.last_arrival_ns = 0
+        self.next_sequence = 0
+        self._window_start_ns = 0
+        self._window_late = 0       # smallest lateness (in periods) seen in the window
+        # live statistics
+        self.samples = 0
+        self.batches = 0
+        self.gaps = 0
+        self.dropped = 0
+        self.jitter_ns = 0          # delay of the last batch over the envelope
+        self.jitter_max_ns = 0
+        self.jitter_mean_ns = 0.0   # exponential moving average
+
+    def stamp(self, arrival_ns: int, count: int) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+        """perf_counter_ns times and sequence numbers for a batch of count samples."""
+        if count <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        if self.origin_ns is None:
+            self.origin_ns = arrival_ns - (count - 1) * self.period_ns
+            self._window_start_ns = arrival_ns
+            self._window_late = 0
+        else:
+            self.origin_ns += int((arrival_ns - self.last_arrival_ns) * self.creep)
+        self.last_arrival_ns = arrival_ns
+
+        first = self.next_sequence
+        last = first + count - 1
+        # how many periods after the grid slot of its last sample this batch arrived
+        late = (arrival_ns - self.origin_ns) // self.period_ns - last
+        self._window_late = min(self._window_late, late)
+        if arrival_ns - self._window_start_ns >= self.window_ns:
+            if self._window_late > self.gap_threshold:
+                # persistently late: lines were lost, catch the sequence up
+                missing = int(self._window_late)
+                self.gaps += 1
+                self.dropped += missing
+                first += missing
+                last += missing
+            self._window_start_ns = arrival_ns
+            self._window_late = late
+        # earliest arrival so far moves the envelope down
+        self.origin_ns = min(self.origin_ns, arrival_ns - last * self.period_ns)
+
+        self.jitter_ns = arrival_ns - (self.origin_ns + last * self.period_ns)
+        self.jitter_max_ns = max(self.jitter_max_ns, self.jitter_ns)
+        self.jitter_mean_ns += 0.05 * (self.jitter_ns - self.jitter_mean_ns)
+        self.samples += count
+        self.batches += 1
+        self.next_sequence = last + 1
+
+        sequences = np.arange(first, last + 1, dtype=np.int64)
+        return self.origin_ns + sequences * self.period_ns, sequences
+
+    def summary(self) -> str:
+        return (f"drops {self.dropped} ({self.gaps} gaps) | jitter {self.jitter_ns / 1e6:.2f} ms "
+                f"avg {self.jitter_mean_ns / 1e6:.2f} max {self.jitter_max_ns / 1e6:.2f}")
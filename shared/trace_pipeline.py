@@ -0,0 +1,428 @@
+# trace_pipeline.py
+# Seismic trace -> table trajectory (motor steps). This is the processing
+# the viewer runs before a playback: detrend, taper, bandpass, double
+# integration, normalisation to the requested amplitude and, optionally,
+# resampling to the command rate. It only needs ObsPy/NumPy, never the GUI,
+# so it can also run in a worker process (see shared/playlist.py).
+# The processing runs on raw arrays (displacement_steps) and reproduces the
+# ObsPy Trace method chain it replaced (prepare_with_obspy), which is kept
+# as the reference:
+#
+#   python -m shared.trace_pipeline
+#
+# prepares every bundled record both ways, float64 and float32, and prints
+# the largest difference in steps and the time each one took; with
+# --integrators it compares the time and frequency-domain integrators.
+# The difference alone is check_against_obspy(), also run by --check
+# (the check step in SETUP.md), without timing.
+#
+# prepare() adds the TrajectoryCache in front of it: every parameter that
+# changes the output is part of the cache key.
+
+import argparse
+import glob
+import os
+import time
+import warnings
+from contextlib import redirect_stdout
+from functools import lru_cache
+from io import StringIO
+
+import numpy as np
+from numpy.typing import NDArray
+from scipy.fft import irfft, next_fast_len, rfft, rfftfreq
+from scipy.signal import get_window, iirfilter, sosfilt
+
+from shared.trajectory_cache import TrajectoryCache
+from shared.upsampler import BANDLIMITED, resample_trajectory
+
+DEFAULT_INTERVAL = 0.01     # s, when the trace has no usable delta (100 Hz)
+NATIVE = "native"           # command rate = the record's own sampling rate
+RECORDS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "sismic_records")
+TOLERANCE = 1               # steps, largest difference accepted against the ObsPy reference
+TIME_DOMAIN = "time"        # two cumulative trapezoids, what ObsPy's integrate() does
+FREQUENCY_DOMAIN = "frequency"  # one division by (iω)² in the spectrum
+INTEGRATORS = (TIME_DOMAIN, FREQUENCY_DOMAIN)
+FREQUENCY_CUTOFF = 0.1      # Hz, below it the spectrum is dropped instead of divided by ω²
+BASELINE_ORDER = 2          # polynomial removed after the frequency-domain integration, None = off
+PIPELINE_VERSION = 1        # bump when the processing changes, old cache entries stop matching
+PROCESSING = {
+    "detrend": "linear",
+    "taper": 0.05,
+    "taper_type": "hann",
+    "freqmin": 0.1,
+    "freqmax": 20.0,
+    "corners": 4,
+    "zerophase": True,
+    "integration": "cumtrapz",
+}
+
+
+def prepare_with_obspy(trace, amplitude=1600) -> tuple[NDArray[np.int64], float]:
+    """
+    La misma preparación con los métodos de Trace de ObsPy. Es la referencia
+    con la que se compara prepare_for_playback() (python -m shared.trace_pipeline).
+
+    Args:
+        trace: Traza de ObsPy (puede ser aceleración, velocidad o desplazamiento)
+        amplitude: Amplitud máxima en pasos del motor (default: 1600)
+
+    Returns:
+        tuple: (datos_escalados, intervalo_muestreo)
+    """
+    working_trace = trace.copy()
+
+    # Paso 1: Detrend y taper para reducir artefactos
+    working_trace.detrend(PROCESSING["detrend"])
+    working_trace.taper(max_percentage=PROCESSING["taper"], type=PROCESSING["taper_type"])
+
+    # Paso 2: Filtrado bandpass para eliminar ruido
+    working_trace.filter('bandpass', freqmin=PROCESSING["freqmin"], freqmax=PROCESSING["freqmax"],
+                         corners=PROCESSING["corners"], zerophase=PROCESSING["zerophase"])
+
+    # Paso 3: Integración doble (aceleración → velocidad → desplazamiento)
+    # Si la traza ya es desplazamiento, esto no causará problemas
+    working_trace.integrate(method=PROCESSING["integration"])
+    working_trace.integrate(method=PROCESSING["integration"])
+
+    # Convertir a array numpy
+    data = working_trace.data.astype(np.float64)
+
+    if data.size == 0:
+        raise ValueError("La traza no contiene muestras.")
+
+    # Normalizar y escalar
+    max_abs = np.max(np.abs(data))
+    if not np.isfinite(max_abs) or max_abs == 0:
+        raise ValueError("La amplitud de la traza es cero o inválida.")
+
+    # Escalar a la amplitud deseada (en pasos del motor)
+    amplitude = max(int(abs(amplitude)), 1)
+    scaled = np.clip((data / max_abs) * amplitude, -amplitude, amplitude).astype(int)
+
+    # Obtener intervalo de muestreo
+    sample_interval = getattr(working_trace.stats, 'delta', None)
+    if sample_interval is None or not np.isfinite(sample_interval) or sample_interval <= 0:
+        sample_interval = DEFAULT_INTERVAL
+
+    return scaled, float(sample_interval)
+
+
+@lru_cache(maxsize=32)
+def _filter_sos(sampling_rate: float, freqmin: float, freqmax: float, corners: int) -> NDArray[np.float64]:
+    """Butterworth bandpass as second-order sections, designed like obspy.signal.filter.bandpass."""
+    nyquist = 0.5 * sampling_rate
+    if freqmax / nyquist - 1.0 > -1e-6:
+        # el corte superior cae en Nyquist o más arriba: ObsPy aplica solo el pasa-altos
+        return iirfilter(corners, freqmin / nyquist, btype="highpass", ftype="butter", output="sos")
+    return iirfilter(corners, [freqmin / nyquist, freqmax / nyquist], btype="band", ftype="butter", output="sos")
+
+
+@lru_cache(maxsize=32)
+def _taper_sides(npts: int, max_percentage: float, kind: str) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """Rising and falling ends of the taper, same length rule as Trace.taper()."""
+    half = min(int(max_percentage * npts), npts // 2)
+    window = get_window(kind, 2 * half if 2 * half == npts else 2 * half + 1, fftbins=False)
+    return window[:half], window[len(window) - half:]
+
+
+def _detrend_linear(x: NDArray):
+    """Removes the least-squares line in place (closed form, one scratch array)."""
+    n = len(x)
+    if n < 2:
+        x -= x.mean()
+        return
+    t = np.arange(n, dtype=x.dtype)
+    t_mean = 0.5 * (n - 1)
+    x_mean = x.mean()
+    slope = (np.dot(t, x) - n * t_mean * x_mean) / (n * (n * n - 1) / 12.0)
+    t *= slope
+    t += x_mean - slope * t_mean
+    x -= t
+
+
+def _integrate(x: NDArray, dx: float, out: NDArray) -> NDArray:
+    """
+    Cumulative trapezoid into out, first value 0 (scipy's cumulative_trapezoid(initial=0)):
+    dx * (x[0] + ... + x[i] - (x[0] + x[i]) / 2). x is left halved.
+    """
+    first = x[0]
+    np.cumsum(x, out=out, dtype=np.float64)  # float64 accumulator also for float32 buffers
+    x *= 0.5
+    out -= x
+    out -= 0.5 * first
+    out *= dx
+    return out
+
+
+def integrate_twice_frequency(x: NDArray, sample_interval: float, cutoff: float = FREQUENCY_CUTOFF,
+                              baseline_order: int | None = BASELINE_ORDER) -> NDArray:
+    """
+    Acceleration -> displacement by dividing the spectrum by (iω)² = -ω².
+
+    The record is zero padded to a fast FFT length of at least twice its
+    size, so the two ends do not wrap into each other. Below cutoff the
+    division would blow up whatever drift is left, so those bins are
+    dropped, with a half-cosine ramp from cutoff/2 to avoid ringing. A
+    polynomial of baseline_order is then fitted and subtracted, which
+    removes what the cutoff cannot (the ends of a finite record).
+    """
+    n = len(x)
+    size = next_fast_len(2 * n, real=True)
+    spectrum = rfft(x, size)
+    omega = 2 * np.pi * rfftfreq(size, sample_interval)
+    low, high = np.pi * cutoff, 2 * np.pi * cutoff
+    gain = np.zeros(len(omega))
+    passband = omega >= high
+    gain[passband] = -1.0 / omega[passband] ** 2
+    ramp = (omega > low) & ~passband
+    gain[ramp] = -0.5 * (1 - np.cos(np.pi * (omega[ramp] - low) / (high - low))) / omega[ramp] ** 2
+    spectrum *= gain
+    out = irfft(spectrum, size)[:n].astype(x.dtype, copy=False)
+    if baseline_order is not None and n > baseline_order:
+        t = np.linspace(-1.0, 1.0, n)
+        out -= np.polynomial.polynomial.polyval(t, np.polynomial.polynomial.polyfit(t, out, baseline_order)).astype(x.dtype)
+    return out
+
+
+def displacement(data, sample_interval: float, dtype=np.float64, integrator: str = TIME_DOMAIN) -> NDArray:
+    """
+    Record (acceleration, velocity or displacement) -> displacement, not
+    scaled. Same steps as prepare_with_obspy() on raw arrays: one copy of
+    the data, detrend/taper/integration in place, filter coefficients and
+    taper windows cached. dtype=np.float32 halves the memory traffic; it
+    stays within TOLERANCE on the bundled records but drifts a few steps on
+    records of millions of samples. integrator picks the double integration.
+    """
+    if integrator not in INTEGRATORS:
+        raise ValueError(f"unknown integrator {integrator!r}, expected one of {INTEGRATORS}")
+    x = np.array(data, dtype=dtype)
+    if x.size == 0:
+        raise ValueError("La traza no contiene muestras.")
+
+    # Paso 1: Detrend y taper para reducir artefactos (solo se tocan los extremos)
+    _detrend_linear(x)
+    rising, falling = _taper_sides(len(x), PROCESSING["taper"], PROCESSING["taper_type"])
+    if len(rising):
+        x[:len(rising)] *= rising
+        x[len(x) - len(falling):] *= falling
+
+    # Paso 2: Filtrado de fase cero, ida y vuelta con sosfilt como hace ObsPy
+    # (sosfiltfilt rellena los bordes y tras la doble integración se nota en cientos de pasos)
+    sos = _filter_sos(1.0 / sample_interval, PROCESSING["freqmin"], PROCESSING["freqmax"], PROCESSING["corners"])
+    x = sosfilt(sos, x)
+    if PROCESSING["zerophase"]:
+        x = sosfilt(sos, x[::-1])[::-1]
+    x = np.ascontiguousarray(x, dtype=dtype)
+
+    # Paso 3: Integración doble (aceleración → velocidad → desplazamiento)
+    if integrator == FREQUENCY_DOMAIN:
+        return integrate_twice_frequency(x, sample_interval)
+    # en el tiempo, alternando dos buffers
+    velocity = _integrate(x, sample_interval, np.empty_like(x))
+    return _integrate(velocity, sample_interval, x)
+
+
+def displacement_steps(data, sample_interval: float, amplitude=1600, dtype=np.float64,
+                       integrator: str = TIME_DOMAIN) -> NDArray[np.int64]:
+    """displacement() normalised to ±amplitude steps."""
+    x = displacement(data, sample_interval, dtype, integrator)
+
+    # Normalizar y escalar
+    max_abs = max(float(x.max()), -float(x.min()))
+    if not np.isfinite(max_abs) or max_abs == 0:
+        raise ValueError("La amplitud de la traza es cero o inválida.")
+    amplitude = max(int(abs(amplitude)), 1)
+    x *= amplitude / max_abs
+    np.clip(x, -amplitude, amplitude, out=x)
+    return x.astype(int)
+
+
+def prepare_for_playback(trace, amplitude=1600, dtype=np.float64,
+                         integrator: str = TIME_DOMAIN) -> tuple[NDArray[np.int64], float]:
+    """
+    Prepara la traza sísmica para reproducción en la mesa.
+    Convierte aceleración/velocidad a desplazamiento mediante integración doble.
+
+    Args:
+        trace: Traza de ObsPy (puede ser aceleración, velocidad o desplazamiento)
+        amplitude: Amplitud máxima en pasos del motor (default: 1600)
+        dtype: np.float64 o np.float32 para el cálculo
+        integrator: TIME_DOMAIN (cumtrapz dos veces) o FREQUENCY_DOMAIN
+
+    Returns:
+        tuple: (datos_escalados, intervalo_muestreo)
+    """
+    # Obtener intervalo de muestreo
+    sample_interval = getattr(trace.stats, 'delta', None)
+    if sample_interval is None or not np.isfinite(sample_interval) or sample_interval <= 0:
+        sample_interval = DEFAULT_INTERVAL
+    scaled = displacement_steps(trace.data, sample_interval, amplitude, dtype, integrator)
+    amplitude = max(int(abs(amplitude)), 1)
+    print(f"Viewer: Traza preparada - {len(scaled)} muestras, intervalo: {sample_interval:.4f}s, amplitud: ±{amplitude} pasos")
+    return scaled, float(sample_interval)
+
+
+def to_command_rate(scaled, sample_interval: float, amplitude, command_rate: float,
+                    method: str = BANDLIMITED, cache=None, key=None) -> tuple[NDArray[np.int64], float]:
+    """
+    scaled (steps every sample_interval) resampled to command_rate and clipped
+    back to ±amplitude, cubic interpolation can overshoot a little. With an
+    UpsampleCache and a trace key the result is looked up there first.
+    """
+    if len(scaled) < 2:
+        return np.asarray(scaled), sample_interval
+    if cache is not None:
+        resampled = cache.get(key, scaled, 1.0 / sample_interval, float(command_rate), method)
+    else:
+        resampled = resample_trajectory(scaled, 1.0 / sample_interval, float(command_rate), method)
+    limit = max(int(abs(amplitude)), 1)
+    return np.clip(resampled, -limit, limit).astype(int), 1.0 / float(command_rate)
+
+
+def playback_parameters(amplitude, command_rate=NATIVE, method: str = BANDLIMITED, dtype=np.float64,
+                        integrator: str = TIME_DOMAIN) -> dict:
+    """Everything prepare() depends on besides the trace itself."""
+    parameters = dict(PROCESSING, version=PIPELINE_VERSION, amplitude=max(int(abs(amplitude)), 1),
+                      command_rate=command_rate if command_rate == NATIVE else float(command_rate),
+                      dtype=np.dtype(dtype).name)
+    if command_rate != NATIVE:
+        parameters["interpolation"] = method
+    if integrator == FREQUENCY_DOMAIN:
+        parameters.update(integration=integrator, cutoff=FREQUENCY_CUTOFF, baseline_order=BASELINE_ORDER)
+    return parameters
+
+
+def prepare(trace, amplitude=1600, command_rate=NATIVE, method: str = BANDLIMITED,
+            cache: TrajectoryCache | None = None, file_path: str | None = None,
+            dtype=np.float64, integrator: str = TIME_DOMAIN) -> tuple[NDArray[np.int64], float]:
+    """
+    prepare_for_playback() + to_command_rate(), looked up in cache first when
+    the file the trace was read from is known.
+    """
+    key = None
+    if cache is not None and file_path:
+        key = cache.key(file_path, f"{trace.id}@{trace.stats.starttime}",
+                        playback_parameters(amplitude, command_rate, method, dtype, integrator))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    scaled, sample_interval = prepare_for_playback(trace, amplitude, dtype, integrator)
+    if command_rate != NATIVE:
+        scaled, sample_interval = to_command_rate(scaled, sample_interval, amplitude, float(command_rate), method)
+    if key is not None:
+        return cache.put(key, scaled, sample_interval)
+    return scaled, sample_interval
+
+
+def obspy_difference(trace, amplitude=1600) -> tuple[int, int]:
+    """Largest |difference| in steps of prepare_for_playback(), float64 and float32, against prepare_with_obspy()."""
+    with redirect_stdout(StringIO()):
+        reference, _ = prepare_with_obspy(trace, amplitude)
+        native, _ = prepare_for_playback(trace, amplitude)
+        single, _ = prepare_for_playback(trace, amplitude, np.float32)
+    return int(np.abs(native - reference).max()), int(np.abs(single - reference).max())
+
+
+def check_against_obspy(files: list[str] | None = None, amplitude=1600) -> int:
+    """
+    obspy_difference() of every trace in files (default: the bundled
+    records); returns the largest one and raises AssertionError naming the
+    trace when it is over TOLERANCE.
+    """
+    from obspy import read
+    worst = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # ObsPy avisa cada vez que el pasa-banda cae en pasa-altos
+        for path in files or sorted(glob.glob(os.path.join(RECORDS_FOLDER, "*.miniseed"))):
+            for trace in read(path):
+                difference = max(obspy_difference(trace, amplitude))
+                if difference > TOLERANCE:
+                    raise AssertionError(f"{trace.id}: {difference} steps from the ObsPy reference "
+                                         f"(tolerance {TOLERANCE})")
+                worst = max(worst, difference)
+    return worst
+
+
+def _best_time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _stroke_use(x: NDArray, sample_interval: float) -> tuple[float, float]:
+    """
+    Share of the peak taken by motion slower than FREQUENCY_CUTOFF (moving
+    average over one cutoff period) and the offset left at the end: both
+    are table stroke spent on drift instead of shaking.
+    """
+    from scipy.ndimage import uniform_filter1d
+    peak = np.abs(x).max()
+    slow = uniform_filter1d(x, max(int(round(1.0 / (FREQUENCY_CUTOFF * sample_interval))), 1), mode="nearest")
+    return float(np.abs(slow).max() / peak), float(abs(x[-1]) / peak)
+
+
+def _compare_integrators(files: list[str], repeat: int):
+    from obspy import read
+    print(f"{'trace':22s} {'samples':>8s}  " + "  ".join(f"{name:>9s} {'drift':>5s} {'end':>5s}" for name in INTEGRATORS))
+    for path in files:
+        print(os.path.basename(path))
+        for trace in read(path):
+            dt = trace.stats.delta
+            row = f"{trace.id:22s} {trace.stats.npts:8d}  "
+            for integrator in INTEGRATORS:
+                elapsed = _best_time(lambda: displacement(trace.data, dt, integrator=integrator), repeat)
+                drift, end = _stroke_use(displacement(trace.data, dt, integrator=integrator), dt)
+                row += f"{elapsed * 1e3:7.2f}ms {drift:5.2f} {end:5.2f}  "
+            print(row.rstrip())
+
+
+def main():
+    from obspy import read
+
+    parser = argparse.ArgumentParser(description="Native pipeline vs the ObsPy reference: difference and timing.")
+    parser.add_argument("files", nargs="*", help=f"miniSEED files (default: {RECORDS_FOLDER})")
+    parser.add_argument("--amplitude", type=int, default=1600)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the best one is kept")
+    parser.add_argument("--integrators", action="store_true", help="compare the time and frequency-domain integrators")
+    parser.add_argument("--check", action="store_true", help="only check the difference against ObsPy, no timing")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(RECORDS_FOLDER, "*.miniseed")))
+    if args.check:
+        try:
+            worst = check_against_obspy(files, args.amplitude)
+        except AssertionError as exc:
+            print(f"FAIL: {exc}")
+            raise SystemExit(1)
+        print(f"ok: largest difference {worst} steps (tolerance {TOLERANCE})")
+        return
+    warnings.simplefilter("ignore")  # ObsPy avisa cada vez que el pasa-banda cae en pasa-altos
+    if args.integrators:
+        _compare_integrators(files, args.repeat)
+        return
+    print(f"{'trace':22s} {'samples':>8s} {'obspy':>9s} {'float64':>9s} {'float32':>9s}  max |diff| steps")
+    worst = 0
+    totals = np.zeros(3)
+    for path in files:
+        for trace in read(path):
+            errors = obspy_difference(trace, args.amplitude)
+            with redirect_stdout(StringIO()):
+                times = [_best_time(lambda: prepare_with_obspy(trace, args.amplitude), args.repeat),
+                         _best_time(lambda: prepare_for_playback(trace, args.amplitude), args.repeat),
+                         _best_time(lambda: prepare_for_playback(trace, args.amplitude, np.float32), args.repeat)]
+            worst = max(worst, *errors)
+            totals += times
+            print(f"{trace.id:22s} {trace.stats.npts:8d} " + " ".join(f"{t * 1e3:7.2f}ms" for t in times)
+                  + f"  {errors[0]} / {errors[1]}")
+    print(f"{'total':22s} {'':8s} " + " ".join(f"{t * 1e3:7.2f}ms" for t in totals)
+          + f"  x{totals[0] / totals[1]:.1f} / x{totals[0] / totals[2]:.1f} faster")
+    status = "ok" if worst <= TOLERANCE else "FAIL"
+    print(f"{status}: largest difference {worst} steps (tolerance {TOLERANCE})")
+    raise SystemExit(0 if worst <= TOLERANCE else 1)
+
+if __name__ == "__main__":
+    main()
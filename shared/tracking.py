@@ -0,0 +1,185 @@
+# tracking.py
+# Online tracking analysis of a playback: how far the table (encoder) is
+# from the commanded trajectory and how late it follows it.
+#
+# The commanded trajectory is the plan, known in advance, so the commanded
+# position at any encoder timestamp is an index lookup. The encoder stream
+# is read incrementally from the TelemetryRing (only what is new). Errors
+# are accumulated per encoder sample; for the lag the encoder is reduced to
+# one value per command period and a windowed cross-correlation against the
+# plan is kept up to date in O(max lag) per period: sliding sums of the
+# plan come from prefix sums, only the encoder side needs a small ring.
+
+import threading
+
+import numpy as np
+from numpy.typing import NDArray
+
+from shared.telemetry import TelemetryRing
+
+STEPS_X_REV = 3200                      # same as app2/logic.py
+STEPS_PER_DEGREE = STEPS_X_REV / 360.0  # encoder on the motor shaft
+WINDOW = 2.0                            # s of history in the correlation
+MAX_LAG = 0.25                          # s, largest lag searched
+
+
+class TrackingAnalyzer:
+    """
+    Tracking error and lag of one playback.
+
+    positions/sample_interval describe the plan, t0 is when sample 0 was
+    sent on the telemetry time axis and encoder_origin the encoder reading
+    (degrees) at that moment, i.e. commanded position 0; None takes the
+    first sample polled. poll() can be called from any thread.
+    """
+
+    def __init__(self, positions, sample_interval: float, t0: float, encoder_origin: float | None = None,
+                 steps_per_degree: float = STEPS_PER_DEGREE, window: float = WINDOW, max_lag: float = MAX_LAG):
+        self.positions: NDArray[np.float64] = np.asarray(positions, dtype=np.float64)
+        self.sample_interval = float(sample_interval)
+        self.t0 = t0
+        self.encoder_origin = encoder_origin
+        self.steps_per_degree = steps_per_degree
+        self.window = max(int(round(window / sample_interval)), 4)
+        self.max_lag = min(max(int(round(max_lag / sample_interval)), 1), self.window - 1)
+        self.index = 0      # next telemetry sample to read
+        self._lock = threading.Lock()
+
+        # error statistics over every encoder sample inside the plan
+        self.count = 0
+        self.sum_sq = 0.0
+        self.peak = 0.0
+
+        # plan padded with max_lag samples of the start position (the table was at rest there)
+        lead = np.full(self.max_lag, self.positions[0] if len(self.positions) else 0.0)
+        self._command = np.concatenate((lead, self.positions))
+        self._prefix = np.concatenate(([0.0], np.cumsum(self._command)))
+        self._prefix_sq = np.concatenate(([0.0], np.cumsum(self._command ** 2)))
+
+        # encoder reduced to one value per command period
+        self.periods = 0                # next period to close
+        self._filled = 0                # periods in the ring since the last rebase
+        self._holding = False
+        self._open_value: float | None = None
+        self._held = 0.0
+        self._measured = np.zeros(self.window)
+        self._cross = np.zeros(self.max_lag + 1)   # sum over the window of c[n - k] * m[n], k = 0..max_lag
+        self._sum_m = 0.0
+        self._sum_m2 = 0.0
+
+    # --- feeding ---------------------------------------------------------
+    def poll(self, telemetry: TelemetryRing) -> tuple[NDArray[np.int64], NDArray[np.float64]]:
+        """Reads the new telemetry; returns the periods closed by it and their measured steps."""
+        with self._lock:
+            times, degrees, self.index = telemetry.since(max(self.index, telemetry.start_index))
+            return self._update(times, degrees)
+
+    def start_at(self, telemetry: TelemetryRing):
+        """Only telemetry written from now on belongs to this playback."""
+        self.index = telemetry.write_index
+
+    def hold(self):
+        """Playback paused or seeking: ignore the encoder until rebase()."""
+        with self._lock:
+            self._holding = True
+
+    def rebase(self, period: int, t0: float):
+        """Timed playback restarts at period, whose sample 0 would have been sent at t0."""
+        with self._lock:
+            self.t0 = t0
+            self.periods = period
+            self._filled = 0
+            self._open_value = None
+            self._measured[:] = 0.0
+            self._cross[:] = 0.0
+            self._sum_m = 0.0
+            self._sum_m2 = 0.0
+            self._holding = False
+
+    def _update(self, times, degrees):
+        closed_periods: list[int] = []
+        closed_values: list[float] = []
+        if len(times) == 0 or len(self.positions) == 0 or self._holding:
+            return np.array(closed_periods, dtype=np.int64), np.array(closed_values)
+        if self.encoder_origin is None:
+            self.encoder_origin = float(degrees[0])
+        measured = (degrees - self.encoder_origin) * self.steps_per_degree
+        periods = np.floor((times - self.t0) / self.sample_interval).astype(np.int64)
+        inside = (periods >= 0) & (periods < len(self.positions))
+        if inside.any():
+            error = self.positions[periods[inside]] - measured[inside]
+            self.count += int(inside.sum())
+            self.sum_sq += float(np.dot(error, error))
+            self.peak = max(self.peak, float(np.abs(error).max()))
+
+        # first encoder value of each period, taken when its command was just sent;
+        # a period closes when a later one starts
+        for period, value in zip(periods[inside].tolist(), measured[inside].tolist()):
+            while period > self.periods:
+                self._close_period(closed_periods, closed_values)
+            if self._open_value is None and period == self.periods:
+                self._open_value = value
+        return np.array(closed_periods, dtype=np.int64), np.array(closed_values)
+
+    def _close_period(self, closed_periods: list[int], closed_values: list[float]):
+        n = self.periods
+        value = self._held if self._open_value is None else self._open_value
+        self._held = value
+        self._open_value = None
+        slot = n % self.window
+        lags = n + self.max_lag - np.arange(self.max_lag + 1)   # c[n - k] in the padded plan
+        if self._filled >= self.window:
+            old = self._measured[slot]
+            self._cross -= self._command[lags - self.window] * old
+            self._sum_m -= old
+            self._sum_m2 -= old * old
+        self._measured[slot] = value
+        self._cross += self._command[lags] * value
+        self._sum_m += value
+        self._sum_m2 += value * value
+        self.periods = n + 1
+        self._filled += 1
+        closed_periods.append(n)
+        closed_values.append(value)
+
+    # --- results ---------------------------------------------------------
+    @property
+    def rms(self) -> float:
+        return float(np.sqrt(self.sum_sq / self.count)) if self.count else 0.0
+
+    @property
+    def lag(self) -> float | None:
+        """Seconds the table trails the plan over the last window, None until there is enough motion."""
+        with self._lock:
+            n = self.periods
+            size = min(self._filled, self.window)
+            if size < self.window // 2:
+                return None
+            mean_m = self._sum_m / size
+            var_m = self._sum_m2 / size - mean_m * mean_m
+            if var_m <= 1e-9:
+                return None
+            # plan sums over the same window shifted by each lag, from the prefix sums
+            end = n - 1 + self.max_lag - np.arange(self.max_lag + 1) + 1
+            begin = end - size
+            sum_c = self._prefix[end] - self._prefix[begin]
+            sum_c2 = self._prefix_sq[end] - self._prefix_sq[begin]
+            mean_c = sum_c / size
+            var_c = sum_c2 / size - mean_c * mean_c
+            covariance = self._cross / size - mean_c * mean_m
+            with np.errstate(invalid="ignore", divide="ignore"):
+                correlation = np.where(var_c > 1e-9, covariance / np.sqrt(var_c * var_m), -np.inf)
+        best = int(np.argmax(correlation))
+        shift = 0.0
+        if 0 < best < self.max_lag and np.isfinite(correlation[best - 1:best + 2]).all():
+            # parabola through the peak and its neighbours
+            left, centre, right = correlation[best - 1:best + 2]
+            denominator = left - 2 * centre + right
+            if denominator < 0:
+                shift = 0.5 * (left - right) / denominator
+        return (best + shift) * self.sample_interval
+
+    def summary(self) -> str:
+        lag = self.lag
+        lag_text = "n/a" if lag is None else f"{lag * 1e3:.0f} ms"
+        return f"tracking error rms {self.rms:.1f} peak {self.peak:.0f} steps | lag {lag_text}"
@@ -0,0 +1,143 @@
+# trajectory_cache.py
+# Persistent cache of processed playback trajectories. Preparing a long
+# record (filtering, double integration, resampling) takes seconds and gives
+# the same steps every time for the same input, so the result is stored
+# under a key made of the content hash of the source file, the trace id and
+# every processing parameter (amplitude included). Two tiers: a small LRU in
+# memory and one .npz per entry on disk, shared by both apps and by the
+# playlist worker process. The disk tier is bounded by total size; the
+# entries read least recently (file mtime, refreshed on every hit) go first.
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from numpy.typing import NDArray
+
+MEMORY_ITEMS = 16
+MAX_BYTES = 256 * 1024 * 1024       # disk tier
+EXTENSION = ".npz"
+
+_digests: dict[tuple[str, int, int], str] = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """sha256 of the file contents, remembered while size and mtime do not change."""
+    info = os.stat(path)
+    stamp = (os.path.abspath(path), info.st_size, info.st_mtime_ns)
+    with _digests_lock:
+        if stamp in _digests:
+            return _digests[stamp]
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            digest.update(chunk)
+    with _digests_lock:
+        _digests[stamp] = digest.hexdigest()
+    return _digests[stamp]
+
+
+class TrajectoryCache:
+    """
+    get(key) -> (steps, sample_interval) or None, put(key, steps, sample_interval).
+
+    Keys come from key(); steps returned are read-only and shared between
+    callers. Writes go to a temporary file and are renamed into place, so
+    several processes can use the same folder.
+    """
+
+    def __init__(self, folder: str, max_bytes: int = MAX_BYTES, memory_items: int = MEMORY_ITEMS):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory: OrderedDict[str, tuple[NDArray, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(file_path: str, trace_id: str, parameters: dict) -> str:
+        """Content hash of the file + trace id + processing parameters, as a file name."""
+        text = json.dumps([file_digest(file_path), trace_id, parameters], sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + EXTENSION)
+
+    def get(self, key: str) -> tuple[NDArray, float] | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        path = self._path(key)
+        try:
+            with np.load(path) as stored:
+                entry = (stored["steps"], float(stored["sample_interval"]))
+            os.utime(path)  # recently used, evicted last
+        except (OSError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        return self._remember(key, entry)
+
+    def put(self, key: str, steps, sample_interval: float) -> tuple[NDArray, float]:
+        entry = self._remember(key, (np.array(steps), float(sample_interval)))
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            temporary = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as target:
+                np.savez(target, steps=entry[0], sample_interval=entry[1])
+            os.replace(temporary, self._path(key))
+            self._evict()
+        except OSError as exc:
+            print(f"trajectory cache: no se pudo guardar en disco ({exc})")
+        return entry
+
+    def _remember(self, key: str, entry: tuple[NDArray, float]) -> tuple[NDArray, float]:
+        entry[0].flags.writeable = False
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+        return entry
+
+    def _evict(self):
+        """Deletes the least recently used files until the folder fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(EXTENSION):
+                continue
+            try:
+                info = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue  # removed by another process
+            entries.append((info.st_mtime_ns, info.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if os.path.isdir(self.folder):
+            for name in os.listdir(self.folder):
+                if name.endswith(EXTENSION):
+                    os.remove(os.path.join(self.folder, name))
+
+    def summary(self) -> str:
+        return f"cache: {self.memory_hits} memory hits, {self.disk_hits} disk hits, {self.misses} misses"
@@ -0,0 +1,80 @@
+# upsampler.py
+# Command-rate resampling of a trajectory. The seismic records come at
+# their own rate (20-200 Hz) but the link carries several hundred setpoints
+# per second, so the stepper can follow a smooth curve instead of jumping
+# between coarse targets. All methods are vectorized over the whole trace
+# and their results are cached per (trace, rate, method), so changing the
+# rate in the GUI only costs a dictionary lookup the second time.
+
+from collections import OrderedDict
+from fractions import Fraction
+from typing import Hashable
+
+import numpy as np
+from numpy.typing import NDArray
+from scipy.interpolate import CubicSpline
+from scipy.signal import resample_poly
+
+LINEAR = "linear"
+CUBIC = "cubic"
+BANDLIMITED = "bandlimited"
+METHODS = (LINEAR, CUBIC, BANDLIMITED)
+COMMAND_RATES = (20, 50, 100, 200, 500)     # Hz, offered in the GUIs
+
+
+def resample_trajectory(data, source_rate: float, target_rate: float, method: str = BANDLIMITED) -> NDArray[np.float64]:
+    """
+    data sampled at source_rate, resampled to target_rate over the same time span.
+
+    linear and cubic interpolate between the original samples (cubic is a
+    natural spline, smooth velocity); bandlimited is a polyphase FIR
+    resampler, which is also the right choice when target_rate is lower
+    than source_rate since it filters before decimating.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown interpolation {method!r}, expected one of {METHODS}")
+    data = np.asarray(data, dtype=np.float64)
+    if len(data) < 2 or source_rate == target_rate:
+        return data.copy()
+    count = int(np.floor((len(data) - 1) * target_rate / source_rate)) + 1
+
+    if method == BANDLIMITED:
+        ratio = Fraction(target_rate / source_rate).limit_denominator(1000)
+        out = resample_poly(data, ratio.numerator, ratio.denominator, padtype="line")
+        if len(out) < count:
+            out = np.pad(out, (0, count - len(out)), mode="edge")
+        return out[:count]
+
+    t_in = np.arange(len(data)) / source_rate
+    t_out = np.arange(count) / target_rate
+    if method == LINEAR:
+        return np.interp(t_out, t_in, data)
+    return CubicSpline(t_in, data, bc_type="natural")(t_out)
+
+
+class UpsampleCache:
+    """Small LRU of resampled trajectories keyed by (trace key, rate, method)."""
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self._items: OrderedDict[tuple, NDArray[np.float64]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, trace_key: Hashable, data, source_rate: float, target_rate: float,
+            method: str = BANDLIMITED) -> NDArray[np.float64]:
+        key = (trace_key, float(target_rate), method)
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        self.misses += 1
+        out = resample_trajectory(data, source_rate, target_rate, method)
+        out.flags.writeable = False  # shared between callers
+        self._items[key] = out
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return out
+
+    def clear(self):
+        self._items.clear()
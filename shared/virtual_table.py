@@ -0,0 +1,238 @@
+# virtual_table.py
+# Virtual shake table: a Linux pseudo-terminal that behaves like the ESP32
+# running microcontrolador/micro2nucleoV2.ino, so the send/receive paths of
+# both apps can be exercised without the physical table.
+#
+#   python -m shared.virtual_table --rate 1000
+#
+# prints the port path (e.g. /dev/pts/5); open it from SerialManager or
+# serial_handler.connect_serial like any COM port, or export it as
+# VIRTUAL_TABLE_PORT so it shows up in the GUI port list.
+
+import argparse
+import math
+import os
+import pty
+import select
+import threading
+import time
+import tty
+
+from shared.playback_plan import DELTA_PREFIX, decode_delta_frame
+
+MAX_CHARS_COMMAND = 32      # receivedChars[] in the firmware
+CPR = 4096                  # AS5600 counts per revolution
+STEPS_X_REV = 3200          # driver microstepping, same as app2/logic.py
+BANNER = (
+    "Sistema inicializado. Listo para recibir comandos.\r\n"
+    "Comandos: m<pos>, s<vel>, a<acel>, e<0/1>, d<varint>\r\n"
+    "iman detectado. Intensidad: 512\r\n"
+    "Intensidad óptima\r\n"
+)
+
+
+def _atoi(chars: bytes) -> int:
+    """C atoi(): optional sign and leading digits, anything else stops it."""
+    chars = chars.lstrip(b" \t")
+    sign = 1
+    if chars[:1] in (b"-", b"+"):
+        sign = -1 if chars[:1] == b"-" else 1
+        chars = chars[1:]
+    value = 0
+    for c in chars:
+        if not 48 <= c <= 57:
+            break
+        value = value * 10 + (c - 48)
+    return sign * value
+
+
+class TrapezoidalStepper:
+    """Speed/acceleration limited motion towards a target, like FastAccelStepper."""
+
+    def __init__(self, speed_hz: float = 1_000_000, acceleration: float = 10_000_000):
+        self.speed_hz = float(speed_hz)
+        self.acceleration = float(acceleration)
+        self.position = 0.0     # steps
+        self.velocity = 0.0     # steps/s
+        self.target = 0         # steps
+
+    def move(self, steps: int):
+        """stepper->move(): relative to the current target position."""
+        self.target += steps
+
+    def update(self, dt: float):
+        error = self.target - self.position
+        if error == 0 and self.velocity == 0:
+            return
+        # fastest speed from which we can still stop on the target
+        reachable = math.sqrt(2.0 * self.acceleration * abs(error))
+        desired = math.copysign(min(self.speed_hz, reachable), error)
+        dv = self.acceleration * dt
+        if desired > self.velocity:
+            self.velocity = min(desired, self.velocity + dv)
+        else:
+            self.velocity = max(desired, self.velocity - dv)
+        self.position += self.velocity * dt
+        # crossing the target at low speed means we arrived
+        if (self.target - self.position) * error <= 0 and abs(self.velocity) <= dv:
+            self.position = float(self.target)
+            self.velocity = 0.0
+
+
+class VirtualTable:
+    """
+    Emulated ESP32 + stepper + AS5600 behind a pty.
+
+    Commands follow the firmware: bytes are collected until '\\n' in a
+    32 char buffer (extra chars overwrite the last slot), then the first
+    char selects m (relative move), s (speed Hz) or a (acceleration) and
+    atoi() of the rest is the argument. A 'd' at the start of a command is
+    a binary relative move: zigzag varint bytes follow, no '\n'. Encoder
+    degrees are printed with println() at encoder_rate_hz.
+    """
+
+    def __init__(self, encoder_rate_hz: float = 1000.0, speed_hz: float = 1_000_000,
+                 acceleration: float = 10_000_000, banner: bool = True):
+        self.encoder_rate_hz = float(encoder_rate_hz)
+        self.stepper = TrapezoidalStepper(speed_hz, acceleration)
+        self.banner = banner
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+        self._command = bytearray()
+        self._frame: bytearray | None = None     # binary 'd' frame being received
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        # counters for benchmarks
+        self.commands_received = {"m": 0, "d": 0, "s": 0, "a": 0, "other": 0}
+        self.bytes_received = 0
+        self.samples_sent = 0
+        self.last_command_ns = 0
+
+    def start(self):
+        if self.banner:
+            os.write(self._master, BANNER.encode("utf-8"))
+        self._threads = [
+            threading.Thread(target=self._receive_thread, daemon=True),
+            threading.Thread(target=self._encoder_thread, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def encoder_degrees(self) -> float:
+        counts = round(self.stepper.position * CPR / STEPS_X_REV)
+        return counts * 360.0 / CPR
+
+    def _receive_thread(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            self.bytes_received += len(data)
+            for byte in data:
+                if self._frame is not None:
+                    self._frame.append(byte)
+                    if not byte & 0x80 or len(self._frame) > 5:
+                        self._execute_delta(decode_delta_frame(self._frame))
+                        self._frame = None
+                elif byte == DELTA_PREFIX[0] and not self._command:
+                    self._frame = bytearray(DELTA_PREFIX)
+                elif byte != 0x0A:
+                    if len(self._command) < MAX_CHARS_COMMAND - 1:
+                        self._command.append(byte)
+                    else:
+                        self._command[-1] = byte
+                else:
+                    self._execute(bytes(self._command))
+                    self._command.clear()
+
+    def _execute(self, command: bytes):
+        self.last_command_ns = time.perf_counter_ns()
+        kind = command[:1].decode("ascii", errors="replace")
+        value = _atoi(command[1:])
+        with self._lock:
+            if kind == "m":
+                self.stepper.move(value)
+            elif kind == "s":
+                self.stepper.speed_hz = float(value)
+            elif kind == "a":
+                self.stepper.acceleration = float(value)
+            else:
+                kind = "other"
+        self.commands_received[kind] += 1
+
+    def _execute_delta(self, steps: int):
+        self.last_command_ns = time.perf_counter_ns()
+        with self._lock:
+            self.stepper.move(steps)
+        self.commands_received["d"] += 1
+
+    def _encoder_thread(self):
+        period = 1.0 / self.encoder_rate_hz
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            if now < next_sample:
+                time.sleep(min(next_sample - now, 0.01))
+                continue
+            # vTaskDelayUntil keeps the rate, so catch up in one write if we were late
+            lines = []
+            with self._lock:
+                while next_sample <= now:
+                    self.stepper.update(period)
+                    lines.append(f"{self.encoder_degrees():.2f}\r\n")
+                    next_sample += period
+            try:
+                os.write(self._master, "".join(lines).encode("ascii"))
+            except OSError:
+                return
+            self.samples_sent += len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual shake table on a pseudo-terminal.")
+    parser.add_argument("--rate", type=float, default=1000.0, help="encoder samples per second")
+    parser.add_argument("--speed", type=float, default=1_000_000, help="initial speed (steps/s)")
+    parser.add_argument("--accel", type=float, default=10_000_000, help="initial acceleration (steps/s^2)")
+    args = parser.parse_args()
+
+    table = VirtualTable(args.rate, args.speed, args.accel).start()
+    print(f"Virtual table on {table.port} ({args.rate:.0f} Hz). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+            print(f"pos={table.stepper.position:.0f} target={table.stepper.target} "
+                  f"cmds={table.commands_received} samples={table.samples_sent}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        table.stop()
+
+
+if __name__ == "__main__":
+    main()
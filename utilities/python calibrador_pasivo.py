@@ -2,6 +2,12 @@ import serial
 import time
 from collections import deque
 import threading
+import os
+import sys
+
+# la raiz del repo tiene el paquete shared/ con el perfil de calibracion
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.calibration import CalibrationProfile, PROFILE_PATH
 
 # --- CONFIGURACION ---
 SERIAL_PORT = 'COM4' 
@@ -175,4 +181,8 @@ if __name__ == "__main__":
         print("No se completo ninguna prueba.")
     else:
         for accel, speed in final_results.items():
-            print(f"Aceleracion: {accel:<8} -> Vel. Maxima Sostenible: {speed} Hz")
\ No newline at end of file
+            print(f"Aceleracion: {accel:<8} -> Vel. Maxima Sostenible: {speed} Hz")
+        # Guardar el perfil para que las apps ajusten las trayectorias a estos limites
+        profile = CalibrationProfile(final_results, STEPS_PER_REVOLUTION, source=SERIAL_PORT)
+        profile.save(PROFILE_PATH)
+        print(f"Perfil guardado en {PROFILE_PATH}")
\ No newline at end of file
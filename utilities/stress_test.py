@@ -1,9 +1,14 @@
+import os
+import sys
 import serial
 import time
 import math
 import threading
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.link_budget import LinkBudget, LinkBudgetError
+
 SERIAL_PORT = 'COM4' 
 BAUD_RATE = 115200
 
@@ -54,6 +59,16 @@ def main():
     print(f"Iniciando prueba de estrés a {COMMAND_FREQUENCY_HZ} Hz...")
     print(f"Puerto: {SERIAL_PORT}, Baud Rate: {BAUD_RATE}")
 
+    # comandos tipo "m-10\n": comprobar que el enlace los aguanta junto con el encoder
+    budget = LinkBudget(BAUD_RATE, command_rate_hz=COMMAND_FREQUENCY_HZ,
+                        bytes_per_command=len(f"m-{WAVE_AMPLITUDE_STEPS}\n"))
+    print(budget.report())
+    try:
+        budget.check()
+    except LinkBudgetError as e:
+        print(f"El enlace no aguanta esta prueba: {e}")
+        return
+
     try:
         ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         print("Puerto serial abierto. Esperando al ESP32 (3 segundos)...")